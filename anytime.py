@@ -0,0 +1,169 @@
+"""planning in a background process, so an expensive search never holds up
+the tick that asks for it. the snake sends its position as soon as it
+knows it, usually a few ticks before its next move, and the worker
+publishes better and better moves for it while it has time (see plan).
+when the move is due the snake takes the best one published so far,
+waiting at most PLAN_BUDGET seconds for more.
+
+    worker = PlannerProcess()
+    worker.request(body, apple, cols, rows, others)
+    ...
+    path = worker.result()   # None if nothing arrived in time
+    worker.stop()
+"""
+import multiprocessing
+
+import timing
+from planner import NOTHING, astar, advance, chaseTail, closestNeighbor, hasRoom, neighbors, tailInReach
+
+# seconds a due move waits for the planner before falling back
+PLAN_BUDGET = 0.002
+
+
+# the paths worth taking from this position (body is head first), each
+# better founded than the one before, so the longer the snake waits for
+# its move the better it gets:
+#   a step toward the apple
+#   the shortest path to the apple that leaves room after eating (see
+#   hasRoom), trying every first step, else a step chasing the tail
+#   a path after which the tail is still in reach, if that one was not
+# others are the tiles of the other snakes on the board
+def plan(body, apple, cols, rows, others=NOTHING):
+    head = body[0]
+    blocked = set(body)
+    blocked.update(others)
+    if apple:
+        step = closestNeighbor(head, apple, blocked, cols, rows)
+        if step:
+            yield [step]
+        path = safest(body, apple, blocked, cols, rows, lambda after: hasRoom(after, cols, rows, others=others))
+        if path:
+            yield path
+            if tailInReach(advance(body, path), cols, rows, others):
+                return
+            better = safest(body, apple, blocked, cols, rows, lambda after: tailInReach(after, cols, rows, others))
+            if better:
+                yield better
+            return
+    step = chaseTail(body, cols, rows, others=others)
+    if step:
+        yield [step]
+
+
+# the shortest path to apple that passes check once eaten: the A* path,
+# else the A* path after each of the other first steps
+def safest(body, apple, blocked, cols, rows, check):
+    head = body[0]
+    path = astar(head, apple, blocked, cols, rows)
+    if path is None:
+        return None
+    if check(advance(body, path)):
+        return path
+    best = None
+    for first in neighbors(head, cols, rows):
+        if first in blocked or first == path[0]:
+            continue
+        rest = astar(first, apple, blocked, cols, rows)
+        if rest is None:
+            continue
+        candidate = [first] + rest
+        if (best is None or len(candidate) < len(best)) and check(advance(body, candidate)):
+            best = candidate
+    return best
+
+
+# the newest message waiting on conn, a stop wins over everything
+def newest(conn, message):
+    while conn.poll():
+        message = conn.recv()
+        if message[0] == "stop":
+            break
+    return message
+
+
+# worker process main loop. answers every plan request with (seq, path,
+# done) messages and drops a request half way when a newer one comes in
+def serve(conn):
+    message = None
+    while True:
+        if message is None:
+            message = conn.recv()
+        message = newest(conn, message)
+        if message[0] == "stop":
+            break
+        kind, seq, body, apple, cols, rows, others = message
+        message = None
+        for path in plan(body, apple, cols, rows, others):
+            conn.send((seq, path, False))
+            if conn.poll():
+                break
+        else:
+            conn.send((seq, None, True))
+    conn.close()
+
+
+class PlannerProcess:
+    """the main process end of a planning worker. one request is in
+    flight at a time, a new request replaces the old one
+    """
+    def __init__(self, budget=PLAN_BUDGET):
+        self.budget = budget
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve, args=(child,))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.seq = 0
+        self.best = None
+        self.done = True
+        self.requests = 0
+        self.misses = 0
+
+    # others are the tiles of the other snakes, sent as a frozenset
+    def request(self, body, apple, cols, rows, others=NOTHING):
+        self.seq += 1
+        self.best = None
+        self.done = False
+        self.requests += 1
+        self.conn.send(("plan", self.seq, list(body), apple, cols, rows, frozenset(others)))
+
+    # read everything the worker has published so far
+    def receive(self):
+        while self.conn.poll():
+            self.take(self.conn.recv())
+
+    def take(self, message):
+        seq, path, done = message
+        if seq != self.seq:
+            return
+        if path is not None:
+            self.best = path
+        self.done = done
+
+    # the best path for the last request, waiting up to budget seconds
+    # for the worker to finish. None if nothing came in time
+    def result(self, budget=None):
+        if budget is None:
+            budget = self.budget
+        deadline = timing.monotonic() + budget
+        self.receive()
+        while not self.done:
+            remaining = deadline - timing.monotonic()
+            if remaining <= 0 or not self.conn.poll(remaining):
+                break
+            self.take(self.conn.recv())
+        if not self.done:
+            self.misses += 1
+        return self.best
+
+    def stop(self):
+        if not self.process.is_alive():
+            return
+        try:
+            self.conn.send(("stop",))
+        except (IOError, OSError):
+            pass
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
@@ -0,0 +1,117 @@
+"""many snake games stepped together with numpy. follows the same rules as
+sim.Simulation: the tail moves out before the head moves in, eating an
+apple grows the snake by one and reversing into yourself is ignored.
+
+cells are flat indices, y * cols + x
+"""
+import numpy
+
+from sim import DOWN, UP, LEFT, RIGHT
+
+# lookup tables indexed by direction, 0 means keep going
+DX = numpy.array([0, 0, 0, -1, 1])
+DY = numpy.array([0, 1, -1, 0, 0])
+OPPOSITE = numpy.array([0, UP, DOWN, RIGHT, LEFT])
+
+
+class BatchSimulation:
+    """n games of one snake and one apple. finished games are reset
+    automatically at the end of step()
+    """
+    def __init__(self, n, cols, rows, seed=None, length=3):
+        self.n = n
+        self.cols = cols
+        self.rows = rows
+        self.cells = cols * rows
+        self.length = length
+        self.random = numpy.random.RandomState(seed)
+
+        self.occupied = numpy.zeros((n, self.cells), dtype=bool)
+        # ring buffer of body cells, head at headIndex and tail at tailIndex
+        self.body = numpy.zeros((n, self.cells), dtype=numpy.int32)
+        self.headIndex = numpy.zeros(n, dtype=numpy.int64)
+        self.tailIndex = numpy.zeros(n, dtype=numpy.int64)
+        self.direction = numpy.zeros(n, dtype=numpy.int8)
+        self.apple = numpy.zeros(n, dtype=numpy.int64)
+        self.score = numpy.zeros(n, dtype=numpy.int32)
+        self.steps = numpy.zeros(n, dtype=numpy.int32)
+        # score of the games that finished on the last step
+        self.finalScore = numpy.zeros(n, dtype=numpy.int32)
+
+        self.allGames = numpy.arange(n)
+        self.reset(self.allGames)
+
+    def lengths(self):
+        return (self.headIndex - self.tailIndex) % self.cells + 1
+
+    def heads(self):
+        return self.body[self.allGames, self.headIndex]
+
+    def reset(self, games):
+        k = len(games)
+        if k == 0:
+            return
+        # placed vertically with the head on top, facing up
+        x = self.random.randint(0, self.cols, k)
+        y = self.random.randint(0, self.rows - self.length + 1, k)
+
+        self.occupied[games] = False
+        for i in range(self.length):
+            cells = (y + self.length - 1 - i) * self.cols + x
+            self.body[games, i] = cells
+            self.occupied[games, cells] = True
+        self.tailIndex[games] = 0
+        self.headIndex[games] = self.length - 1
+        self.direction[games] = UP
+        self.score[games] = 0
+        self.steps[games] = 0
+        self.placeApples(games)
+
+    def placeApples(self, games):
+        # uniform over the free cells: the highest random key wins
+        keys = self.random.random_sample((len(games), self.cells))
+        keys[self.occupied[games]] = -1
+        self.apple[games] = keys.argmax(axis=1)
+
+    # actions holds one direction per game, 0 to keep going
+    # returns (rewards, dones): +1 for an apple, -1 for dying
+    def step(self, actions):
+        actions = numpy.asarray(actions)
+        turn = (actions != 0) & (actions != OPPOSITE[self.direction])
+        self.direction[turn] = actions[turn]
+
+        games = self.allGames
+        head = self.body[games, self.headIndex]
+        x = head % self.cols + DX[self.direction]
+        y = head // self.cols + DY[self.direction]
+        outside = (x < 0) | (x >= self.cols) | (y < 0) | (y >= self.rows)
+        newHead = numpy.where(outside, 0, y * self.cols + x)
+        eating = ~outside & (newHead == self.apple)
+
+        # the tail moves out of the way before the head moves in
+        moving = ~eating
+        tails = self.body[games[moving], self.tailIndex[moving]]
+        self.occupied[games[moving], tails] = False
+        self.tailIndex[moving] = (self.tailIndex[moving] + 1) % self.cells
+
+        dead = outside | self.occupied[games, newHead]
+        alive = ~dead
+        self.headIndex[alive] = (self.headIndex[alive] + 1) % self.cells
+        self.body[games[alive], self.headIndex[alive]] = newHead[alive]
+        self.occupied[games[alive], newHead[alive]] = True
+        self.steps += 1
+
+        rewards = numpy.zeros(self.n, dtype=numpy.float32)
+        rewards[eating] = 1
+        rewards[dead] = -1
+        self.score[eating] += 1
+
+        # a snake covering the whole board has won
+        full = eating & (self.lengths() == self.cells)
+        self.placeApples(games[eating & ~full])
+
+        dones = dead | full
+        finished = games[dones]
+        self.finalScore[finished] = self.score[finished]
+        self.reset(finished)
+        return rewards, dones
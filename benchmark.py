@@ -0,0 +1,614 @@
+"""benchmarks for the snake AI, the game objects and drawing, headless
+with fixed seeds. run with: python benchmark.py
+
+    python benchmark.py --json base.json           # save the results
+    python benchmark.py --compare base.json        # flag regressions
+"""
+import json
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+
+import hamilton
+import planner
+import sim
+
+BOARD_SIZES = [25, 100, 500]
+SNAKE_LENGTH = 50
+RUNS = 20
+STEPS = 100000
+RENDER_LENGTHS = [10, 100, 1000]
+AUTOSNAKE_LENGTHS = [10, 100, 1000]
+MOVE_LENGTHS = [10, 1000, 10000]
+LISTENERS = [1, 10, 100, 1000]
+# a result this much worse than the baseline is a regression
+TOLERANCE = 0.2
+# passes over the whole suite, keeping the best value of each result
+REPEAT = 3
+
+
+# a snake body lying in a random walk from the head, returned head first
+def randomBody(cols, rows, length, rng):
+    body = [(rng.randrange(cols), rng.randrange(rows))]
+    occupied = set(body)
+    while len(body) < length:
+        free = [tile for tile in planner.neighbors(body[-1], cols, rows) if tile not in occupied]
+        if not free:
+            break
+        body.append(rng.choice(free))
+        occupied.add(body[-1])
+    return body
+
+
+def benchReplan(size, runs=RUNS, seed=0):
+    rng = random.Random(seed)
+    times = []
+    for i in range(runs):
+        body = randomBody(size, size, SNAKE_LENGTH, rng)
+        blocked = set(body[1:])
+        apple = (rng.randrange(size), rng.randrange(size))
+        while apple in blocked:
+            apple = (rng.randrange(size), rng.randrange(size))
+
+        start = time.time()
+        planner.astar(body[0], apple, blocked, size, size)
+        times.append(time.time() - start)
+    return times
+
+
+# D* Lite: a full search to the apple, then the mean repair after each of
+# the moves toward it
+def benchRepair(size, runs=RUNS, moves=20, seed=0):
+    rng = random.Random(seed)
+    builds = []
+    repairs = []
+    for i in range(runs):
+        body = randomBody(size, size, SNAKE_LENGTH, rng)
+        blocked = set(body)
+        apple = (rng.randrange(size), rng.randrange(size))
+        while apple in blocked:
+            apple = (rng.randrange(size), rng.randrange(size))
+
+        start = time.time()
+        search = planner.DStarLite(body[0], apple, blocked, size, size)
+        builds.append(time.time() - start)
+        for j in range(moves):
+            if not search.reachable() or search.start == apple:
+                break
+            head = search.nextTile()
+            tail = body.pop()
+            body.insert(0, head)
+            blocked.discard(tail)
+            blocked.add(head)
+            start = time.time()
+            search.move(head, [head, tail])
+            repairs.append(time.time() - start)
+    return builds, repairs
+
+
+# head for the apple, x first then y
+def towardApple(game):
+    head = game.head()
+    if game.apple[0] > head[0]:
+        return sim.RIGHT
+    elif game.apple[0] < head[0]:
+        return sim.LEFT
+    elif game.apple[1] > head[1]:
+        return sim.DOWN
+    return sim.UP
+
+
+# moves per second of the headless engine
+def benchSimulation(steps=STEPS, seed=0, strategy=towardApple):
+    game = sim.Simulation(25, 25, seed)
+    start = time.time()
+    for i in xrange(steps):
+        if game.step(strategy(game)) == sim.Simulation.DIED or game.apple is None:
+            game.reset()
+    return steps / (time.time() - start)
+
+
+# ms per tick of snakes greedy snakes sharing a size x size arena, steering
+# included. each snake goes for an apple it picked until someone eats it
+def benchArena(snakes=500, size=500, ticks=200, seed=0):
+    rng = random.Random(seed)
+    arena = sim.Arena(size, size, seed, apples=snakes)
+    targets = {}
+    start = time.time()
+    for i in xrange(ticks):
+        while len(arena.snakes) < snakes and arena.addSnake():
+            pass
+        for snake in arena.snakes.values():
+            target = targets.get(snake.id)
+            if target not in arena.apples:
+                target = targets[snake.id] = rng.choice(list(arena.apples))
+            head = snake.head()
+            step = planner.closestNeighbor(head, target, arena.owner, size, size)
+            if step:
+                arena.steer(snake.id, planner.direction(head, step))
+        arena.step()
+        arena.flush()
+    return 1000 * (time.time() - start) / ticks
+
+
+# moves per second of n games stepped together with random actions
+def benchBatch(n=4096, steps=200, seed=0):
+    import numpy
+    import batch
+    games = batch.BatchSimulation(n, 25, 25, seed)
+    actions = numpy.random.RandomState(seed).randint(0, 5, (steps, n))
+    start = time.time()
+    for i in xrange(steps):
+        games.step(actions[i])
+    return n * steps / (time.time() - start)
+
+
+# microseconds per clone and per apply + undo pair of a packed state
+def benchState(n=STEPS, seed=0):
+    import state
+    game = state.GameState.fromSimulation(sim.Simulation(25, 25, seed), seed + 1)
+    start = time.time()
+    for i in xrange(n):
+        game.clone()
+    clone = (time.time() - start) / n
+    start = time.time()
+    for i in xrange(n):
+        game.apply(sim.LEFT if i % 2 else sim.UP)
+        game.undo()
+    return clone * 1e6, (time.time() - start) / n * 1e6
+
+
+# ms per AutoSnake.dijkstra and per AutoSnake.greedy call toward a random
+# apple, by board size and snake length
+def benchAutoSnake(sizes=BOARD_SIZES, lengths=AUTOSNAKE_LENGTHS, runs=RUNS, seed=0):
+    import snake
+    rng = random.Random(seed)
+    boardSize = snake.COLUMNS, snake.ROWS
+    results = []
+    try:
+        for size in sizes:
+            snake.COLUMNS = snake.ROWS = size
+            for length in lengths:
+                # a random walk this long would not fit
+                if 4 * length > size * size:
+                    continue
+                dijkstra = greedy = 0.0
+                for i in range(runs):
+                    body = randomBody(size, size, length, rng)
+                    apple = (rng.randrange(size), rng.randrange(size))
+                    while apple in body:
+                        apple = (rng.randrange(size), rng.randrange(size))
+                    auto = snake.AutoSnake(snake.EventManager(), snake.AutoSnake.MODE_PATH)
+                    auto.place(body)
+                    start = time.time()
+                    auto.dijkstra(apple)
+                    dijkstra += time.time() - start
+                    start = time.time()
+                    auto.greedy(apple)
+                    greedy += time.time() - start
+                results.append((size, length, dijkstra / runs, greedy / runs))
+        return results
+    finally:
+        snake.COLUMNS, snake.ROWS = boardSize
+
+
+# us per Snake.move and per move plus extend, for snakes up to 10k long
+# crawling along a one tile high board
+def benchSnakeMove(lengths=MOVE_LENGTHS, moves=2000):
+    import snake
+    boardSize = snake.COLUMNS, snake.ROWS
+    results = []
+    try:
+        for length in lengths:
+            snake.COLUMNS, snake.ROWS = 2 * moves + length, 1
+            body = snake.Snake(snake.EventManager())
+            body.place([(2 * moves + i, 0) for i in range(length)])
+            body.direction = sim.LEFT
+            start = time.time()
+            for i in xrange(moves):
+                body.move()
+            move = (time.time() - start) / moves
+            start = time.time()
+            for i in xrange(moves):
+                body.move()
+                body.extend()
+            extend = (time.time() - start) / moves
+            results.append((length, move * 1e6, extend * 1e6))
+        return results
+    finally:
+        snake.COLUMNS, snake.ROWS = boardSize
+
+
+# us per EventManager.post of a TickEvent with n handlers subscribed to it
+def benchDispatch(listeners=LISTENERS, posts=2000, deferred=False):
+    import snake
+
+    class Listener:
+        def __init__(self, evManager):
+            evManager.subscribe(snake.TickEvent, self.onTick)
+            self.ticks = 0
+
+        def onTick(self, event):
+            self.ticks += 1
+
+    results = []
+    for n in listeners:
+        evManager = snake.EventManager(deferred)
+        keep = [Listener(evManager) for i in range(n)]
+        event = snake.TickEvent()
+        start = time.time()
+        for i in xrange(posts):
+            evManager.post(event)
+        results.append((n, (time.time() - start) / posts * 1e6))
+    return results
+
+
+# moves per second of the event driven game drawn by the View, one frame
+# per tick
+def benchEventLoop(moves=STEPS / 10, seed=0):
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import snake
+    random.seed(seed)
+
+    evManager = snake.EventManager()
+    view = snake.View(evManager)
+    game = snake.Game(evManager)
+    counted = [0]
+    def countMove(event):
+        counted[0] += 1
+    evManager.subscribe(snake.MoveEvent, countMove)
+
+    tick = snake.TickEvent()
+    frame = snake.FrameEvent()
+    start = time.time()
+    while counted[0] < moves:
+        if game.state == snake.Game.STATE_PREPARING:
+            evManager.post(snake.AddComputerRequest())
+            evManager.post(snake.GameStartRequest())
+        evManager.post(tick)
+        evManager.post(frame)
+    return moves / (time.time() - start)
+
+
+# ms per tick of the event driven game without a View, that many computer
+# snakes following the hamiltonian cycle on one size x size board
+def benchManySnakes(snakes=200, size=100, ticks=2000, seed=0):
+    import snake
+    random.seed(seed)
+    boardSize = snake.COLUMNS, snake.ROWS
+    snake.COLUMNS = snake.ROWS = size
+    try:
+        evManager = snake.EventManager(deferred=True)
+        game = snake.Game(evManager, apples=snakes / 4, mode=snake.AutoSnake.MODE_CYCLE)
+        for i in range(snakes):
+            game.addComputer()
+        evManager.post(snake.GameStartRequest())
+        tick = snake.TickEvent()
+        start = time.time()
+        for i in xrange(ticks):
+            evManager.post(tick)
+        return 1000 * (time.time() - start) / ticks
+    finally:
+        snake.COLUMNS, snake.ROWS = boardSize
+
+
+# (ms to start, mean and worst ms per tick) of the event driven game
+# without a View, that many space mode computer snakes and apples on one
+# size x size board. unlike benchArena every snake plans as in the game
+def benchGameSnakes(snakes=500, size=500, apples=50, ticks=200, seed=0, mode=None):
+    import snake
+    random.seed(seed)
+    boardSize = snake.COLUMNS, snake.ROWS
+    snake.COLUMNS = snake.ROWS = size
+    try:
+        evManager = snake.EventManager(deferred=True)
+        game = snake.Game(evManager, apples=apples, mode=mode or snake.AutoSnake.MODE_SPACE)
+        for i in range(snakes):
+            game.addComputer()
+        start = time.time()
+        evManager.post(snake.GameStartRequest())
+        startup = 1000 * (time.time() - start)
+        tick = snake.TickEvent()
+        worst = 0.0
+        start = time.time()
+        for i in xrange(ticks):
+            begun = time.time()
+            evManager.post(tick)
+            worst = max(worst, time.time() - begun)
+        return startup, 1000 * (time.time() - start) / ticks, 1000 * worst
+    finally:
+        snake.COLUMNS, snake.ROWS = boardSize
+
+
+# moves per second of a computer snake game with no window, recording the
+# tile observation of every move and, with pixels set, copying out the
+# offscreen drawn board too
+def benchFrames(pixels=False, moves=2000, seed=0):
+    import frames
+    start = time.time()
+    for i, (game, observation, direction, frame) in enumerate(frames.play(100, seed=seed, pixels=pixels)):
+        if i + 1 == moves:
+            break
+    return moves / (time.time() - start)
+
+
+class PathSnake:
+    """stand in for a Snake that slides along a fixed path of tiles"""
+    def __init__(self, path, length):
+        from collections import deque
+        self.path = path
+        self.index = length
+        self.snakeList = deque(reversed(path[:length]))
+        self.lastTail = None
+
+    def advance(self):
+        self.snakeList.appendleft(self.path[self.index])
+        self.lastTail = self.snakeList.pop()
+        self.index += 1
+
+
+# mean ms per moved and drawn frame: the View's incremental tile drawing
+# against rebuilding a sprite per segment on every move, as it used to
+def benchRender(lengths=RENDER_LENGTHS, moves=200):
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    import snake
+
+    # 10 pixel tiles so a 1000 long snake fits in the window
+    tileSize = snake.TILE_WIDTH, snake.TILE_HEIGHT
+    boardSize = snake.COLUMNS, snake.ROWS
+    snake.TILE_WIDTH = snake.TILE_HEIGHT = 10
+    cols = snake.COLUMNS = snake.SCREEN_WIDTH / snake.TILE_WIDTH
+    rows = snake.ROWS = snake.SCREEN_HEIGHT / snake.TILE_HEIGHT
+    try:
+        view = snake.View(snake.EventManager())
+        path = [(x if y % 2 == 0 else cols - 1 - x, y) for y in range(rows) for x in range(cols)]
+
+        class LegacySprite(pygame.sprite.Sprite):
+            def __init__(self, group):
+                pygame.sprite.Sprite.__init__(self, group)
+                surface = pygame.Surface((snake.TILE_WIDTH, snake.TILE_HEIGHT)).convert_alpha()
+                surface.fill((255,255,255))
+                pygame.draw.rect(surface, (0,0,0), surface.get_rect(), 1)
+                self.image = surface
+                self.rect = surface.get_rect()
+
+        results = []
+        for length in lengths:
+            view.clearScreen()
+            body = PathSnake(path, length)
+            view.showSnake(body)
+            view.onFrame(None)
+            start = time.time()
+            for i in range(moves):
+                body.advance()
+                view.moveSnake(body)
+                view.onFrame(None)
+            incremental = (time.time() - start) / moves
+
+            view.clearScreen()
+            body = PathSnake(path, length)
+            sprites = pygame.sprite.RenderUpdates()
+            start = time.time()
+            for i in range(moves):
+                body.advance()
+                sprites.empty()
+                for (x, y) in body.snakeList:
+                    LegacySprite(sprites).rect.topleft = (x * snake.TILE_WIDTH, y * snake.TILE_HEIGHT)
+                sprites.clear(view.window, view.background)
+                pygame.display.update(sprites.draw(view.window))
+            legacy = (time.time() - start) / moves
+            results.append((length, incremental, legacy))
+        return results
+    finally:
+        snake.TILE_WIDTH, snake.TILE_HEIGHT = tileSize
+        snake.COLUMNS, snake.ROWS = boardSize
+
+
+# mean ms per move and drawn frame with the camera following a snake of
+# length 100 through a board where 500 more snakes lie, with the minimap on
+def benchViewport(sizes=BOARD_SIZES + [2000], moves=1000, others=500, seed=0):
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import snake
+
+    class BoardGame:
+        state = snake.Game.STATE_RUNNING
+        apples = []
+        players = []
+
+        def __init__(self, board):
+            self.board = board
+
+    saved = snake.COLUMNS, snake.ROWS, snake.MINIMAP_SIZE
+    snake.MINIMAP_SIZE = 150
+    rng = random.Random(seed)
+    results = []
+    try:
+        for size in sizes:
+            snake.COLUMNS = snake.ROWS = size
+            view = snake.View(snake.EventManager())
+            board = {}
+            for i in range(others):
+                for tile in randomBody(size, size, 10, rng):
+                    board[tile] = i
+            # along the middle row and back on the one below
+            path = [(x, size / 2) for x in range(size)] + [(x, size / 2 + 1) for x in range(size - 1, -1, -1)]
+            path = path * (moves / len(path) + 2)
+            body = PathSnake(path, 100)
+            view.game = BoardGame(board)
+            view.followSnake(body, centre=True)
+            view.onFrame(None)
+            start = time.time()
+            for i in range(moves):
+                board.pop(body.snakeList[-1], None)
+                body.advance()
+                board[body.snakeList[0]] = body
+                if not view.followSnake(body):
+                    view.moveSnake(body)
+                view.onFrame(None)
+            results.append((size, (time.time() - start) / moves))
+        return results
+    finally:
+        snake.COLUMNS, snake.ROWS, snake.MINIMAP_SIZE = saved
+
+
+class Results:
+    """benchmark results in the order they were first taken, each a value
+    and its unit. units ending in /s are rates where higher is better, for
+    the rest lower is better. taking a result again keeps the better one
+    """
+    def __init__(self):
+        self.values = OrderedDict()
+        # section titles and result names in order, for report()
+        self.lines = []
+
+    def section(self, title):
+        if title not in self.lines:
+            self.lines.append(title)
+
+    def add(self, name, value, unit):
+        old = self.values.get(name)
+        if old is None:
+            self.values[name] = {"value": value, "unit": unit}
+            self.lines.append(name)
+        elif value > old["value"] if unit.endswith("/s") else value < old["value"]:
+            old["value"] = value
+
+    def report(self):
+        lines = []
+        for line in self.lines:
+            result = self.values.get(line)
+            if result is None:
+                lines.append(line)
+            else:
+                lines.append("  %-44s %12.3f %s" % (line, result["value"], result["unit"]))
+        return "\n".join(lines)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": self.values}, f, indent=1)
+
+
+def loadResults(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+# results that got worse than the baseline by more than tolerance, as
+# (name, baseline value, value, change) with change relative to the
+# baseline, positive for worse. timings drift on a busy machine, compare
+# runs taken on a quiet one
+def regressions(results, baseline, tolerance=TOLERANCE):
+    worse = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old or not old["value"]:
+            continue
+        change = (result["value"] - old["value"]) / float(old["value"])
+        if result["unit"].endswith("/s"):
+            change = -change
+        if change > tolerance:
+            worse.append((name, old["value"], result["value"], change))
+    return worse
+
+
+def run(results):
+    results.section("A* replan latency (%d runs, snake length %d)" % (RUNS, SNAKE_LENGTH))
+    for size in BOARD_SIZES:
+        times = benchReplan(size)
+        results.add("replan %dx%d mean" % (size, size), 1000 * sum(times) / len(times), "ms")
+        results.add("replan %dx%d max" % (size, size), 1000 * max(times), "ms")
+
+    results.section("D* Lite search and repair per move")
+    for size in BOARD_SIZES[:2]:
+        builds, repairs = benchRepair(size)
+        results.add("dstar %dx%d search" % (size, size), 1000 * sum(builds) / len(builds), "ms")
+        results.add("dstar %dx%d repair" % (size, size), 1000 * sum(repairs) / len(repairs), "ms")
+
+    results.section("AutoSnake planning per call (%d runs)" % RUNS)
+    for size, length, dijkstra, greedy in benchAutoSnake():
+        results.add("dijkstra %dx%d length %d" % (size, size, length), 1000 * dijkstra, "ms")
+        results.add("greedy %dx%d length %d" % (size, size, length), 1000 * greedy, "ms")
+
+    results.section("Snake.move and extend")
+    for length, move, extend in benchSnakeMove():
+        results.add("move length %d" % length, move, "us")
+        results.add("move + extend length %d" % length, extend, "us")
+
+    results.section("EventManager.post to n handlers")
+    for deferred in (False, True):
+        for n, post in benchDispatch(deferred=deferred):
+            results.add("post %s %d handlers" % ("deferred" if deferred else "direct", n), post, "us")
+
+    results.section("moves per second on 25x25")
+    results.add("headless engine", benchSimulation(), "moves/s")
+    results.add("hamiltonian cycle", benchSimulation(strategy=hamilton.CycleFollower()), "moves/s")
+    try:
+        results.add("numpy batch", benchBatch(), "moves/s")
+    except ImportError:
+        # numpy is optional
+        pass
+    results.add("pygame event loop, no tick delay", benchEventLoop(), "moves/s")
+
+    try:
+        results.add("offscreen observations", benchFrames(), "moves/s")
+        results.add("offscreen observations and frames", benchFrames(pixels=True), "moves/s")
+    except ImportError:
+        pass
+
+    results.section("many snakes and search states")
+    results.add("500 greedy snakes on 500x500", benchArena(), "ms/tick")
+    results.add("200 cycle snakes on 100x100, event loop", benchManySnakes(), "ms/tick")
+    startup, mean, worst = benchGameSnakes()
+    results.add("500 space snakes on 500x500, 50 apples, start", startup, "ms")
+    results.add("500 space snakes on 500x500, 50 apples", mean, "ms/tick")
+    results.add("500 space snakes on 500x500, 50 apples, worst", worst, "ms/tick")
+    clone, apply = benchState()
+    results.add("search state clone", clone, "us")
+    results.add("search state apply + undo", apply, "us")
+
+    results.section("frame time for a moving snake")
+    for length, incremental, legacy in benchRender():
+        results.add("render length %d incremental" % length, 1000 * incremental, "ms")
+        results.add("render length %d sprite rebuild" % length, 1000 * legacy, "ms")
+
+    results.section("frame time following a snake, with minimap")
+    for size, frame in benchViewport():
+        results.add("viewport %dx%d" % (size, size), 1000 * frame, "ms")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="benchmark the snake planners, game objects and drawing")
+    parser.add_argument("--json", metavar="PATH", help="write the results to PATH")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare with results saved by --json, exit status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="how much worse than the baseline is a regression (default %(default)s)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="passes over the suite, the best of each result counts (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    # headless, no window opens
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    results = Results()
+    for i in range(args.repeat):
+        sys.stderr.write("pass %d of %d\n" % (i + 1, args.repeat))
+        run(results)
+    print results.report()
+    if args.json:
+        results.save(args.json)
+
+    if args.compare:
+        worse = regressions(results.values, loadResults(args.compare), args.tolerance)
+        print "%d regressions against %s (tolerance %d%%)" % (len(worse), args.compare, 100 * args.tolerance)
+        for name, old, new, change in worse:
+            print "  %-44s %12.3f -> %12.3f  %+.0f%%" % (name, old, new, 100 * change)
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,122 @@
-
-class Event:
+class Event(object):
     """this is a superclass for any events that might be generated by an
-    object and sent to the EventManager
+    object and sent to the EventManager.
+
+    events have slots and no __dict__, and the name is shared by the class.
+    the loop posts the same TickEvent, FrameEvent and InputEvent every time and a snake
+    the same MoveEvent, so handlers must not keep events around or change
+    them
     """
-    def __init__(self):
-        self.name = "Generic Event"
+    __slots__ = ()
+    name = "Generic Event"
 
 class TickEvent(Event):
-    def __init__(self):
-        self.name = "CPU Event"
+    __slots__ = ()
+    name = "CPU Event"
+
+class FrameEvent(Event):
+    __slots__ = ()
+    name = "Frame Event"
+
+class InputEvent(Event):
+    __slots__ = ()
+    name = "Input Event"
 
 class QuitEvent(Event):
-    def __init__(self):
-        self.name = "Quit Event"
+    __slots__ = ()
+    name = "Quit Event"
 
 class RestartEvent(Event):
-    def __init__(self):
-        self.name = "Restart Event"
+    __slots__ = ()
+    name = "Restart Event"
 
 class MoveRequest(Event):
-    def __init__(self, direction):
-        self.name = "Move request"
+    __slots__ = ("direction", "player", "time")
+    name = "Move request"
+
+    # time is the timing.monotonic() the key was seen at, if it was a key
+    def __init__(self, direction, player=0, time=None):
         self.direction = direction
+        self.player = player
+        self.time = time
 
 class MoveEvent(Event):
+    __slots__ = ("snake",)
+    name = "Move event"
+
     def __init__(self, snake):
-        self.name = "Move event"
         self.snake = snake
 
 class MapBuiltEvent(Event):
+    __slots__ = ("map",)
+    name = "Map Built"
+
     def __init__(self, gameMap):
-        self.name = "Map Built"
         self.map = gameMap
 
 class GameStartRequest(Event):
-    def __init__(self):
-        self.name = "Game start request"
+    __slots__ = ()
+    name = "Game start request"
 
 class GameStartedEvent(Event):
+    __slots__ = ("game",)
+    name = "Game Started"
+
     def __init__(self, game):
-        self.name = "Game Started"
         self.game = game
 
 class MenuDisplayRequest(Event):
-    def __init__(self):
-        self.name = "Menu display request"
+    __slots__ = ()
+    name = "Menu display request"
 
 class ApplePlaceEvent(Event):
+    __slots__ = ("apple",)
+    name = "Apple placed"
+
     def __init__(self, apple):
-        self.name = "Apple placed"
         self.apple = apple
 
 class AppleEatenEvent(Event):
-    def __init__(self):
-        self.name = "Apple eaten"
+    __slots__ = ("apple",)
+    name = "Apple eaten"
+
+    def __init__(self, apple):
+        self.apple = apple
 
 class ExtendEvent(Event):
+    __slots__ = ("snake",)
+    name = "Extend Event"
+
     def __init__(self, snake):
-        self.name = "Extend Event"
         self.snake = snake
 
 class SnakePlaceEvent(Event):
+    __slots__ = ("snake",)
+    name = "Snake placed"
+
     def __init__(self, snake):
-        self.name = "Snake placed"
         self.snake = snake
 
+class SnakeDiedEvent(Event):
+    __slots__ = ("snake", "body")
+    name = "Snake died"
+
+    def __init__(self, snake):
+        self.snake = snake
+        self.body = list(snake.snakeList)
+
 class GameOverEvent(Event):
-    def __init__(self):
-        self.name = "Game over"
+    __slots__ = ()
+    name = "Game over"
 
 class AddPlayerRequest(Event):
-    def __init__(self):
-        self.name = "Add player request"
+    __slots__ = ()
+    name = "Add player request"
 
 class AddComputerRequest(Event):
-    def __init__(self):
-        self.name = "Add computer request"
\ No newline at end of file
+    __slots__ = ()
+    name = "Add computer request"
+
+class ProfileDumpRequest(Event):
+    __slots__ = ()
+    name = "Profile dump request"
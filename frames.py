@@ -0,0 +1,229 @@
+"""game state and frames as numpy arrays, for datasets and debugging.
+
+observe() encodes a board one pixel per tile straight from the game state,
+nothing is drawn. View(evManager, offscreen=True) draws into a plain
+surface instead of the window, and View.frame() is a view of its pixels.
+VideoWriter pipes frames to ffmpeg.
+
+    python frames.py games.npz -n 10                   # observations and moves
+    python frames.py games.npz --pixels --video games.mp4   # and games-frames.npy
+
+--pixels keeps one pixel from the middle of every drawn tile, the size of
+the observations. --full-frames keeps every pixel, 750 KB a move on the
+default 25x25 board, so a game of a few thousand moves writes gigabytes
+
+rows of the arrays are y, columns x, and the channels are:
+
+    0 body, 255 for the observed snake and 128 for the others
+    1 heads of the live snakes
+    2 apples
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy
+
+BODY = 0
+HEAD = 1
+APPLE = 2
+OWN = 255
+OTHER = 128
+
+
+def blank(cols, rows, out=None):
+    if out is None:
+        return numpy.zeros((rows, cols, 3), dtype=numpy.uint8)
+    out.fill(0)
+    return out
+
+
+# the board of a snake.Game, seen by snake when one is given. costs one
+# write per snake tile, not per board tile, apart from clearing out
+def observe(game, snake=None, out=None):
+    out = blank(game.free.cols, game.free.rows, out)
+    if game.board:
+        tiles = numpy.array(game.board.keys())
+        owners = game.board.values()
+        out[tiles[:, 1], tiles[:, 0], BODY] = [OWN if owner is snake else OTHER for owner in owners] if snake is not None else OWN
+    for other in game.snakes():
+        if other.state == other.STATE_ACTIVE and not other.dead and other.snakeList:
+            x, y = other.snakeList[0]
+            out[y, x, HEAD] = 255
+    for apple in game.apples:
+        if apple.state == apple.STATE_ACTIVE:
+            out[apple.y, apple.x, APPLE] = 255
+    return out
+
+
+# the same for a sim.Simulation
+def observeSimulation(sim, out=None):
+    out = blank(sim.cols, sim.rows, out)
+    if sim.body:
+        tiles = numpy.array(sim.body)
+        out[tiles[:, 1], tiles[:, 0], BODY] = OWN
+        x, y = sim.body[0]
+        out[y, x, HEAD] = 255
+    if sim.apple is not None:
+        x, y = sim.apple
+        out[y, x, APPLE] = 255
+    return out
+
+
+class VideoWriter:
+    """frames of size (width, height) encoded by an ffmpeg process, which
+    must be on the path. write() takes rows x columns x RGB uint8 arrays,
+    View.frame() or observe() output, views included
+    """
+    def __init__(self, path, size, fps=15, ffmpeg="ffmpeg"):
+        self.path = path
+        self.size = size
+        command = [ffmpeg, "-loglevel", "error", "-y",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "%dx%d" % size, "-r", str(fps), "-i", "-",
+                   "-pix_fmt", "yuv420p", path]
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except OSError as e:
+            raise IOError("cannot run %s to write %s: %s" % (ffmpeg, path, e))
+        self.frames = 0
+
+    def write(self, frame):
+        self.process.stdin.write(numpy.ascontiguousarray(frame).tostring())
+        self.frames += 1
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise IOError("ffmpeg failed writing %s" % self.path)
+
+
+class FrameFile:
+    """frames of one shape written to an .npy file as they come, so they
+    never have to fit in memory. they go to a temporary file first, the
+    header needs the count
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+        self.shape = None
+        self.frames = 0
+
+    def write(self, frame):
+        self.shape = frame.shape
+        self.data.write(numpy.ascontiguousarray(frame, dtype=numpy.uint8).tostring())
+        self.frames += 1
+
+    def close(self):
+        header = {"descr": "|u1", "fortran_order": False, "shape": (self.frames,) + (self.shape or ())}
+        self.data.seek(0)
+        with open(self.path, "wb") as f:
+            numpy.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(self.data, f, 1 << 20)
+        self.data.close()
+
+
+# one pixel from the middle of every tile of a View.frame(), a view
+def tilePixels(frame, tileWidth, tileHeight):
+    return frame[tileHeight / 2::tileHeight, tileWidth / 2::tileWidth]
+
+
+# plays games of one computer snake through the event driven game with no
+# window, as fast as it goes. yields (game number, observation, direction
+# moved, frame) for every move, observation and frame as they were before
+# it. frame is None unless pixels is set. the arrays are reused: copy
+# what is kept
+def play(games=1, cols=25, rows=25, seed=0, mode=None, pixels=False, maxSteps=None):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import random
+    import snake
+
+    random.seed(seed)
+    boardSize = snake.COLUMNS, snake.ROWS
+    snake.COLUMNS, snake.ROWS = cols, rows
+    try:
+        evManager = snake.EventManager()
+        view = snake.View(evManager, offscreen=True) if pixels else None
+        game = snake.Game(evManager, mode=mode)
+        maxSteps = maxSteps or 20 * cols * rows
+        tick = snake.TickEvent()
+        observation = blank(cols, rows)
+        frame = numpy.array(view.frame()) if view else None
+        for i in xrange(games):
+            game.addComputer()
+            auto = game.computers[-1].snake[0]
+            evManager.post(snake.GameStartRequest())
+            while game.state == snake.Game.STATE_RUNNING:
+                observe(game, auto, observation)
+                if view is not None:
+                    # the tiles are drawn as the events come, no FrameEvent
+                    # needed. the view is let go at once, it locks the surface
+                    frame[...] = view.frame()
+                steps = auto.steps
+                while auto.steps == steps and auto.state == snake.Snake.STATE_ACTIVE:
+                    evManager.post(tick)
+                if auto.steps == steps:
+                    # trapped, died without moving
+                    break
+                yield i, observation, auto.direction, frame
+                if auto.steps >= maxSteps and game.state == snake.Game.STATE_RUNNING:
+                    evManager.post(snake.GameOverEvent())
+    finally:
+        snake.COLUMNS, snake.ROWS = boardSize
+
+
+def main(argv=None):
+    import argparse
+    import snake
+    parser = argparse.ArgumentParser(description="record computer snake games as numpy arrays")
+    parser.add_argument("path", help="write the arrays here, as .npz")
+    parser.add_argument("-n", "--games", type=int, default=1)
+    parser.add_argument("--size", default="25x25", help="board size in tiles, COLSxROWS (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", help="computer snake strategy (default snake.AUTOPILOT)")
+    parser.add_argument("--pixels", action="store_true", help="keep the drawn board of every move too, one pixel per tile, in PATH-frames.npy")
+    parser.add_argument("--full-frames", action="store_true", help="with --pixels, keep every pixel drawn")
+    parser.add_argument("--video", metavar="PATH", help="encode the drawn board of every move with ffmpeg")
+    parser.add_argument("--fps", type=int, default=15)
+    args = parser.parse_args(argv)
+    try:
+        cols, rows = [int(n) for n in args.size.lower().split("x")]
+    except ValueError:
+        parser.error("--size takes COLSxROWS, e.g. 50x50")
+    pixels = args.pixels or args.video
+
+    games = []
+    observations = []
+    directions = []
+    frames = None
+    video = None
+    if args.pixels:
+        frames = FrameFile(os.path.splitext(args.path)[0] + "-frames.npy")
+    try:
+        for game, observation, direction, frame in play(args.games, cols, rows, args.seed, args.mode, pixels):
+            games.append(game)
+            observations.append(observation.copy())
+            directions.append(direction)
+            if frames is not None:
+                frames.write(frame if args.full_frames else tilePixels(frame, snake.TILE_WIDTH, snake.TILE_HEIGHT))
+            if args.video:
+                if video is None:
+                    video = VideoWriter(args.video, (frame.shape[1], frame.shape[0]), args.fps)
+                video.write(frame)
+    finally:
+        if video is not None:
+            video.close()
+        if frames is not None:
+            frames.close()
+
+    arrays = {
+        "games": numpy.array(games, dtype=numpy.int32),
+        "observations": numpy.array(observations),
+        "directions": numpy.array(directions, dtype=numpy.uint8),
+    }
+    numpy.savez_compressed(args.path, **arrays)
+    print "%d moves written to %s" % (len(directions), args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""hamiltonian cycle autopilot. a snake that follows a cycle through every
+tile of the board can never trap itself and eventually fills the board.
+it also takes shortcuts toward the apple as long as the cycle order shows
+they cannot run into the body.
+
+there is no such cycle when both sides of the board are odd, e.g. 25x25.
+then the cycle leaves out the bottom right corner (the spare) and the tile
+diagonally next to it (the twin) stands in for it: the cycle goes
+... -> (cols-1, rows-2) -> twin -> (cols-2, rows-1) -> ... and both of
+those tiles are next to the spare too, so the snake walks through the
+spare instead of the twin on a lap where the apple is there. spare and
+twin share one position in the cycle order.
+
+cycles are built once per board size and kept in CACHE_DIR
+"""
+import os
+from array import array
+
+from planner import neighbors, direction
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".snake")
+# shortcuts stop once the snake covers this much of the board, and have
+# to leave this many free tiles before the tail
+SHORTCUT_LENGTH = 0.5
+SHORTCUT_MARGIN = 3
+
+
+# rows must be even: right along row 0, left along row 1 and so on,
+# leaving out column 0, which is the way back up
+def serpentine(cols, rows):
+    order = [(0, 0)]
+    for y in range(rows):
+        xs = range(1, cols) if y % 2 == 0 else range(cols - 1, 0, -1)
+        order.extend((x, y) for x in xs)
+    order.extend((0, y) for y in range(rows - 1, 0, -1))
+    return order
+
+
+# tiles of a cycle in order, None for boards that are one tile wide
+def hamiltonianCycle(cols, rows):
+    if cols < 2 or rows < 2:
+        return None
+    if rows % 2 == 0:
+        return serpentine(cols, rows)
+    if cols % 2 == 0:
+        return [(x, y) for (y, x) in serpentine(rows, cols)]
+
+    # both odd: the last row of the cycle above runs right to left, bend it
+    # down into the bottom row two tiles at a time, all but the corner
+    last = rows - 2
+    order = []
+    for tile in serpentine(cols, rows - 1):
+        if order and tile[1] == last and order[-1] == (tile[0] + 1, last) and tile[0] % 2 == 0:
+            order.append((tile[0] + 1, rows - 1))
+            order.append((tile[0], rows - 1))
+        order.append(tile)
+    return order
+
+
+def cachePath(cols, rows):
+    return os.path.join(CACHE_DIR, "cycle-%dx%d.bin" % (cols, rows))
+
+
+def readCycle(cols, rows):
+    cells = array("i")
+    try:
+        with open(cachePath(cols, rows), "rb") as f:
+            cells.fromstring(f.read())
+    except (IOError, OSError):
+        return None
+    order = [(cell % cols, cell // cols) for cell in cells]
+    if not isCycle(order, cols, rows):
+        # stale or corrupt, following it would run the snake into itself
+        return None
+    return order
+
+
+# every tile once, but the spare when both sides are odd, and each tile
+# next to the one before it, the first next to the last
+def isCycle(order, cols, rows):
+    size = cols * rows
+    if cols % 2 and rows % 2:
+        size -= 1
+    if len(order) != size or len(set(order)) != size:
+        return False
+    for x, y in order:
+        if not (0 <= x < cols and 0 <= y < rows) or size < cols * rows and (x, y) == (cols - 1, rows - 1):
+            return False
+    previous = order[-1]
+    for tile in order:
+        if abs(tile[0] - previous[0]) + abs(tile[1] - previous[1]) != 1:
+            return False
+        previous = tile
+    return True
+
+
+def writeCycle(cols, rows, order):
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        with open(cachePath(cols, rows), "wb") as f:
+            f.write(array("i", [y * cols + x for (x, y) in order]).tostring())
+    except (IOError, OSError):
+        # the cache is only a shortcut, build it again next time
+        pass
+
+
+_cycles = {}
+
+# the Cycle for a board size, from memory, the disk cache or built new
+def loadCycle(cols, rows):
+    key = (cols, rows)
+    if key not in _cycles:
+        order = readCycle(cols, rows)
+        if order is None:
+            order = hamiltonianCycle(cols, rows)
+            if order is None:
+                raise ValueError("no hamiltonian cycle on a %dx%d board" % (cols, rows))
+            writeCycle(cols, rows, order)
+        _cycles[key] = Cycle(cols, rows, order)
+    return _cycles[key]
+
+
+class Cycle:
+    """a cycle through the board and the position of every tile on it"""
+    def __init__(self, cols, rows, order):
+        self.cols = cols
+        self.rows = rows
+        self.order = order
+        self.n = len(order)
+        self.index = dict((tile, i) for i, tile in enumerate(order))
+        self.spare = None
+        self.twin = None
+        if self.n < cols * rows:
+            self.spare = (cols - 1, rows - 1)
+            self.twin = (cols - 2, rows - 2)
+            self.index[self.spare] = self.index[self.twin]
+
+    # how many steps along the cycle it takes to get from a to b
+    def distance(self, a, b):
+        return (self.index[b] - self.index[a]) % self.n
+
+    # the tile to move to. body is head first and occupied holds every
+    # tile of it
+    def nextTile(self, body, apple, occupied, shortcuts=True):
+        head = body[0]
+        # of the spare and its twin only walk through the one with the apple
+        skip = self.spare
+        if self.spare and apple == self.spare:
+            skip = self.twin
+
+        best = self.order[(self.index[head] + 1) % self.n]
+        if best == skip:
+            best = self.spare
+        if best in occupied and best != body[-1]:
+            # only right after the start, while the body is not yet laid
+            # out along the cycle
+            best = None
+        bestDistance = 1
+
+        if shortcuts and apple in self.index and len(body) < SHORTCUT_LENGTH * self.n:
+            # everything from the head up to the tail in cycle order is
+            # free, so jumping ahead short of the tail is safe
+            room = self.distance(head, body[-1]) - SHORTCUT_MARGIN
+            target = self.distance(head, apple)
+            for tile in neighbors(head, self.cols, self.rows):
+                if tile in occupied or tile == skip:
+                    continue
+                d = self.distance(head, tile)
+                if best is None or (bestDistance < d <= target and d < room):
+                    best = tile
+                    bestDistance = d
+        elif best is None:
+            for tile in neighbors(head, self.cols, self.rows):
+                if tile not in occupied and tile != skip:
+                    return tile
+        return best
+
+
+class CycleFollower:
+    """headless strategy following the hamiltonian cycle of the board"""
+    def __init__(self, shortcuts=True):
+        self.shortcuts = shortcuts
+
+    def __call__(self, game):
+        cycle = loadCycle(game.cols, game.rows)
+        head = game.head()
+        tile = cycle.nextTile(game.body, game.apple, game.occupied, self.shortcuts)
+        if tile is None:
+            return None
+        return direction(head, tile)
@@ -0,0 +1,87 @@
+"""opt-in timing of the game loop. a Profiler attached to an EventManager
+times every handler per event type, and the loop, the View and the
+computer snakes add their own timers (tick, frame, render,
+display.update, planner) through evManager.profiler. with no profiler
+attached all that costs one attribute check.
+
+    profiler = instrument.Profiler(evManager, "profile.json")
+
+the timers go to path as JSON at QuitEvent and on ProfileDumpRequest (F12
+in the game), or whenever dump() is called
+"""
+import json
+import logging
+
+import timing
+from events import QuitEvent, ProfileDumpRequest
+
+log = logging.getLogger("snake")
+
+
+class Profiler:
+    def __init__(self, evManager=None, path=None):
+        self.path = path
+        # timer name -> timing.Histogram
+        self.histograms = {}
+        # (event class, handler function) -> timer name
+        self.names = {}
+        self.started = timing.monotonic()
+        if evManager is not None:
+            self.attach(evManager)
+
+    def attach(self, evManager):
+        evManager.profiler = self
+        evManager.subscribe(ProfileDumpRequest, self.onDumpRequest)
+        evManager.subscribe(QuitEvent, self.onQuit)
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = timing.Histogram()
+        return histogram
+
+    def add(self, name, seconds):
+        self.histogram(name).add(seconds)
+
+    # the timer for one handler of one event class, e.g.
+    # "handler MoveEvent View.onMove"
+    def handlerName(self, eventType, obj, func):
+        key = (eventType, func)
+        name = self.names.get(key)
+        if name is None:
+            owner = obj.__class__.__name__ + "." if obj is not None else ""
+            name = "handler %s %s%s" % (eventType.__name__, owner, func.__name__)
+            self.names[key] = name
+        return name
+
+    def stats(self):
+        return {
+            "seconds": timing.monotonic() - self.started,
+            "timers": dict((name, histogram.toDict()) for name, histogram in self.histograms.items()),
+        }
+
+    # write the timers as JSON to path, or the path given at creation.
+    # returns the path written, None if there is nowhere to write
+    def dump(self, path=None):
+        path = path or self.path
+        if not path:
+            return None
+        with open(path, "w") as f:
+            json.dump(self.stats(), f, indent=1, sort_keys=True)
+        log.info("profile written to %s", path)
+        return path
+
+    # the slowest timers by total time, one per line
+    def report(self, top=10):
+        timers = sorted(self.histograms.items(), key=lambda item: -item[1].total)
+        lines = []
+        for name, h in timers[:top]:
+            lines.append("%-50s %8d  total %9.1f ms  mean %7.3f ms  p99 %7.3f ms  max %7.3f ms" % (
+                name, h.count, 1000 * h.total, 1000 * h.mean(), 1000 * h.percentile(0.99), 1000 * h.max))
+        return "\n".join(lines)
+
+    def onDumpRequest(self, event):
+        self.dump()
+
+    def onQuit(self, event):
+        self.dump()
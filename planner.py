@@ -0,0 +1,416 @@
+"""path planning for the computer controlled snakes. everything in here
+works on plain (x, y) tile coordinates so it can be used without pygame
+"""
+import heapq
+from collections import deque
+
+from sim import DOWN, UP, LEFT, RIGHT
+
+# the survival checks stop counting free tiles here, so they stay cheap on
+# big boards with long snakes
+FLOOD_LIMIT = 256
+# moves between new tries for the apple while chasing the tail
+RETRY_MOVES = 8
+
+INFINITY = float("inf")
+# no other snakes
+NOTHING = frozenset()
+
+
+def manhattan(tile1, tile2):
+    return abs(tile1[0] - tile2[0]) + abs(tile1[1] - tile2[1])
+
+
+def neighbors(tile, cols, rows):
+    x, y = tile
+    result = []
+    if x > 0:
+        result.append((x - 1, y))
+    if x < cols - 1:
+        result.append((x + 1, y))
+    if y > 0:
+        result.append((x, y - 1))
+    if y < rows - 1:
+        result.append((x, y + 1))
+    return result
+
+
+# A* with a manhattan heuristic and a cost of 1 per tile
+# return list of steps from source --> dest (source excluded), None if blocked
+# source itself may be in blocked, e.g. a snake head in its own body
+def astar(source, dest, blocked, cols, rows):
+    if source == dest:
+        return []
+    if dest in blocked:
+        return None
+
+    costs = {source: 0}
+    prevList = {source: None}
+    openList = [(manhattan(source, dest), 0, source)]
+    # ties are broken on the higher cost so the search dives toward dest
+    while openList:
+        f, g, u = heapq.heappop(openList)
+        if u == dest:
+            break
+        g = -g
+        if g > costs[u]:
+            continue
+
+        for neighbor in neighbors(u, cols, rows):
+            if neighbor in blocked:
+                continue
+            alt = g + 1
+            if alt < costs.get(neighbor, alt + 1):
+                costs[neighbor] = alt
+                prevList[neighbor] = u
+                heapq.heappush(openList, (alt + manhattan(neighbor, dest), -alt, neighbor))
+    else:
+        return None
+
+    S = []
+    u = dest
+    while prevList[u] != None:
+        S.append(u)
+        u = prevList[u]
+    return S[::-1]
+
+
+# the free tile next to tile that is closest to dest, None if boxed in
+def closestNeighbor(tile, dest, blocked, cols, rows):
+    result = None
+    best = None
+    for neighbor in neighbors(tile, cols, rows):
+        if neighbor in blocked:
+            continue
+        d = (neighbor[0] - dest[0])**2 + (neighbor[1] - dest[1])**2
+        if best is None or d < best:
+            result = neighbor
+            best = d
+    return result
+
+
+class Others:
+    """the tiles of a shared board (tile -> snake) taken by any snake but
+    owner, without copying the board. the survival checks below move the
+    snake's own body about, so they need the rest of the board apart from it
+    """
+    def __init__(self, board, owner):
+        self.board = board
+        self.owner = owner
+
+    def __contains__(self, tile):
+        return self.board.get(tile, self.owner) is not self.owner
+
+    def __iter__(self):
+        return (tile for tile, snake in self.board.iteritems() if snake is not self.owner)
+
+
+# breadth first count of the free tiles reachable from start (start not
+# counted). stops after limit tiles or once target is reached, so the cost
+# is bounded by limit rather than the board size. target may be blocked,
+# e.g. a tail that moves out of the way, others may not. returns
+# (count, found)
+def floodCount(start, blocked, cols, rows, limit, target=None, others=NOTHING):
+    seen = set([start])
+    queue = deque([start])
+    count = 0
+    # neighbors() inlined, this is the hot loop of the survival checks
+    while queue:
+        x, y = queue.popleft()
+        for neighbor in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if neighbor == target:
+                return count, True
+            if neighbor in seen or neighbor in blocked or neighbor in others:
+                continue
+            if not (0 <= neighbor[0] < cols and 0 <= neighbor[1] < rows):
+                continue
+            count += 1
+            if count >= limit:
+                return count, False
+            seen.add(neighbor)
+            queue.append(neighbor)
+    return count, False
+
+
+# the body (head first) after walking path, growing by one at its end
+def advance(body, path, ate=True):
+    length = len(body) + (1 if ate else 0)
+    return (path[::-1] + list(body))[:length]
+
+
+# can a snake with this body keep moving: either its tail is in reach,
+# or there is at least as much room as it is long (up to limit tiles).
+# others are the tiles of the other snakes on the board, see Others
+def hasRoom(body, cols, rows, limit=FLOOD_LIMIT, others=NOTHING):
+    need = min(len(body), limit)
+    count, found = floodCount(body[0], set(body), cols, rows, need, body[-1], others)
+    return found or count >= need
+
+
+# the stricter check: after moving into body the tail is still in reach,
+# however far, so the snake can always follow it out
+def tailInReach(body, cols, rows, others=NOTHING):
+    count, found = floodCount(body[0], set(body), cols, rows, cols * rows, body[-1], others)
+    return found
+
+
+# the next tile when stalling for room: a step that keeps the tail in
+# reach, taking the long way round, else the step with the most room.
+# None if boxed in
+def chaseTail(body, cols, rows, limit=FLOOD_LIMIT, others=NOTHING):
+    head, tail = body[0], body[-1]
+    # after the step the tail has moved on to the tile before it
+    newTail = body[-2] if len(body) > 1 else head
+    blocked = set(body)
+    blocked.discard(tail)
+    best = None
+    bestKey = None
+    for neighbor in neighbors(head, cols, rows):
+        if neighbor in blocked or neighbor in others:
+            continue
+        blocked.add(neighbor)
+        count, found = floodCount(neighbor, blocked, cols, rows, min(len(body), limit), newTail, others)
+        blocked.discard(neighbor)
+        key = (found, manhattan(neighbor, newTail) if found else count)
+        if bestKey is None or key > bestKey:
+            best = neighbor
+            bestKey = key
+    return best
+
+
+# the A* path to dest if it leaves the snake room to move on, else None.
+# blocked is every taken tile, others the ones not of this snake
+def safePath(body, dest, blocked, cols, rows, others=NOTHING):
+    if dest is None:
+        return None
+    path = astar(body[0], dest, blocked, cols, rows)
+    if path is None or not hasRoom(advance(body, path), cols, rows, others=others):
+        return None
+    return path
+
+
+class DStarLite:
+    """incremental shortest paths from a moving start to a fixed goal
+    (D* Lite, Koenig and Likhachev). the search runs backward from the goal
+    and keeps its tree between moves. after the snake moves, move() repairs
+    only the tiles around what changed, so a replan costs about as much as
+    the change instead of the whole board.
+
+    blocked is the live set of blocked tiles, e.g. a snake's occupied set.
+    the start may be in it
+    """
+    def __init__(self, start, goal, blocked, cols, rows):
+        self.start = start
+        self.last = start
+        self.goal = goal
+        self.blocked = blocked
+        self.cols = cols
+        self.rows = rows
+        self.km = 0
+        self.g = {}
+        self.rhs = {goal: 0}
+        self.queue = []
+        # current key of every queued tile, older heap entries are skipped
+        self.queued = {}
+        self.push(goal)
+        self.computeShortestPath()
+
+    def key(self, tile):
+        m = min(self.g.get(tile, INFINITY), self.rhs.get(tile, INFINITY))
+        return (m + manhattan(self.start, tile) + self.km, m)
+
+    def push(self, tile):
+        key = self.key(tile)
+        self.queued[tile] = key
+        heapq.heappush(self.queue, (key, tile))
+
+    def updateVertex(self, tile):
+        if tile != self.goal:
+            best = INFINITY
+            # blocked tiles lead nowhere, except the start which is the head
+            if tile == self.start or tile not in self.blocked:
+                for neighbor in neighbors(tile, self.cols, self.rows):
+                    if neighbor not in self.blocked:
+                        cost = self.g.get(neighbor, INFINITY) + 1
+                        if cost < best:
+                            best = cost
+            self.rhs[tile] = best
+        if self.g.get(tile, INFINITY) != self.rhs.get(tile, INFINITY):
+            self.push(tile)
+        else:
+            self.queued.pop(tile, None)
+
+    def computeShortestPath(self):
+        g = self.g
+        rhs = self.rhs
+        while self.queue:
+            key, tile = self.queue[0]
+            if self.queued.get(tile) != key:
+                heapq.heappop(self.queue)
+                continue
+            start = self.start
+            if key >= self.key(start) and rhs.get(start, INFINITY) == g.get(start, INFINITY):
+                break
+            heapq.heappop(self.queue)
+            newKey = self.key(tile)
+            if key < newKey:
+                self.push(tile)
+                continue
+            del self.queued[tile]
+            if g.get(tile, INFINITY) > rhs.get(tile, INFINITY):
+                g[tile] = rhs[tile]
+            else:
+                g[tile] = INFINITY
+                self.updateVertex(tile)
+            if tile not in self.blocked:
+                for neighbor in neighbors(tile, self.cols, self.rows):
+                    self.updateVertex(neighbor)
+
+    # the start moved and the tiles in changed were blocked or freed
+    def move(self, start, changed):
+        self.km += manhattan(self.last, start)
+        self.last = start
+        old = self.start
+        self.start = start
+        for tile in changed:
+            if tile is None:
+                continue
+            self.updateVertex(tile)
+            for neighbor in neighbors(tile, self.cols, self.rows):
+                self.updateVertex(neighbor)
+        self.updateVertex(old)
+        self.updateVertex(start)
+        self.computeShortestPath()
+
+    def reachable(self):
+        return self.rhs.get(self.start, INFINITY) < INFINITY
+
+    # the first step of a shortest path, None if the goal is out of reach
+    def nextTile(self, tile=None):
+        tile = tile or self.start
+        best = None
+        bestCost = INFINITY
+        for neighbor in neighbors(tile, self.cols, self.rows):
+            if neighbor not in self.blocked:
+                cost = self.g.get(neighbor, INFINITY)
+                if cost < bestCost:
+                    best = neighbor
+                    bestCost = cost
+        return best
+
+    # list of steps from start --> goal (start excluded), None if blocked
+    def path(self):
+        if not self.reachable():
+            return None
+        S = []
+        tile = self.start
+        while tile != self.goal and len(S) <= self.cols * self.rows:
+            tile = self.nextTile(tile)
+            S.append(tile)
+        return S
+
+
+# direction of an adjacent tile
+def direction(source, dest):
+    if dest[0] > source[0]:
+        return RIGHT
+    elif dest[0] < source[0]:
+        return LEFT
+    elif dest[1] > source[1]:
+        return DOWN
+    elif dest[1] < source[1]:
+        return UP
+
+
+# strategies for headless games. each is called with a sim.Simulation once
+# per move and returns the direction to take, None to keep going
+
+def greedy(game):
+    head = game.head()
+    closest = closestNeighbor(head, game.apple, game.occupied, game.cols, game.rows)
+    if closest is None:
+        return None
+    return direction(head, closest)
+
+
+class PathFollower:
+    """follows an A* path to the apple, planned once per apple like
+    AutoSnake.autopilot. stateful, so use one per game
+    """
+    def __init__(self):
+        self.apple = None
+        self.path = []
+
+    def __call__(self, game):
+        head = game.head()
+        if game.apple != self.apple:
+            self.apple = game.apple
+            self.path = astar(head, game.apple, game.occupied, game.cols, game.rows) or []
+
+        if self.path and self.path[0] == head:
+            self.path.pop(0)
+        target = self.path[0] if self.path else game.apple
+        closest = closestNeighbor(head, target, game.occupied, game.cols, game.rows)
+        if closest is None:
+            return None
+        return direction(head, closest)
+
+
+class SpaceAware:
+    """follows the A* path to the apple only when the snake still has room
+    after eating there (see hasRoom), otherwise chases its tail and tries
+    again every RETRY_MOVES moves. stateful, so use one per game
+    """
+    def __init__(self):
+        self.apple = None
+        self.path = []
+        self.retry = 0
+
+    def __call__(self, game):
+        head = game.head()
+        self.retry -= 1
+        if game.apple != self.apple or (not self.path and self.retry <= 0):
+            self.apple = game.apple
+            self.path = safePath(game.body, game.apple, game.occupied, game.cols, game.rows)
+            self.retry = RETRY_MOVES
+
+        if self.path and self.path[0] == head:
+            self.path.pop(0)
+        if self.path:
+            return direction(head, self.path[0])
+        step = chaseTail(game.body, game.cols, game.rows)
+        if step is None:
+            return None
+        return direction(head, step)
+
+
+class Incremental:
+    """keeps a D* Lite search to the apple and repairs it after every move
+    instead of planning once per apple, chasing the tail when the apple is
+    out of reach. stateful, so use one per game
+    """
+    def __init__(self):
+        self.apple = None
+        self.planner = None
+        self.tail = None
+
+    def __call__(self, game):
+        head = game.head()
+        if game.apple != self.apple or self.planner is None:
+            self.apple = game.apple
+            self.planner = None
+            if game.apple:
+                self.planner = DStarLite(head, game.apple, game.occupied, game.cols, game.rows)
+        else:
+            # the head moved in and the old tail moved out
+            self.planner.move(head, [head, self.tail])
+        self.tail = game.body[-1]
+
+        step = None
+        if self.planner and self.planner.reachable():
+            step = self.planner.nextTile()
+        if step is None:
+            step = chaseTail(game.body, game.cols, game.rows)
+        if step is None:
+            return None
+        return direction(head, step)
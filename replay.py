@@ -0,0 +1,370 @@
+"""compact binary recordings of snake games, for looking at what a snake
+did at any point of a long self play run without playing it again from
+the start.
+
+a file starts with a header (magic, version, board size, seed) followed by
+a stream of records:
+
+    1-4             one byte per move, the direction moved. ATE is or'ed
+                    in when the move ate an apple
+    APPLE x y       an apple was placed
+    KEYFRAME ...    the whole game state, written every keyframeInterval
+                    moves and at the start of every game
+    END             the game is over
+    INDEX ...       offsets of all keyframes, written on close and found
+                    through the trailer at the very end of the file
+
+the Replay player maps the file into memory and seeks by restoring the
+nearest keyframe and replaying the moves after it.
+
+    python replay.py game.snk --seek 5000
+"""
+import bisect
+import mmap
+import struct
+import sys
+import time
+from collections import deque
+
+from events import GameStartedEvent, SnakePlaceEvent, ApplePlaceEvent, MoveEvent, SnakeDiedEvent, GameOverEvent
+from sim import nextTile, Simulation
+
+MAGIC = "SNKR"
+VERSION = 1
+HEADER = struct.Struct("<4sBHHq")
+
+ATE = 0x80
+APPLE = 0x10
+KEYFRAME = 0x20
+END = 0x30
+INDEX = 0x40
+
+TILE = struct.Struct("<hh")
+KEYFRAME_HEAD = struct.Struct("<IBIhhI")
+INDEX_HEAD = struct.Struct("<II")
+INDEX_ENTRY = struct.Struct("<IQ")
+TRAILER = struct.Struct("<Q4s")
+TRAILER_MAGIC = "SNKI"
+
+NO_APPLE = (-1, -1)
+KEYFRAME_INTERVAL = 1000
+
+
+class ReplayState:
+    """the game as seen through a recording. the Recorder keeps one too,
+    so keyframes hold exactly what the player rebuilds
+    """
+    def __init__(self):
+        self.tick = 0
+        self.body = deque()
+        self.apple = None
+        self.direction = None
+        self.score = 0
+        self.over = True
+
+    def restore(self, tick, direction, score, apple, body):
+        self.tick = tick
+        self.direction = direction
+        self.score = score
+        self.apple = apple
+        self.body = deque(body)
+        self.over = False
+
+    def move(self, code):
+        self.direction = code & ~ATE
+        head = nextTile(self.body[0], self.direction)
+        self.body.appendleft(head)
+        if code & ATE:
+            self.score += 1
+            # the next apple may have been recorded before this move
+            if self.apple == head:
+                self.apple = None
+        else:
+            self.body.pop()
+        self.tick += 1
+
+
+class Recorder:
+    """writes a recording. call start() at the beginning of each game,
+    then apple() and move() as they happen and end() when it is over
+    """
+    def __init__(self, path, cols, rows, seed=None, keyframeInterval=KEYFRAME_INTERVAL):
+        self.file = open(path, "wb")
+        self.keyframeInterval = keyframeInterval
+        self.state = ReplayState()
+        self.keyframes = []
+        self.sinceKeyframe = 0
+        self.file.write(HEADER.pack(MAGIC, VERSION, cols, rows, -1 if seed is None else seed))
+
+    def start(self, body, direction, apple=None):
+        self.state.restore(self.state.tick, direction, 0, apple, body)
+        self.keyframe()
+
+    def keyframe(self):
+        state = self.state
+        self.keyframes.append((state.tick, self.file.tell()))
+        self.sinceKeyframe = 0
+        apple = state.apple or NO_APPLE
+        self.file.write(chr(KEYFRAME))
+        self.file.write(KEYFRAME_HEAD.pack(state.tick, state.direction, state.score, apple[0], apple[1], len(state.body)))
+        self.file.write("".join(TILE.pack(x, y) for (x, y) in state.body))
+
+    def apple(self, tile):
+        self.state.apple = tile
+        self.file.write(chr(APPLE) + TILE.pack(tile[0], tile[1]))
+
+    def move(self, direction, ate=False):
+        code = direction | ATE if ate else direction
+        self.state.move(code)
+        self.file.write(chr(code))
+        self.sinceKeyframe += 1
+        if self.sinceKeyframe >= self.keyframeInterval:
+            self.keyframe()
+
+    def end(self):
+        self.state.over = True
+        self.file.write(chr(END))
+
+    def close(self):
+        if self.file.closed:
+            return
+        offset = self.file.tell()
+        self.file.write(chr(INDEX) + INDEX_HEAD.pack(len(self.keyframes), self.state.tick))
+        self.file.write("".join(INDEX_ENTRY.pack(tick, position) for tick, position in self.keyframes))
+        self.file.write(TRAILER.pack(offset, TRAILER_MAGIC))
+        self.file.close()
+
+
+# record a headless game: recordStart() after Simulation.reset() and
+# recordStep() after every Simulation.step()
+def recordStart(recorder, game):
+    recorder.start(game.body, game.direction, game.apple)
+
+def recordStep(recorder, game, result):
+    # the fatal move is kept to show where the snake went
+    recorder.move(game.direction, result == Simulation.ATE)
+    if result == Simulation.DIED:
+        recorder.end()
+    elif game.apple and game.apple != recorder.state.apple:
+        recorder.apple(game.apple)
+
+
+class EventRecorder:
+    """records the first snake of each game played through an EventManager"""
+    def __init__(self, evManager, path, cols, rows, seed=None, keyframeInterval=KEYFRAME_INTERVAL):
+        self.evManager = evManager
+        self.evManager.subscribe(GameStartedEvent, self.onGameStarted)
+        self.evManager.subscribe(SnakePlaceEvent, self.onSnakePlace)
+        self.evManager.subscribe(ApplePlaceEvent, self.onApplePlace)
+        self.evManager.subscribe(MoveEvent, self.onMove)
+        self.evManager.subscribe(SnakeDiedEvent, self.onSnakeDied)
+        self.evManager.subscribe(GameOverEvent, self.onGameOver)
+        self.recorder = Recorder(path, cols, rows, seed, keyframeInterval)
+        self.game = None
+        self.snake = None
+        # apples placed before this recorder heard of the move that ate
+        self.pending = []
+
+    def close(self):
+        self.recorder.close()
+
+    def onGameStarted(self, event):
+        self.game = event.game
+
+    def onSnakePlace(self, event):
+        if self.snake is None:
+            self.snake = event.snake
+            self.recorder.start(event.snake.snakeList, event.snake.direction)
+
+    def onApplePlace(self, event):
+        if self.snake is None:
+            return
+        tile = (event.apple.x, event.apple.y)
+        if self.recorder.state.body and self.snake.snakeList[0] != self.recorder.state.body[0]:
+            # the snake moved but we have not seen its MoveEvent yet
+            self.pending.append(tile)
+        else:
+            self.recorder.apple(tile)
+
+    def onMove(self, event):
+        if event.snake is not self.snake:
+            return
+        # depending on who saw this move first the Game may already have
+        # grown the snake, or the apple may still be under its head
+        head = event.snake.snakeList[0]
+        ate = len(event.snake.snakeList) > len(self.recorder.state.body)
+        if self.game:
+            ate = ate or any(apple.state and (apple.x, apple.y) == head for apple in self.game.apples)
+        self.recorder.move(event.snake.direction, ate)
+        for tile in self.pending:
+            self.recorder.apple(tile)
+        self.pending = []
+
+    def onSnakeDied(self, event):
+        if event.snake is self.snake:
+            self.onGameOver(event)
+
+    def onGameOver(self, event):
+        if self.snake is not None:
+            self.recorder.end()
+            self.snake = None
+            self.pending = []
+
+
+class Replay:
+    """plays a recording back from a memory map of the file"""
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.cols, self.rows, self.seed = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a snake recording" % path)
+        if self.seed < 0:
+            self.seed = None
+
+        self.end = len(self.data)
+        self.lastTick = None
+        self.keyframes = self.readIndex()
+        if self.keyframes is None:
+            self.keyframes = self.scan()
+        self.keyframeTicks = [tick for tick, offset in self.keyframes]
+        self.state = ReplayState()
+        self.offset = HEADER.size
+        if self.lastTick is None:
+            self.lastTick = self.seek(sys.maxint).tick
+            self.seek(0)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def readIndex(self):
+        if self.end < HEADER.size + TRAILER.size:
+            return None
+        offset, magic = TRAILER.unpack_from(self.data, self.end - TRAILER.size)
+        if magic != TRAILER_MAGIC or ord(self.data[offset]) != INDEX:
+            return None
+        self.end = offset
+        count, self.lastTick = INDEX_HEAD.unpack_from(self.data, offset + 1)
+        offset += 1 + INDEX_HEAD.size
+        return [INDEX_ENTRY.unpack_from(self.data, offset + i * INDEX_ENTRY.size) for i in range(count)]
+
+    # rebuild the keyframe index of a file that was never closed
+    def scan(self):
+        keyframes = []
+        offset = HEADER.size
+        while offset < self.end:
+            code = ord(self.data[offset])
+            if code == KEYFRAME:
+                if offset + 1 + KEYFRAME_HEAD.size > self.end:
+                    break
+                keyframes.append((KEYFRAME_HEAD.unpack_from(self.data, offset + 1)[0], offset))
+            size = self.recordSize(offset)
+            if offset + size > self.end:
+                break
+            offset += size
+        self.end = offset
+        return keyframes
+
+    def recordSize(self, offset):
+        code = ord(self.data[offset])
+        if code == APPLE:
+            return 1 + TILE.size
+        elif code == KEYFRAME:
+            length = KEYFRAME_HEAD.unpack_from(self.data, offset + 1)[5]
+            return 1 + KEYFRAME_HEAD.size + length * TILE.size
+        return 1
+
+    # apply the record at the current offset, False at the end of the file
+    def readRecord(self):
+        if self.offset >= self.end:
+            return False
+        data = self.data
+        offset = self.offset
+        code = ord(data[offset])
+        if code == APPLE:
+            self.state.apple = TILE.unpack_from(data, offset + 1)
+        elif code == KEYFRAME:
+            tick, direction, score, x, y, length = KEYFRAME_HEAD.unpack_from(data, offset + 1)
+            start = offset + 1 + KEYFRAME_HEAD.size
+            body = [TILE.unpack_from(data, start + i * TILE.size) for i in range(length)]
+            apple = None if (x, y) == NO_APPLE else (x, y)
+            self.state.restore(tick, direction, score, apple, body)
+        elif code == END:
+            self.state.over = True
+        else:
+            self.state.move(code)
+        self.offset += self.recordSize(offset)
+        return True
+
+    # play forward to the next move, False at the end of the file
+    def step(self):
+        tick = self.state.tick
+        while self.state.tick == tick:
+            if not self.readRecord():
+                return False
+        self.readApples()
+        return True
+
+    # pick up apples placed right after the current move
+    def readApples(self):
+        while self.offset < self.end and ord(self.data[self.offset]) == APPLE:
+            self.readRecord()
+
+    # jump to tick: restore the last keyframe at or before it and play on
+    def seek(self, tick):
+        i = bisect.bisect_right(self.keyframeTicks, tick) - 1
+        if i < 0:
+            self.offset = HEADER.size
+            self.state = ReplayState()
+        else:
+            self.offset = self.keyframes[i][1]
+            self.readRecord()
+            self.readApples()
+        while self.state.tick < tick and self.step():
+            pass
+        return self.state
+
+    # play the rest of the recording as fast as possible, yielding the
+    # state after every move
+    def play(self):
+        while self.step():
+            yield self.state
+
+    def render(self):
+        rows = [["."] * self.cols for y in range(self.rows)]
+        if self.state.apple:
+            rows[self.state.apple[1]][self.state.apple[0]] = "@"
+        for i, (x, y) in enumerate(self.state.body):
+            if 0 <= x < self.cols and 0 <= y < self.rows:
+                rows[y][x] = "O" if i == 0 else "o"
+        return "\n".join("".join(row) for row in rows)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="inspect a snake recording")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, help="show the board at this tick")
+    parser.add_argument("--play", action="store_true", help="fast forward from --seek to the end")
+    args = parser.parse_args(argv)
+
+    replay = Replay(args.path)
+    print "%dx%d board, seed %s, %d ticks, %d keyframes" % (replay.cols, replay.rows, replay.seed, replay.lastTick, len(replay.keyframes))
+    if args.seek is not None:
+        start = time.time()
+        state = replay.seek(args.seek)
+        print "tick %d  score %d  length %d  (seek %.3f ms)" % (state.tick, state.score, len(state.body), 1000 * (time.time() - start))
+        print replay.render()
+    if args.play:
+        start = time.time()
+        moves = 0
+        for state in replay.play():
+            moves += 1
+        elapsed = time.time() - start
+        print "played %d moves in %.3f s, now at tick %d" % (moves, elapsed, replay.state.tick)
+    replay.close()
+
+
+if __name__ == "__main__":
+    main()
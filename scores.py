@@ -0,0 +1,215 @@
+"""game results kept in an sqlite database. record() only queues the
+result, a writer thread commits them in batches, so the game loop and
+tournaments never wait for the disk.
+
+    store = ScoreStore()
+    store.record(score=12, length=15, controller="space", steps=480, seed=7)
+    ...
+    store.flush()                       # wait for everything queued so far
+    store.leaderboard(10, controller="space")
+    store.percentile(0.9, controller="space")
+    store.close()
+
+queries read what has been committed so far, call flush() first to
+include the results still queued.
+
+    python scores.py                    # leaderboard and percentiles
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from Queue import Queue, Empty
+
+DB_PATH = os.path.join(os.path.expanduser("~"), ".snake", "scores.db")
+# results committed in one transaction at most, and seconds a result
+# waits for more to join its batch
+BATCH_SIZE = 1000
+FLUSH_INTERVAL = 1.0
+# seconds flush() waits for the writer at most
+FLUSH_TIMEOUT = 30.0
+
+COLUMNS = ("time", "controller", "score", "length", "steps", "seconds", "seed", "cols", "rows", "cause")
+
+SCHEMA = """
+create table if not exists results (
+    id integer primary key,
+    time real not null,
+    controller text not null,
+    score integer not null,
+    length integer not null,
+    steps integer,
+    seconds real,
+    seed integer,
+    cols integer,
+    rows integer,
+    cause text
+);
+create index if not exists resultsByScore on results (score);
+create index if not exists resultsByController on results (controller, score);
+"""
+
+log = logging.getLogger("snake")
+
+
+def connect(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    db = sqlite3.connect(path, timeout=30)
+    # readers do not block the writer or the other way round
+    db.execute("pragma journal_mode=wal")
+    db.execute("pragma synchronous=normal")
+    db.executescript(SCHEMA)
+    return db
+
+
+class ScoreStore:
+    """an sqlite file of game results with a writer thread in front of it"""
+    def __init__(self, path=DB_PATH, batchSize=BATCH_SIZE, flushInterval=FLUSH_INTERVAL):
+        self.path = path
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.queue = Queue()
+        # the connection queries go through, made on the first query
+        self.db = None
+        # results and batches written, for the curious
+        self.written = 0
+        self.batches = 0
+        # make the file and tables before any query can come in
+        connect(path).close()
+        self.writer = threading.Thread(target=self.write, name="score writer")
+        self.writer.daemon = True
+        self.writer.start()
+
+    # queue one result. controller says who played: "player" or the
+    # strategy of a computer snake
+    def record(self, score, length, controller, steps=None, seconds=None, seed=None, cols=None, rows=None, cause=None):
+        self.queue.put((time.time(), controller, score, length, steps, seconds, seed, cols, rows, cause))
+
+    # block until every result recorded so far is committed, for at most
+    # timeout seconds. False if they may not be: the writer has stopped,
+    # after close() or an error, or is too slow
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        if not self.writer.is_alive():
+            return False
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    # commit what is queued and stop the writer
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    # writer thread main loop: a batch is whatever is queued, waiting up to
+    # flushInterval for more once there is one result, up to batchSize
+    def write(self):
+        try:
+            db = connect(self.path)
+        except (sqlite3.Error, OSError) as e:
+            log.error("cannot record results in %s: %s", self.path, e)
+            return
+        insert = "insert into results (%s) values (%s)" % (", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)))
+        running = True
+        while running:
+            item = self.queue.get()
+            batch = []
+            waiting = []
+            deadline = time.time() + self.flushInterval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                elif isinstance(item, tuple):
+                    batch.append(item)
+                else:
+                    # a flush, answered once this batch is in
+                    waiting.append(item)
+                    break
+                if len(batch) >= self.batchSize:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.time()))
+                except Empty:
+                    break
+            if batch:
+                try:
+                    with db:
+                        db.executemany(insert, batch)
+                    self.written += len(batch)
+                    self.batches += 1
+                except sqlite3.Error as e:
+                    log.error("lost %d results: %s", len(batch), e)
+            for done in waiting:
+                done.set()
+        db.close()
+
+    def query(self, sql, args=()):
+        if self.db is None:
+            self.db = connect(self.path)
+        return self.db.execute(sql, args).fetchall()
+
+    def where(self, controller):
+        if controller is None:
+            return "", ()
+        return "where controller = ?", (controller,)
+
+    def count(self, controller=None):
+        where, args = self.where(controller)
+        return self.query("select count(*) from results " + where, args)[0][0]
+
+    # the best n results, best first, as dicts
+    def leaderboard(self, n=10, controller=None):
+        where, args = self.where(controller)
+        rows = self.query("select %s from results %s order by score desc, time limit ?" % (", ".join(COLUMNS), where), args + (n,))
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    # the score a fraction q of the results are at or below, None when
+    # there are none. reads the scores in index order with no sort and no
+    # table rows, but still steps over q * n index entries
+    def percentile(self, q, controller=None):
+        n = self.count(controller)
+        if not n:
+            return None
+        where, args = self.where(controller)
+        offset = min(n - 1, int(q * n))
+        return self.query("select score from results %s order by score limit 1 offset ?" % where, args + (offset,))[0][0]
+
+    # games, mean and best score per controller
+    def summary(self):
+        rows = self.query("select controller, count(*), avg(score), max(score) from results group by controller order by controller")
+        return dict((controller, {"games": games, "mean": mean, "max": best}) for controller, games, mean, best in rows)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="show the recorded snake results")
+    parser.add_argument("--db", default=DB_PATH, help="results database (default %(default)s)")
+    parser.add_argument("-c", "--controller", help="only results of this controller, e.g. player or space")
+    parser.add_argument("-n", type=int, default=10, help="leaderboard length")
+    args = parser.parse_args(argv)
+
+    store = ScoreStore(args.db)
+    try:
+        print "%-12s %8s %8s %6s" % ("controller", "games", "mean", "best")
+        for controller, s in sorted(store.summary().items()):
+            print "%-12s %8d %8.2f %6d" % (controller, s["games"], s["mean"], s["max"])
+        if not store.count(args.controller):
+            return
+        print
+        print "score percentiles: " + "  ".join("p%d %d" % (100 * q, store.percentile(q, args.controller)) for q in (0.1, 0.5, 0.9, 0.99))
+        print
+        for i, r in enumerate(store.leaderboard(args.n, args.controller)):
+            print "%3d. %5d  %-10s length %5d  %s" % (i + 1, r["score"], r["controller"], r["length"], time.strftime("%Y-%m-%d %H:%M", time.localtime(r["time"])))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
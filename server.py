@@ -0,0 +1,596 @@
+"""network multiplayer. the server hosts rooms, each an authoritative
+sim.Arena stepped every TICK seconds. clients only send the direction they
+want to go; the server sends every client of a room the changes of each
+tick (heads, tails, apples, deaths) rather than the whole board.
+
+    python server.py --port 5555
+    python server.py --bench 200 --clients 2
+
+messages are framed with a 4 byte little endian length. from the client:
+
+    JOIN room       join (or rejoin after dying) room number room
+    TURN direction  steer the snake
+    LEAVE           leave the room
+
+from the server:
+
+    WELCOME room id cols rows  + every snake and apple of the room
+    TICK tick                  + the room's changes, see packChanges
+"""
+import errno
+import logging
+import select
+import socket
+import struct
+import time
+from collections import deque
+
+import timing
+from sim import Arena, DIRECTIONS
+
+log = logging.getLogger("snake")
+
+PORT = 5555
+# seconds per move, as fast as a player snake in the game
+TICK = 0.075
+BOARD_SIZE = 25
+# connections that fall this far behind are dropped
+MAX_BUFFER = 1 << 20
+# longest frame a client may send, and rooms open at once
+MAX_MESSAGE = 64
+MAX_ROOMS = 1024
+
+FRAME = struct.Struct("<I")
+
+JOIN = 0x01
+TURN = 0x02
+LEAVE = 0x03
+WELCOME = 0x81
+TICK_FRAME = 0x82
+
+# snake ids are 32 bit: Arena never reuses them, and a room that stays
+# open sees a new one for every join
+JOIN_MESSAGE = struct.Struct("<BH")
+TURN_MESSAGE = struct.Struct("<BB")
+WELCOME_HEAD = struct.Struct("<BHIHH")
+TICK_HEAD = struct.Struct("<BI")
+COUNT = struct.Struct("<H")
+TILE = struct.Struct("<hh")
+SNAKE_HEAD = struct.Struct("<IH")
+# change records, the first byte is the Arena change type
+TILE_CHANGE = struct.Struct("<BIhh")
+APPLE_CHANGE = struct.Struct("<Bhh")
+DIED_CHANGE = struct.Struct("<BI")
+SPAWN_CHANGE = struct.Struct("<BIH")
+
+
+def frame(payload):
+    return FRAME.pack(len(payload)) + payload
+
+
+def packTiles(tiles):
+    return "".join(TILE.pack(x, y) for (x, y) in tiles)
+
+
+def packChanges(changes):
+    parts = []
+    for change in changes:
+        kind = change[0]
+        if kind in (Arena.HEAD, Arena.TAIL, Arena.ATE):
+            parts.append(TILE_CHANGE.pack(kind, change[1], change[2][0], change[2][1]))
+        elif kind == Arena.APPLE:
+            parts.append(APPLE_CHANGE.pack(kind, change[1][0], change[1][1]))
+        elif kind == Arena.DIED:
+            parts.append(DIED_CHANGE.pack(kind, change[1]))
+        elif kind == Arena.SPAWN:
+            parts.append(SPAWN_CHANGE.pack(kind, change[1], len(change[2])))
+            parts.append(packTiles(change[2]))
+    return "".join(parts)
+
+
+def unpackChanges(data, offset=0):
+    changes = []
+    while offset < len(data):
+        kind = ord(data[offset])
+        if kind in (Arena.HEAD, Arena.TAIL, Arena.ATE):
+            kind, id, x, y = TILE_CHANGE.unpack_from(data, offset)
+            changes.append((kind, id, (x, y)))
+            offset += TILE_CHANGE.size
+        elif kind == Arena.APPLE:
+            kind, x, y = APPLE_CHANGE.unpack_from(data, offset)
+            changes.append((kind, (x, y)))
+            offset += APPLE_CHANGE.size
+        elif kind == Arena.DIED:
+            changes.append(DIED_CHANGE.unpack_from(data, offset))
+            offset += DIED_CHANGE.size
+        elif kind == Arena.SPAWN:
+            kind, id, length = SPAWN_CHANGE.unpack_from(data, offset)
+            offset += SPAWN_CHANGE.size
+            body = [TILE.unpack_from(data, offset + i * TILE.size) for i in range(length)]
+            offset += length * TILE.size
+            changes.append((kind, id, body))
+        else:
+            raise ValueError("bad change record %d" % kind)
+    return changes
+
+
+# split complete frames off the front of a receive buffer. a frame longer
+# than maxLength is a ValueError, rather than waiting for it for ever
+def readFrames(buffer, maxLength=None):
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= FRAME.size:
+        length = FRAME.unpack_from(buffer, offset)[0]
+        if maxLength is not None and length > maxLength:
+            raise ValueError("frame of %d bytes" % length)
+        if len(buffer) - offset - FRAME.size < length:
+            break
+        offset += FRAME.size
+        frames.append(buffer[offset:offset + length])
+        offset += length
+    return frames, buffer[offset:]
+
+
+class Poller:
+    """poll() where there is one, select() on windows"""
+    def __init__(self):
+        self.poll = getattr(select, "poll", None)
+        if self.poll:
+            self.poll = self.poll()
+        self.readers = set()
+        self.writers = set()
+
+    def register(self, fd, write=False):
+        self.readers.add(fd)
+        if write:
+            self.writers.add(fd)
+        else:
+            self.writers.discard(fd)
+        if self.poll:
+            self.poll.register(fd, select.POLLIN | (select.POLLOUT if write else 0))
+
+    def unregister(self, fd):
+        self.readers.discard(fd)
+        self.writers.discard(fd)
+        if self.poll:
+            try:
+                self.poll.unregister(fd)
+            except KeyError:
+                pass
+
+    # returns [(fd, readable, writable)]
+    def wait(self, timeout):
+        if self.poll:
+            events = self.poll.poll(int(timeout * 1000))
+            readable = select.POLLIN | select.POLLHUP | select.POLLERR
+            return [(fd, bool(mask & readable), bool(mask & select.POLLOUT)) for fd, mask in events]
+        if not self.readers:
+            time.sleep(timeout)
+            return []
+        r, w, x = select.select(list(self.readers), list(self.writers), [], timeout)
+        w = set(w)
+        return [(fd, True, fd in w) for fd in r] + [(fd, False, True) for fd in w if fd not in r]
+
+
+class Connection:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.inbuf = ""
+        self.outbuf = deque()
+        self.pending = 0
+        self.room = None
+        self.snake = None
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def queue(self, data):
+        self.outbuf.append(data)
+        self.pending += len(data)
+
+    # send what the socket takes, True once everything is out
+    def flush(self):
+        while self.outbuf:
+            data = self.outbuf[0]
+            try:
+                sent = self.sock.send(data)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return False
+                raise
+            self.pending -= sent
+            if sent < len(data):
+                self.outbuf[0] = data[sent:]
+                return False
+            self.outbuf.popleft()
+        return True
+
+
+class Room:
+    def __init__(self, number, cols, rows, seed=None):
+        self.number = number
+        self.arena = Arena(cols, rows, seed)
+        self.clients = set()
+        self.tick = 0
+
+    def snapshot(self, connection):
+        arena = self.arena
+        parts = [WELCOME_HEAD.pack(WELCOME, self.number, connection.snake or 0, arena.cols, arena.rows)]
+        parts.append(COUNT.pack(len(arena.snakes)))
+        for snake in arena.snakes.values():
+            parts.append(SNAKE_HEAD.pack(snake.id, len(snake.body)))
+            parts.append(packTiles(snake.body))
+        parts.append(COUNT.pack(len(arena.apples)))
+        parts.append(packTiles(arena.apples))
+        return frame("".join(parts))
+
+    # step the game and return the frame of its changes
+    def step(self):
+        self.tick += 1
+        self.arena.step()
+        return frame(TICK_HEAD.pack(TICK_FRAME, self.tick) + packChanges(self.arena.flush()))
+
+
+class Server:
+    def __init__(self, host="", port=PORT, size=BOARD_SIZE, tick=TICK, seed=None):
+        self.size = size
+        self.tickLength = tick
+        self.seed = seed
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+        self.poller = Poller()
+        self.poller.register(self.listener.fileno())
+        self.connections = {}
+        self.rooms = {}
+        self.running = False
+        self.nextTick = None
+        # seconds spent stepping and sending per tick
+        self.tickTime = timing.RunningStats()
+        self.overruns = 0
+
+    # serve for duration seconds, or until stop(). ticks keep their pace
+    # across calls
+    def run(self, duration=None):
+        self.running = True
+        now = timing.monotonic()
+        end = now + duration if duration is not None else None
+        if self.nextTick is None:
+            self.nextTick = now + self.tickLength
+        while self.running:
+            now = timing.monotonic()
+            if end is not None and now >= end:
+                break
+            timeout = max(0.0, self.nextTick - now)
+            if end is not None:
+                timeout = min(timeout, end - now)
+            for fd, readable, writable in self.poller.wait(timeout):
+                if fd == self.listener.fileno():
+                    self.accept()
+                    continue
+                connection = self.connections.get(fd)
+                if connection is None:
+                    continue
+                if readable:
+                    self.read(connection)
+                if writable and fd in self.connections:
+                    self.write(connection)
+
+            if timing.monotonic() >= self.nextTick:
+                self.tick()
+                self.nextTick += self.tickLength
+                if timing.monotonic() > self.nextTick:
+                    # too slow to keep up, skip ahead rather than burst
+                    self.overruns += 1
+                    self.nextTick = timing.monotonic() + self.tickLength
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        for connection in self.connections.values():
+            self.drop(connection)
+        self.poller.unregister(self.listener.fileno())
+        self.listener.close()
+
+    def accept(self):
+        while True:
+            try:
+                sock, address = self.listener.accept()
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = Connection(sock, address)
+            self.connections[connection.fileno()] = connection
+            self.poller.register(connection.fileno())
+
+    def drop(self, connection):
+        if connection.closed:
+            return
+        self.leave(connection)
+        self.poller.unregister(connection.fileno())
+        self.connections.pop(connection.fileno(), None)
+        connection.sock.close()
+        connection.closed = True
+
+    def read(self, connection):
+        try:
+            data = connection.sock.recv(4096)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ""
+        if not data:
+            self.drop(connection)
+            return
+        try:
+            frames, connection.inbuf = readFrames(connection.inbuf + data, MAX_MESSAGE)
+            for message in frames:
+                self.handle(connection, message)
+                # dropped by a send that fell behind
+                if connection.closed:
+                    break
+        except ValueError:
+            # a client that sends garbage is not worth serving
+            self.drop(connection)
+
+    def write(self, connection):
+        try:
+            done = connection.flush()
+        except socket.error:
+            self.drop(connection)
+            return
+        self.poller.register(connection.fileno(), not done)
+
+    def send(self, connection, data):
+        waiting = bool(connection.outbuf)
+        connection.queue(data)
+        if connection.pending > MAX_BUFFER:
+            self.drop(connection)
+        elif not waiting:
+            self.write(connection)
+
+    # one client message, a ValueError if it is not one
+    def handle(self, connection, message):
+        if not message:
+            raise ValueError("empty message")
+        kind = ord(message[0])
+        if kind == JOIN and len(message) == JOIN_MESSAGE.size:
+            self.join(connection, JOIN_MESSAGE.unpack(message)[1])
+        elif kind == TURN and len(message) == TURN_MESSAGE.size:
+            direction = TURN_MESSAGE.unpack(message)[1]
+            if connection.room and direction in DIRECTIONS:
+                connection.room.arena.steer(connection.snake, direction)
+        elif kind == LEAVE and len(message) == 1:
+            self.leave(connection)
+        else:
+            raise ValueError("bad message %d of %d bytes" % (kind, len(message)))
+
+    def join(self, connection, number):
+        if connection.room and connection.room.number != number:
+            self.leave(connection)
+        room = self.rooms.get(number)
+        if room is None:
+            if len(self.rooms) >= MAX_ROOMS:
+                # no room for another room, the client is told by the hangup
+                self.drop(connection)
+                return
+            seed = None if self.seed is None else self.seed + number
+            room = self.rooms[number] = Room(number, self.size, self.size, seed)
+        if connection.snake is None or connection.snake not in room.arena.snakes:
+            connection.snake = room.arena.addSnake()
+        connection.room = room
+        room.clients.add(connection)
+        self.send(connection, room.snapshot(connection))
+
+    def leave(self, connection):
+        room = connection.room
+        if room is None:
+            return
+        if connection.snake is not None:
+            room.arena.removeSnake(connection.snake)
+        room.clients.discard(connection)
+        connection.room = None
+        connection.snake = None
+        if not room.clients:
+            del self.rooms[room.number]
+
+    def tick(self):
+        start = timing.monotonic()
+        for room in self.rooms.values():
+            try:
+                data = room.step()
+            except Exception:
+                # one broken room must not stop the others
+                log.exception("room %d failed, closing it", room.number)
+                for connection in list(room.clients):
+                    self.drop(connection)
+                self.rooms.pop(room.number, None)
+                continue
+            for connection in list(room.clients):
+                self.send(connection, data)
+        self.tickTime.add(timing.monotonic() - start)
+
+
+class Client:
+    """a blocking client that mirrors the state of its room, for tests and
+    bots. receive() applies whatever the server has sent
+    """
+    def __init__(self, host="localhost", port=PORT):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = ""
+        self.room = None
+        self.id = None
+        self.cols = self.rows = 0
+        self.tick = 0
+        self.frames = 0
+        self.snakes = {}
+        self.apples = set()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def join(self, room):
+        self.sock.sendall(frame(JOIN_MESSAGE.pack(JOIN, room)))
+
+    def turn(self, direction):
+        self.sock.sendall(frame(TURN_MESSAGE.pack(TURN, direction)))
+
+    def leave(self):
+        self.sock.sendall(frame(chr(LEAVE)))
+
+    def alive(self):
+        return self.id in self.snakes
+
+    # read and apply frames, waiting up to timeout seconds (None: for ever)
+    # for the first. returns the number of frames applied
+    def receive(self, timeout=0.0):
+        count = 0
+        self.sock.settimeout(timeout)
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise IOError("server closed the connection")
+                frames, self.buffer = readFrames(self.buffer + data)
+                for message in frames:
+                    self.apply(message)
+                count += len(frames)
+                self.sock.settimeout(0.0)
+        except socket.timeout:
+            pass
+        except socket.error as e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        finally:
+            self.sock.settimeout(None)
+        return count
+
+    def apply(self, message):
+        self.frames += 1
+        kind = ord(message[0])
+        if kind == WELCOME:
+            kind, self.room, self.id, self.cols, self.rows = WELCOME_HEAD.unpack_from(message)
+            offset = WELCOME_HEAD.size
+            self.snakes = {}
+            count = COUNT.unpack_from(message, offset)[0]
+            offset += COUNT.size
+            for i in range(count):
+                id, length = SNAKE_HEAD.unpack_from(message, offset)
+                offset += SNAKE_HEAD.size
+                self.snakes[id] = deque(self.tiles(message, offset, length))
+                offset += length * TILE.size
+            count = COUNT.unpack_from(message, offset)[0]
+            offset += COUNT.size
+            self.apples = set(self.tiles(message, offset, count))
+        elif kind == TICK_FRAME:
+            self.tick = TICK_HEAD.unpack_from(message)[1]
+            for change in unpackChanges(message, TICK_HEAD.size):
+                self.change(change)
+
+    def tiles(self, data, offset, count):
+        return [TILE.unpack_from(data, offset + i * TILE.size) for i in range(count)]
+
+    def change(self, change):
+        kind = change[0]
+        if kind == Arena.HEAD:
+            self.snakes[change[1]].appendleft(change[2])
+        elif kind == Arena.TAIL:
+            self.snakes[change[1]].pop()
+        elif kind == Arena.ATE:
+            self.apples.discard(change[2])
+        elif kind == Arena.APPLE:
+            self.apples.add(change[1])
+        elif kind == Arena.DIED:
+            self.snakes.pop(change[1], None)
+        elif kind == Arena.SPAWN:
+            self.snakes[change[1]] = deque(change[2])
+
+
+# loopback load test: a server process with rooms * clients random bots
+def bench(rooms, clients, seconds):
+    import multiprocessing
+    import random
+    conn, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=benchServer, args=(child,))
+    process.start()
+    host, port = conn.recv()
+
+    rng = random.Random(0)
+    bots = {}
+    poller = Poller()
+    for room in range(rooms):
+        for i in range(clients):
+            bot = Client(host, port)
+            bot.join(room)
+            bots[bot.fileno()] = bot
+            poller.register(bot.fileno())
+    for bot in bots.values():
+        bot.receive(1.0)
+    start = dict((fd, bot.tick) for fd, bot in bots.items())
+    end = timing.monotonic() + seconds
+    while timing.monotonic() < end:
+        for fd, readable, writable in poller.wait(0.01):
+            bot = bots[fd]
+            bot.receive()
+            if not bot.alive() and bot.room is not None:
+                bot.join(bot.room)
+            elif rng.random() < 0.2:
+                bot.turn(rng.choice(DIRECTIONS))
+    ticks = [bot.tick - start[fd] for fd, bot in bots.items()]
+    conn.send("stop")
+    for bot in bots.values():
+        bot.close()
+    stats = conn.recv()
+    process.join()
+    print "server: %d ticks, %.2f ms mean and %.2f ms max per tick, %d overruns" % stats
+    print "%d rooms, %d clients: %.0f of %.0f ticks received on average, fewest %d" % (
+        rooms, len(bots), float(sum(ticks)) / len(ticks), seconds / TICK, min(ticks))
+
+
+def benchServer(conn):
+    server = Server("127.0.0.1", 0)
+    conn.send(server.address)
+    while not conn.poll():
+        server.run(0.5)
+    server.close()
+    conn.send((server.tickTime.count, 1000 * server.tickTime.mean(), 1000 * server.tickTime.max, server.overruns))
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="snake multiplayer server")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--size", type=int, default=BOARD_SIZE, help="board width and height in tiles")
+    parser.add_argument("--bench", type=int, metavar="ROOMS", help="run a loopback load test with this many rooms")
+    parser.add_argument("--clients", type=int, default=2, help="bots per room for --bench")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        bench(args.bench, args.clients, args.seconds)
+        return
+    server = Server(args.host, args.port, args.size)
+    print "serving %dx%d rooms on port %d" % (args.size, args.size, server.address[1])
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    server.close()
+
+
+if __name__ == "__main__":
+    main()
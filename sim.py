@@ -0,0 +1,357 @@
+"""headless snake rules. nothing in here touches pygame so games can be
+stepped without a display, e.g. for self play of the computer snakes.
+all positions are (x, y) tile coordinates
+
+Simulation.step is the reference for the rules of a move: the tail moves
+out before the head moves in, so a head may follow its own tail; eating
+an apple grows the snake by one; leaving the board or moving onto a
+snake tile kills; turning back on yourself is ignored. the other games
+each keep their own copy of these rules for speed or for their event
+plumbing, and follow Simulation apart from what is listed here:
+
+    Arena           many snakes moving at once. heads that meet on one
+                    tile all die, a head moving onto another snake's
+                    body (its head included) kills only the mover
+    snake.Snake     the pygame game: snakes move at their own speed on
+                    ticks, queued turns, the Game places several apples.
+                    collisions between snakes follow Arena, a head-on
+                    needs both heads to arrive in the same tick. the
+                    snakes of a tick move one after another though, not
+                    all tails first: a head following another snake's
+                    tail dies if it moves before that snake does
+    state.GameState packed copy for search with undo. apples come from
+                    its own random number generator
+    batch           numpy copy stepping many games at once
+
+a change to the rules goes into Simulation first and then into each of
+these
+"""
+import random
+from collections import deque
+
+DOWN = 1
+UP = 2
+LEFT = 3
+RIGHT = 4
+DIRECTIONS = (DOWN, UP, LEFT, RIGHT)
+
+def opposite(x):
+    if x == 1:
+        return 2
+    elif x == 2:
+        return 1
+    elif x == 3:
+        return 4
+    elif x == 4:
+        return 3
+
+def nextTile(tile, direction):
+    if direction == DOWN:
+        return (tile[0], tile[1] + 1)
+    elif direction == UP:
+        return (tile[0], tile[1] - 1)
+    elif direction == LEFT:
+        return (tile[0] - 1, tile[1])
+    elif direction == RIGHT:
+        return (tile[0] + 1, tile[1])
+    return tile
+
+def inBounds(tile, cols, rows):
+    return 0 <= tile[0] < cols and 0 <= tile[1] < rows
+
+
+class FreeCells:
+    """the empty tiles of a board. while at most half the board is taken
+    only the taken tiles are kept, and a random empty tile is found by
+    drawing tiles until one is free, so a huge empty board costs nothing
+    up front. past that the empty tiles go into a dense list plus a map
+    from tile to its position in the list. tiles are taken and freed by
+    swap remove, so both are O(1) and so is picking a random empty tile
+    """
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.reset()
+
+    def reset(self):
+        self.taken = set()
+        # the dense list and map, None while the board is mostly empty
+        self.cells = None
+        self.position = None
+
+    def densify(self):
+        taken = self.taken
+        self.cells = [(x, y) for y in range(self.rows) for x in range(self.cols) if (x, y) not in taken]
+        self.position = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.taken = None
+
+    def __len__(self):
+        if self.cells is None:
+            return self.cols * self.rows - len(self.taken)
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        if self.cells is None:
+            return inBounds(cell, self.cols, self.rows) and cell not in self.taken
+        return cell in self.position
+
+    def full(self):
+        return len(self) == 0
+
+    # returns False if the tile was not free
+    def take(self, cell):
+        if self.cells is None:
+            if cell in self.taken or not inBounds(cell, self.cols, self.rows):
+                return False
+            self.taken.add(cell)
+            if 2 * len(self.taken) > self.cols * self.rows:
+                self.densify()
+            return True
+        i = self.position.pop(cell, None)
+        if i is None:
+            return False
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.position[last] = i
+        return True
+
+    def takeAll(self, cells):
+        for cell in cells:
+            self.take(cell)
+
+    def free(self, cell):
+        if self.cells is None:
+            self.taken.discard(cell)
+            return
+        if cell in self.position or not inBounds(cell, self.cols, self.rows):
+            return
+        self.position[cell] = len(self.cells)
+        self.cells.append(cell)
+
+    # a uniformly random free tile, None when the board is full
+    def sample(self, rng=random):
+        if self.cells is None:
+            # at least half the tiles are free, two draws on average
+            while True:
+                cell = (rng.randrange(self.cols), rng.randrange(self.rows))
+                if cell not in self.taken:
+                    return cell
+        if not self.cells:
+            return None
+        return self.cells[rng.randrange(len(self.cells))]
+
+
+class Simulation:
+    """a single snake game with one apple, stepped one move at a time.
+    the random number generator is owned by the game so seeded games
+    are reproducible
+    """
+    STATE_RUNNING = 1
+    STATE_OVER = 0
+
+    MOVED = 0
+    ATE = 1
+    DIED = 2
+
+    CAUSE_WALL = "wall"
+    CAUSE_BODY = "body"
+
+    def __init__(self, cols, rows, seed=None, length=3):
+        self.cols = cols
+        self.rows = rows
+        self.length = length
+        self.random = random.Random(seed)
+        self.reset()
+
+    def reset(self):
+        # placed vertically with the head on top, facing up
+        x = self.random.randint(0, self.cols - 1)
+        y = self.random.randint(0, self.rows - self.length)
+        self.body = deque((x, y + i) for i in range(self.length))
+        self.occupied = set(self.body)
+        self.free = FreeCells(self.cols, self.rows)
+        self.free.takeAll(self.body)
+        self.direction = UP
+        self.score = 0
+        self.steps = 0
+        self.state = Simulation.STATE_RUNNING
+        self.cause = None
+        self.apple = None
+        self.placeApple()
+
+    def placeApple(self):
+        self.apple = self.free.sample(self.random)
+        if self.apple:
+            self.free.take(self.apple)
+
+    def head(self):
+        return self.body[0]
+
+    def step(self, direction=None):
+        if self.state == Simulation.STATE_OVER:
+            return Simulation.DIED
+        if direction and direction != opposite(self.direction):
+            self.direction = direction
+
+        self.steps += 1
+        head = nextTile(self.body[0], self.direction)
+        eating = head == self.apple
+        if not eating:
+            # the tail moves out of the way before the head moves in
+            tail = self.body.pop()
+            self.occupied.discard(tail)
+            self.free.free(tail)
+        if not inBounds(head, self.cols, self.rows):
+            self.cause = Simulation.CAUSE_WALL
+        elif head in self.occupied:
+            self.cause = Simulation.CAUSE_BODY
+        if self.cause:
+            self.state = Simulation.STATE_OVER
+            return Simulation.DIED
+
+        self.body.appendleft(head)
+        self.occupied.add(head)
+        self.free.take(head)
+        if eating:
+            self.score += 1
+            self.placeApple()
+            return Simulation.ATE
+        return Simulation.MOVED
+
+
+class ArenaSnake:
+    def __init__(self, id, body, direction=UP):
+        self.id = id
+        # tiles head first
+        self.body = deque(body)
+        self.direction = direction
+        self.score = 0
+        self.alive = True
+
+    def head(self):
+        return self.body[0]
+
+
+class Arena:
+    """many snakes on one board, moving at once (see the rules at the top). owner maps every snake tile to the id of
+    its snake, so a move checks for collisions with any snake in O(1).
+    everything that changes is logged in changes as tuples, for sending
+    the game over the network as deltas:
+
+        (SPAWN, id, body)   a snake joined, body head first
+        (HEAD, id, tile)    a snake's head moved to tile
+        (TAIL, id, tile)    a snake's tail left tile
+        (ATE, id, tile)     a snake ate the apple at tile
+        (APPLE, tile)       an apple was placed
+        (DIED, id)          a snake died and its body was taken off the board
+    """
+    SPAWN = 1
+    HEAD = 2
+    TAIL = 3
+    ATE = 4
+    APPLE = 5
+    DIED = 6
+
+    def __init__(self, cols, rows, seed=None, apples=1, length=3):
+        self.cols = cols
+        self.rows = rows
+        self.length = length
+        self.random = random.Random(seed)
+        self.snakes = {}
+        self.owner = {}
+        self.free = FreeCells(cols, rows)
+        self.apples = set()
+        self.nextId = 1
+        self.steps = 0
+        self.changes = []
+        for i in range(apples):
+            self.placeApple()
+
+    def placeApple(self):
+        tile = self.free.sample(self.random)
+        if tile:
+            self.free.take(tile)
+            self.apples.add(tile)
+            self.changes.append((Arena.APPLE, tile))
+
+    # a vertical spot for a new snake, None if the board is too crowded
+    def findSpot(self, tries=100):
+        for i in range(tries):
+            tile = self.free.sample(self.random)
+            if tile is None:
+                return None
+            body = [(tile[0], tile[1] + j) for j in range(self.length)]
+            if all(cell in self.free for cell in body):
+                return body
+        return None
+
+    # add a snake, returns its id or None when there is no room
+    def addSnake(self):
+        body = self.findSpot()
+        if body is None:
+            return None
+        snake = ArenaSnake(self.nextId, body)
+        self.nextId += 1
+        self.snakes[snake.id] = snake
+        for tile in body:
+            self.owner[tile] = snake.id
+            self.free.take(tile)
+        self.changes.append((Arena.SPAWN, snake.id, list(body)))
+        return snake.id
+
+    def removeSnake(self, id):
+        snake = self.snakes.pop(id, None)
+        if snake is None:
+            return
+        snake.alive = False
+        for tile in snake.body:
+            if self.owner.get(tile) == id:
+                del self.owner[tile]
+                self.free.free(tile)
+        self.changes.append((Arena.DIED, id))
+
+    def steer(self, id, direction):
+        snake = self.snakes.get(id)
+        if snake and direction in DIRECTIONS and direction != opposite(snake.direction):
+            snake.direction = direction
+
+    # move every snake once. all tails move out before any head moves in,
+    # heads that meet on one tile all die
+    def step(self):
+        self.steps += 1
+        heads = {}
+        for snake in self.snakes.values():
+            head = nextTile(snake.body[0], snake.direction)
+            heads.setdefault(head, []).append(snake)
+            if head not in self.apples:
+                tail = snake.body.pop()
+                del self.owner[tail]
+                self.free.free(tail)
+                self.changes.append((Arena.TAIL, snake.id, tail))
+
+        dead = []
+        for head, snakes in heads.items():
+            if len(snakes) > 1 or not inBounds(head, self.cols, self.rows) or head in self.owner:
+                dead.extend(snakes)
+                continue
+            snake = snakes[0]
+            snake.body.appendleft(head)
+            self.owner[head] = snake.id
+            self.changes.append((Arena.HEAD, snake.id, head))
+            if head in self.apples:
+                self.apples.discard(head)
+                snake.score += 1
+                self.changes.append((Arena.ATE, snake.id, head))
+                self.placeApple()
+            else:
+                self.free.take(head)
+        for snake in dead:
+            self.removeSnake(snake.id)
+        return dead
+
+    # the changes logged since the last flush
+    def flush(self):
+        changes = self.changes
+        self.changes = []
+        return changes
@@ -1,29 +1,70 @@
+import logging
 import pygame
 import random
+import anytime
+import hamilton
+import planner
+import scores
+import timing
+from collections import deque, OrderedDict
 from events import *
+from sim import *
 
-DOWN = 1
-UP = 2
-LEFT = 3
-RIGHT = 4
+# the part of the window showing the board
 SCREEN_WIDTH = 500
 SCREEN_HEIGHT = 500
 TILE_WIDTH = 20
 TILE_HEIGHT = 20
-DEBUG = 1
-
-def opposite(x):
-    if x == 1:
-        return 2
-    elif x == 2:
-        return 1
-    elif x == 3:
-        return 4
-    elif x == 4:
-        return 3
+# status line under the board
+HUD_HEIGHT = 24
+APPLES = 1
+# snakes on one board, of which up to len(PLAYER_KEYS) are played from the
+# keyboard
+MAX_PLAYERS = 500
+# the game model works in tiles, only the View deals with pixels. the board
+# can be any size (main() takes --size), the View shows the tiles around
+# the snake it follows
+COLUMNS = 25
+ROWS = 25
+# the camera moves to centre the followed head once it comes this many
+# tiles close to the edge of the view
+CAMERA_MARGIN = 3
+# side length in pixels of the minimap panel right of the board, 0 for
+# none, and seconds between its redraws
+MINIMAP_SIZE = 0
+MINIMAP_PERIOD = 0.5
+# simulation ticks, drawn frames and keyboard polls per second. a snake
+# moving at speed 20 moves every 5th tick, every 75 ms
+TICK_RATE = 1000 / 15.0
+FRAME_RATE = 60
+INPUT_RATE = 250
+# turns a player can key in ahead of the snake, it takes one per move
+TURN_BUFFER = 3
+# most ticks run back to back when the loop has fallen behind
+MAX_CATCHUP = 5
+# how computer snakes pick their moves: path, space, cycle, dstar or async,
+# see AutoSnake. async plans best but takes a process per snake, too many
+# for boards of hundreds of snakes and for tournaments and recordings
+# that already use every core. space plans inline, but only when its
+# apple goes or every planner.RETRY_MOVES moves, and its room checks stop
+# at planner.FLOOD_LIMIT tiles
+AUTOPILOT = "space"
+# A* plans the computer snakes of a game make per tick between them. the
+# rest wait for a later move, taking the cheap one meanwhile
+REPLANS_PER_TICK = 10
+
+# every event posted is logged at DEBUG level, set the level before
+# creating the EventManager
+log = logging.getLogger("snake")
+
+# arrow keys steer the first player, WASD the second
+PLAYER_KEYS = [
+    {pygame.K_UP: UP, pygame.K_DOWN: DOWN, pygame.K_LEFT: LEFT, pygame.K_RIGHT: RIGHT},
+    {pygame.K_w: UP, pygame.K_s: DOWN, pygame.K_a: LEFT, pygame.K_d: RIGHT},
+]
 
 def outOfRange(coords):
-   return coords[0] < 0 or coords[0] > SCREEN_WIDTH or coords[1] < 0 or coords[1] > SCREEN_HEIGHT
+   return not inBounds(coords, COLUMNS, ROWS)
 
 
 def dist(coord1, coord2):
@@ -34,459 +75,1163 @@ def dist(coord1, coord2):
     result = (sq1 + sq2)**(0.5)
     return result
 
-def adjacent(coord):
-    left = (coord[0] - TILE_WIDTH, coord[1])
-    right = (coord[0] + TILE_WIDTH, coord[1])
-    up = (coord[0], coord[1] - TILE_HEIGHT)
-    down = (coord[0], coord[1] + TILE_HEIGHT)
-    
-    adjList = [left, right, up, down]
-
-    result = [tile for tile in adjList if not outOfRange(tile)]
-    return result
-
 
 class EventManager:
     """this object is responsible for coordinating most communication
     between the Model, View, and Controller.
+
+    handlers subscribe to an event class and get every event of that class
+    or a subclass of it. bound methods are held by weak reference, so
+    subscribing does not keep the object alive.
+
+    with deferred set, events posted while another event is being
+    dispatched are queued and delivered in order once it is done, instead
+    of being dispatched in the middle of it.
     """
-    def __init__(self):
-        from weakref import WeakKeyDictionary
-        self.listeners = WeakKeyDictionary()
+    def __init__(self, deferred=False):
+        # event class -> list of (order, weakref to object or None, function)
+        self.handlers = {}
+        # concrete event class -> handlers for it and its base classes
+        self.dispatchTable = {}
+        self.order = 0
+
+        self.deferred = deferred
+        self.queue = deque()
+        self.dispatching = False
+
+        # an instrument.Profiler timing every handler, None for no timing
+        self.profiler = None
+        # checked once here so posting costs nothing when not logging
+        self.trace = log.isEnabledFor(logging.DEBUG)
+
+    #----------------------------------------------------------------------
+    def subscribe( self, eventType, handler ):
+        from weakref import ref
+        if hasattr(handler, "__self__") and handler.__self__ is not None:
+            entry = (self.order, ref(handler.__self__), handler.__func__)
+        else:
+            entry = (self.order, None, handler)
+        self.order += 1
+        self.handlers.setdefault(eventType, []).append(entry)
+        self.dispatchTable.clear()
+
+    #----------------------------------------------------------------------
+    def unsubscribe( self, eventType, handler ):
+        obj = getattr(handler, "__self__", None)
+        func = getattr(handler, "__func__", handler)
+        entries = self.handlers.get(eventType, [])
+        entries[:] = [e for e in entries if not (e[2] == func and (e[1] is None or e[1]() is obj))]
+        self.dispatchTable.clear()
 
     #----------------------------------------------------------------------
     def registerListener( self, listener ):
-        self.listeners[ listener ] = 1
+        """old style listener: listener.notify gets every event"""
+        self.subscribe(Event, listener.notify)
 
     #----------------------------------------------------------------------
     def unregisterListener( self, listener ):
-        if listener in self.listeners.keys():
-            del self.listeners[ listener ]
-        
+        for entries in self.handlers.values():
+            entries[:] = [e for e in entries if e[1] is None or e[1]() is not listener]
+        self.dispatchTable.clear()
+
+    #----------------------------------------------------------------------
+    def removeDead( self ):
+        for entries in self.handlers.values():
+            entries[:] = [e for e in entries if e[1] is None or e[1]() is not None]
+        self.dispatchTable.clear()
+
+    #----------------------------------------------------------------------
+    def handlersFor( self, eventType ):
+        entries = self.dispatchTable.get(eventType)
+        if entries is None:
+            entries = []
+            for cls in eventType.__mro__:
+                entries.extend(self.handlers.get(cls, ()))
+            # subscription order, whichever class the handler asked for
+            entries.sort()
+            self.dispatchTable[eventType] = entries
+        return entries
+
+    #----------------------------------------------------------------------
+    def dispatch( self, event ):
+        if self.profiler is not None:
+            self.dispatchTimed(event)
+            return
+        dead = False
+        for order, obj, func in self.handlersFor(type(event)):
+            if obj is None:
+                func(event)
+                continue
+            obj = obj()
+            if obj is None:
+                dead = True
+            else:
+                func(obj, event)
+        if dead:
+            self.removeDead()
+
+    #----------------------------------------------------------------------
+    def dispatchTimed( self, event ):
+        """dispatch() timing each handler into the profiler"""
+        profiler = self.profiler
+        eventType = type(event)
+        clock = timing.monotonic
+        dead = False
+        for order, obj, func in self.handlersFor(eventType):
+            if obj is not None:
+                obj = obj()
+                if obj is None:
+                    dead = True
+                    continue
+            start = clock()
+            if obj is None:
+                func(event)
+            else:
+                func(obj, event)
+            profiler.add(profiler.handlerName(eventType, obj, func), clock() - start)
+        if dead:
+            self.removeDead()
+
     #----------------------------------------------------------------------
     def post( self, event ):
-        if DEBUG:
+        """Post a new event.  It will be sent to the handlers subscribed to
+        its class or one of its base classes"""
+        if self.trace:
             if not isinstance(event, TickEvent) and not isinstance(event, MoveEvent):
-                print "Message: " + event.name
-        """Post a new event.  It will be broadcast to all listeners"""
-        for listener in self.listeners.keys():
-            #NOTE: If the weakref has died, it will be 
-            #automatically removed, so we don't have 
-            #to worry about it.
-            listener.notify( event )
+                log.debug("Message: %s", event.name)
+        if not self.deferred:
+            self.dispatch(event)
+            return
+
+        self.queue.append(event)
+        if self.dispatching:
+            return
+        self.dispatching = True
+        try:
+            while self.queue:
+                self.dispatch(self.queue.popleft())
+        finally:
+            self.dispatching = False
 
 
 class KeyBoardController:
     def __init__(self, evManager):
         self.evManager = evManager
-        self.evManager.registerListener(self)
-
-    def notify(self, event):
-        if isinstance(event, TickEvent):
-            for event in pygame.event.get():
-                ev = None
-
-                if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                    self.evManager.post(QuitEvent())
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                    ev = GameStartRequest()
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_UP:
-                    direction = UP
-                    ev = MoveRequest(direction)
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_DOWN:
-                    direction = DOWN
-                    ev = MoveRequest(direction)    
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT:
-                    direction = RIGHT
-                    ev = MoveRequest(direction)
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT:
-                    direction = LEFT
-                    ev = MoveRequest(direction)
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
-                    ev = AddPlayerRequest()
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
-                    ev = AddComputerRequest()
-                if ev:
-                    self.evManager.post(ev)
+        self.evManager.subscribe(InputEvent, self.onInput)
+
+    def onInput(self, event):
+        now = timing.monotonic()
+        for event in pygame.event.get():
+            ev = None
+
+            if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                self.evManager.post(QuitEvent())
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                ev = GameStartRequest()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+                ev = AddPlayerRequest()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+                ev = AddComputerRequest()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F12:
+                ev = ProfileDumpRequest()
+            elif event.type == pygame.KEYDOWN:
+                for player, keys in enumerate(PLAYER_KEYS):
+                    if event.key in keys:
+                        ev = MoveRequest(keys[event.key], player, now)
+            if ev:
+                self.evManager.post(ev)
 
 
 class CPUSpinnerController:
-    def __init__(self, evManager):
+    """fixed timestep loop: posts TickEvent at TICK_RATE, FrameEvent at
+    FRAME_RATE and InputEvent at INPUT_RATE, sleeping until whichever is
+    due next. tick deadlines are fixed steps from the start so lateness
+    never accumulates
+    """
+    def __init__(self, evManager, tickRate=TICK_RATE, frameRate=FRAME_RATE, inputRate=INPUT_RATE):
         self.evManager = evManager
-        self.evManager.registerListener(self)
+        self.evManager.subscribe(QuitEvent, self.onQuit)
 
         self.go = 1
-        self.timer = 0
+        self.tickPeriod = 1.0 / tickRate
+        self.framePeriod = 1.0 / frameRate
+        self.inputPeriod = 1.0 / inputRate
+
+        # how late each tick started, in seconds
+        self.jitter = timing.RunningStats()
+        # ticks that started a whole period late, and ticks skipped
+        # because catching up would take more than MAX_CATCHUP ticks
+        self.overruns = 0
+        self.dropped = 0
+        self.frames = 0
+
+        # posted again and again rather than made anew every time
+        self.tickEvent = TickEvent()
+        self.frameEvent = FrameEvent()
+        self.inputEvent = InputEvent()
 
     def run(self):
+        nextTick = timing.monotonic()
+        nextFrame = nextTick
+        nextInput = nextTick
         while self.go:
-            pygame.time.wait(10)
+            now = timing.monotonic()
+            # keys first, so a key pressed just before a tick counts in it
+            if now >= nextInput:
+                self.post(self.inputEvent, "input")
+                nextInput = max(nextInput + self.inputPeriod, now)
+                now = timing.monotonic()
+
+            ticks = 0
+            while self.go and now >= nextTick and ticks < MAX_CATCHUP:
+                late = now - nextTick
+                self.jitter.add(late)
+                if late >= self.tickPeriod:
+                    self.overruns += 1
+                self.post(self.tickEvent, "tick")
+                nextTick += self.tickPeriod
+                ticks += 1
+                now = timing.monotonic()
+
+            if now >= nextTick:
+                skipped = int((now - nextTick) / self.tickPeriod) + 1
+                self.dropped += skipped
+                nextTick += skipped * self.tickPeriod
+
+            if self.go and now >= nextFrame:
+                self.post(self.frameEvent, "frame")
+                self.frames += 1
+                # frames are not caught up, just drawn as soon as possible
+                nextFrame = max(nextFrame + self.framePeriod, now)
+
+            # only ticks are worth spinning for, an input poll or a frame
+            # a fraction of a millisecond late does no harm
+            deadline = min(nextTick, nextFrame, nextInput)
+            timing.sleepUntil(deadline, timing.SPIN if deadline == nextTick else 0.0)
+
+        log.info(self.report())
+        if self.evManager.profiler is not None:
+            log.info("slowest timers\n%s", self.evManager.profiler.report())
+
+    # post event, timed as name when profiling. in deferred mode that
+    # includes every event it sets off
+    def post(self, event, name):
+        profiler = self.evManager.profiler
+        if profiler is None:
+            self.evManager.post(event)
+            return
+        start = timing.monotonic()
+        self.evManager.post(event)
+        profiler.add(name, timing.monotonic() - start)
 
-            import time
-            clock = time.time() * 1000
-            if self.timer < clock:
-                event = TickEvent()
-                self.evManager.post(event)
-                self.timer = clock + 75
+    def stats(self):
+        return {
+            "ticks": self.jitter.count,
+            "frames": self.frames,
+            "jitterMeanMs": 1000 * self.jitter.mean(),
+            "jitterMaxMs": 1000 * self.jitter.max,
+            "overruns": self.overruns,
+            "dropped": self.dropped,
+        }
 
-    def notify(self, event):
-        if isinstance(event, QuitEvent):
-            self.go = 0
+    def report(self):
+        return "ticks %(ticks)d  frames %(frames)d  jitter mean %(jitterMeanMs).3f ms max %(jitterMaxMs).3f ms  overruns %(overruns)d  dropped %(dropped)d" % self.stats()
+
+    def onQuit(self, event):
+        self.go = 0
 
 
 class View:
-    def __init__(self, evManager):
+    """draws the game in the window. with offscreen set it draws into a
+    plain surface instead and never touches pygame.display, so it runs as
+    fast as the drawing allows, and frame() hands out the pixels
+    """
+    def __init__(self, evManager, offscreen=False):
         self.evManager = evManager
-        self.evManager.registerListener(self)
+        self.evManager.subscribe(TickEvent, self.onTick)
+        self.evManager.subscribe(FrameEvent, self.onFrame)
+        self.evManager.subscribe(GameStartedEvent, self.onGameStarted)
+        self.evManager.subscribe(ApplePlaceEvent, self.onApplePlace)
+        self.evManager.subscribe(SnakePlaceEvent, self.onSnakePlace)
+        self.evManager.subscribe(ExtendEvent, self.onExtend)
+        self.evManager.subscribe(MoveEvent, self.onMove)
+        self.evManager.subscribe(SnakeDiedEvent, self.onSnakeDied)
+        self.evManager.subscribe(GameOverEvent, self.onGameOver)
+        self.evManager.subscribe(MenuDisplayRequest, self.onMenuDisplay)
 
         pygame.init()
         clock = pygame.time.Clock()
         clock.tick(10)
 
-        self.window = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("snake")
+        # only the tiles in view are ever drawn, so the cost of a frame
+        # does not depend on the size of the board
+        self.camera = Camera(SCREEN_WIDTH / TILE_WIDTH, SCREEN_HEIGHT / TILE_HEIGHT, COLUMNS, ROWS)
+        self.boardRect = pygame.Rect(0, 0, self.camera.cols * TILE_WIDTH, self.camera.rows * TILE_HEIGHT)
+        width = SCREEN_WIDTH
+        if MINIMAP_SIZE:
+            width += MINIMAP_SIZE + 8
+
+        self.offscreen = offscreen
+        if offscreen:
+            # 32 bits so surfarray can hand out the pixels without a copy
+            self.window = pygame.Surface((width, SCREEN_HEIGHT + HUD_HEIGHT), 0, 32)
+        else:
+            self.window = pygame.display.set_mode((width, SCREEN_HEIGHT + HUD_HEIGHT))
+            pygame.display.set_caption("snake")
         self.background = pygame.Surface(self.window.get_size())
         self.background.fill((0,0,0)) # black
 
+        # window areas drawn since the last frame
+        self.dirtyRects = []
+
+        self.game = None
+        # the snake the camera stays with
+        self.follow = None
+        self.text = TextCache()
+        self.hud = Hud(self.window, self.text, pygame.Rect(0, SCREEN_HEIGHT, width, HUD_HEIGHT))
+        self.minimap = None
+        if MINIMAP_SIZE:
+            self.minimap = Minimap(self.window, pygame.Rect(SCREEN_WIDTH + 4, 4, MINIMAP_SIZE, MINIMAP_SIZE), COLUMNS, ROWS)
+        # score of each snake in the current game, in placement order
+        self.scores = []
+        self.scoreIndex = {}
+        # ticks and frames counted over the last second for the rates shown
+        self.ticks = 0
+        self.frames = 0
+        self.rateStart = timing.monotonic()
+        self.tickRate = 0
+        self.frameRate = 0
+
         self.displayMenu()
 
         self.window.blit(self.background, (0,0))
-        pygame.display.flip()
+        self.present()
 
-        self.snakeSprites = pygame.sprite.RenderUpdates()
-        self.appleSprites = pygame.sprite.RenderUpdates()
+        # tiles are drawn once here and blitted from then on
+        self.snakeImage = snakeTile(self.window)
+        self.appleImage = appleTile(self.window)
 
     def displayMenu(self):
-        font = pygame.font.SysFont("Arial", 30)
+        linesize = self.text.font(30).get_linesize()
         text = """Press SPACE BAR to start"""
-        textImg = font.render( text, 1, (255,255,255))
+        textImg = self.text.render(text, 30, (255,255,255))
         self.background.blit( textImg, (0,0) )
         text = """P for new player"""
-        textImg = font.render(text, 1, (255,255,255))
-        self.background.blit(textImg, (0,font.get_linesize()))
+        textImg = self.text.render(text, 30, (255,255,255))
+        self.background.blit(textImg, (0,linesize))
         text = """C for new computer"""
-        textImg = font.render(text, 1, (255,255,255))
-        self.background.blit(textImg, (0,2*font.get_linesize()))
+        textImg = self.text.render(text, 30, (255,255,255))
+        self.background.blit(textImg, (0,2*linesize))
         self.window.blit(self.background,(0,0))
-        pygame.display.flip()
+        self.hud.invalidate()
+        self.drawHud()
+        self.present()
+
+    def drawHud(self):
+        scores = " ".join(str(score) for score in self.scores) or "-"
+        text = "score %s    ticks %d/s    fps %d" % (scores, self.tickRate, self.frameRate)
+        # mean time from a key to the turn, of the slowest player
+        if self.game:
+            lags = [snake.latency.mean() for player in self.game.players for snake in player.snake if snake.latency.count]
+            if lags:
+                text += "    input %d ms" % (1000 * max(lags))
+        rect = self.hud.draw(text)
+        if rect:
+            self.dirtyRects.append(rect)
+
+    def setScore(self, snake):
+        index = self.scoreIndex.setdefault(id(snake), len(self.scores))
+        if index == len(self.scores):
+            self.scores.append(snake.score)
+        else:
+            self.scores[index] = snake.score
+
+    def tileRect(self, tile):
+        camera = self.camera
+        return pygame.Rect((tile[0] - camera.x) * TILE_WIDTH, (tile[1] - camera.y) * TILE_HEIGHT, TILE_WIDTH, TILE_HEIGHT)
+
+    # tiles out of view are left alone
+    def drawTile(self, tile, image):
+        if not self.camera.visible(tile):
+            return
+        rect = self.tileRect(tile)
+        self.window.blit(image, rect)
+        self.dirtyRects.append(rect)
+
+    def eraseTile(self, tile):
+        if not self.camera.visible(tile):
+            return
+        rect = self.tileRect(tile)
+        self.window.blit(self.background, rect, rect)
+        self.dirtyRects.append(rect)
+
+    # draw everything in view from scratch, after the camera moved
+    def drawBoard(self):
+        self.window.blit(self.background, self.boardRect, self.boardRect)
+        if self.game:
+            board = self.game.board
+            for tile in self.camera.tiles():
+                if tile in board:
+                    self.window.blit(self.snakeImage, self.tileRect(tile))
+            for apple in self.game.apples:
+                if apple.state == Apple.STATE_ACTIVE and self.camera.visible((apple.x, apple.y)):
+                    self.window.blit(self.appleImage, self.tileRect((apple.x, apple.y)))
+        self.dirtyRects.append(self.boardRect)
+
+    # keep the camera on snake, True if it had to move
+    def followSnake(self, snake, centre=False):
+        self.follow = snake
+        if not snake.snakeList:
+            return False
+        if centre:
+            moved = self.camera.centre(snake.snakeList[0])
+        else:
+            moved = self.camera.follow(snake.snakeList[0])
+        if moved:
+            self.drawBoard()
+        return moved
+
+    # the first snake still playing, players before computers
+    def nextFollow(self):
+        if self.game:
+            for snake in self.game.snakes():
+                if snake.state == Snake.STATE_ACTIVE and not snake.dead:
+                    return snake
+        return None
 
     def showSnake(self, snake):
-        for s in snake.snakeList:
-            bodySprite = SnakeSprite(self.snakeSprites)
-            bodySprite.rect.center = s.rect.center
+        for tile in snake.snakeList:
+            self.drawTile(tile, self.snakeImage)
 
     def showApple(self, apple):
-        appleSprite = AppleSprite(self.appleSprites)
-        appleSprite.rect.center = apple.rect.center
+        self.drawTile((apple.x, apple.y), self.appleImage)
 
     def extendSnake(self, snake):
-        snakeSprite = SnakeSprite(self.snakeSprites)
-        snakeSprite.rect.center = snake.snakeList[-1].rect.center
+        self.drawTile(snake.snakeList[-1], self.snakeImage)
+        self.setScore(snake)
 
+    # only the tail that moved out and the new head change
     def moveSnake(self, snake):
-        self.snakeSprites.empty()
+        if snake.lastTail is not None:
+            self.eraseTile(snake.lastTail)
+        self.drawTile(snake.snakeList[0], self.snakeImage)
+
+    # clear a dead snake off the board, except where another snake or an
+    # apple has moved in
+    def removeSnake(self, snake, body):
+        for tile in body:
+            owner = self.game.board.get(tile) if self.game else None
+            if owner is None or owner is snake:
+                self.eraseTile(tile)
+        if self.game:
+            for apple in self.game.apples:
+                if apple.state == Apple.STATE_ACTIVE and (apple.x, apple.y) in body:
+                    self.showApple(apple)
 
-        for s in snake.snakeList:
-            bodySprite = SnakeSprite(self.snakeSprites)
-            bodySprite.rect.center = s.rect.center
-
-    def checkCollision(self):
-        for snake in self.snakeSprites:
-            if pygame.sprite.spritecollide(snake, self.appleSprites, True):
-                ev = AppleEatenEvent()
-                self.evManager.post(ev)
-        
     def gameOver(self):
-        self.snakeSprites.empty()
-        self.appleSprites.empty()
+        self.window.blit(self.background, (0,0))
+        self.dirtyRects.append(self.window.get_rect())
+        self.hud.invalidate()
 
     def clearScreen(self):
         self.background.fill((0,0,0))
         self.window.blit(self.background, (0,0))
-        pygame.display.flip()
+        self.hud.invalidate()
+        self.drawHud()
+        self.present()
+        self.dirtyRects = []
+
+    def onTick(self, event):
+        self.ticks += 1
+
+    def onFrame(self, event):
+        self.frames += 1
+        now = timing.monotonic()
+        if now - self.rateStart >= 1:
+            self.tickRate = self.ticks / (now - self.rateStart)
+            self.frameRate = self.frames / (now - self.rateStart)
+            self.ticks = 0
+            self.frames = 0
+            self.rateStart = now
+
+        profiler = self.evManager.profiler
+        self.drawHud()
+        if self.minimap and self.game and self.game.state == Game.STATE_RUNNING and now - self.minimap.drawn >= MINIMAP_PERIOD:
+            self.dirtyRects.append(self.minimap.draw(self.game, self.camera, now))
+            if profiler is not None:
+                profiler.add("render minimap", timing.monotonic() - now)
+        if self.dirtyRects:
+            if profiler is None:
+                self.present(self.dirtyRects)
+            else:
+                start = timing.monotonic()
+                self.present(self.dirtyRects)
+                profiler.add("display.update", timing.monotonic() - start)
+            self.dirtyRects = []
+
+    # put what was drawn on the screen, all of it or just rects
+    def present(self, rects=None):
+        if self.offscreen:
+            return
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+    # the pixels of the board, or of the whole window with hud set, as a
+    # numpy array of rows x columns x RGB. it is a view of the surface, not
+    # a copy: it changes as the game is drawn, and the surface stays locked
+    # and cannot be drawn on until the array is gone. numpy.array(frame)
+    # keeps a copy
+    def frame(self, hud=False):
+        import pygame.surfarray
+        surface = self.window if hud else self.window.subsurface(self.boardRect)
+        return pygame.surfarray.pixels3d(surface).transpose(1, 0, 2)
+
+    def onGameStarted(self, event):
+        self.game = event.game
+        self.follow = None
+        self.scores = []
+        self.scoreIndex = {}
+        self.clearScreen()
+
+    def onApplePlace(self, event):
+        self.showApple(event.apple)
+
+    def onSnakePlace(self, event):
+        if self.follow is None or self.follow.state != Snake.STATE_ACTIVE:
+            if not self.followSnake(event.snake, centre=True):
+                self.showSnake(event.snake)
+        else:
+            self.showSnake(event.snake)
+        self.setScore(event.snake)
 
-    def notify(self, event):
-        if isinstance(event, TickEvent):
-            self.checkCollision()
+    def onExtend(self, event):
+        self.extendSnake(event.snake)
 
-            self.snakeSprites.clear(self.window, self.background)
-            self.appleSprites.clear(self.window, self.background)
+    def onMove(self, event):
+        if event.snake is self.follow and not event.snake.dead and self.followSnake(event.snake):
+            return
+        self.moveSnake(event.snake)
 
-            self.snakeSprites.update()
-            self.appleSprites.update()
+    def onSnakeDied(self, event):
+        self.removeSnake(event.snake, event.body)
+        if event.snake is self.follow:
+            # watch whoever is left
+            snake = self.nextFollow()
+            if snake is not None:
+                self.followSnake(snake, centre=True)
 
-            dirtyRects1 = self.snakeSprites.draw(self.window)
-            dirtyRects2 = self.appleSprites.draw(self.window)
-            dirtyRects = dirtyRects1 + dirtyRects2
+    def onGameOver(self, event):
+        self.gameOver()
 
-            pygame.display.update(dirtyRects)
-        elif isinstance(event, ApplePlaceEvent):
-            self.showApple(event.apple)
-        elif isinstance(event, SnakePlaceEvent):
-            self.clearScreen()
-            self.showSnake(event.snake)
-        elif isinstance(event, ExtendEvent):
-            self.extendSnake(event.snake)
-        elif isinstance(event, MoveEvent):
-            self.moveSnake(event.snake)
-        elif isinstance(event, GameOverEvent):
-            self.gameOver()
-        elif isinstance(event, MenuDisplayRequest):
-            self.displayMenu()
+    def onMenuDisplay(self, event):
+        self.displayMenu()
 
 
 class Game:
     STATE_PREPARING = 0
     STATE_RUNNING = 1
 
-    def __init__(self, evManager):
+    # scores is a scores.ScoreStore every snake's result goes to, seed the
+    # one the random module was seeded with, for the record. mode is how
+    # the computer snakes play, AUTOPILOT when None
+    def __init__(self, evManager, apples=APPLES, scores=None, seed=None, mode=None):
         self.evManager = evManager
-        self.evManager.registerListener(self)
+        self.evManager.subscribe(MoveEvent, self.onMove)
+        self.evManager.subscribe(SnakeDiedEvent, self.onSnakeDied)
+        self.evManager.subscribe(GameStartRequest, self.onGameStartRequest)
+        self.evManager.subscribe(GameOverEvent, self.onGameOver)
+        self.evManager.subscribe(AddPlayerRequest, self.onAddPlayerRequest)
+        self.evManager.subscribe(AddComputerRequest, self.onAddComputerRequest)
+        self.evManager.subscribe(TickEvent, self.onTick)
         self.state = Game.STATE_PREPARING
 
-        self.maxplayers = 1
+        self.maxplayers = MAX_PLAYERS
         self.players = []
         self.computers = []
-        self.apples = [Apple(evManager)]
+        # tiles with no snake or apple on them, kept up to date as the
+        # snakes move so apples can be placed without searching
+        self.free = FreeCells(COLUMNS, ROWS)
+        # every snake tile and the snake on it, shared by all snakes so a
+        # move checks for collisions with any of them at once
+        self.board = {}
+        self.apples = [Apple(evManager, self.free) for i in range(apples)]
+        # shared by the computer snakes, refilled every tick
+        self.replans = ReplanBudget()
+        self.scores = scores
+        self.seed = seed
+        self.mode = mode
+        self.started = None
+
+    def snakes(self):
+        return [snake for participant in self.players + self.computers for snake in participant.snake]
 
     def Start(self):
+        self.free.reset()
+        self.board.clear()
+        self.started = timing.monotonic()
         ev = GameStartedEvent(self)
         self.evManager.post(ev)
         self.state = Game.STATE_RUNNING
 
+        # snakes go down first so the apples land around them
+        for snake in self.snakes():
+            body = self.findSpot(3)
+            if body is None:
+                continue
+            snake.place(body, self.board)
+            self.free.takeAll(body)
+        for apple in self.apples:
+            apple.placeRandom()
+
+    # free tiles for a new snake standing upright, None if the board is
+    # too crowded
+    def findSpot(self, length, tries=100):
+        for i in range(tries):
+            tile = self.free.sample()
+            if tile is None:
+                return None
+            body = [(tile[0], tile[1] + j) for j in range(length)]
+            if all(cell in self.free for cell in body):
+                return body
+        return None
+
+    def participants(self):
+        return len(self.players) + len(self.computers)
+
     def addPlayer(self):
-        if len(self.players) + len(self.computers) == 0:
-            player = Player(self.evManager)
+        if self.participants() < self.maxplayers and len(self.players) < len(PLAYER_KEYS):
+            player = Player(self.evManager, len(self.players))
             self.players.append(player)
 
     def addComputer(self):
-        if len(self.players) + len(self.computers) == 0:
-            computer = Computer(self.evManager)
+        if self.participants() < self.maxplayers:
+            computer = Computer(self.evManager, self.mode, self.replans)
             self.computers.append(computer)
 
-    def notify(self, event):
-        if isinstance(event, GameStartRequest):
-            if self.state == Game.STATE_PREPARING:
-                self.Start()
-        elif isinstance(event, GameOverEvent):
-            del self.players[:]
-            del self.computers[:]
-            self.state = Game.STATE_PREPARING
-            ev = MenuDisplayRequest()
-            self.evManager.post(ev)
-        elif isinstance(event, AddPlayerRequest):
-            if self.state == Game.STATE_PREPARING:
-                self.addPlayer()
-        elif isinstance(event, AddComputerRequest):
-            if self.state == Game.STATE_PREPARING:
-                self.addComputer()
-        
+    def checkApples(self, snake):
+        head = snake.snakeList[0]
+        for apple in self.apples:
+            if apple.state == Apple.STATE_ACTIVE and (apple.x, apple.y) == head:
+                apple.state = Apple.STATE_INACTIVE
+                snake.extend()
+                self.free.take(snake.snakeList[-1])
+                ev = AppleEatenEvent(apple)
+                self.evManager.post(ev)
+                apple.placeRandom()
+
+    def onMove(self, event):
+        snake = event.snake
+        if self.state == Game.STATE_RUNNING and snake.state == Snake.STATE_ACTIVE:
+            if snake.lastTail is not None and snake.lastTail not in self.board:
+                self.free.free(snake.lastTail)
+            if self.board.get(snake.snakeList[0]) is snake:
+                self.free.take(snake.snakeList[0])
+            if not snake.dead:
+                self.checkApples(snake)
+
+    def appleAt(self, tile):
+        return any(apple.state == Apple.STATE_ACTIVE and (apple.x, apple.y) == tile for apple in self.apples)
+
+    def recordScore(self, snake):
+        if self.scores is None:
+            return
+        controller = snake.mode if isinstance(snake, AutoSnake) else "player"
+        self.scores.record(snake.score, len(snake.snakeList), controller, snake.steps,
+                           timing.monotonic() - self.started, self.seed, COLUMNS, ROWS, snake.cause)
+
+    # take a dead snake off the board, the game is over once none are left
+    def onSnakeDied(self, event):
+        snake = event.snake
+        if self.state != Game.STATE_RUNNING or snake.state != Snake.STATE_ACTIVE:
+            return
+        self.recordScore(snake)
+        for tile in snake.snakeList:
+            if self.board.get(tile) is snake:
+                del self.board[tile]
+                if not self.appleAt(tile):
+                    self.free.free(tile)
+        snake.gameOver()
+        if not any(other.state == Snake.STATE_ACTIVE for other in self.snakes()):
+            self.evManager.post(GameOverEvent())
+
+    def onTick(self, event):
+        self.replans.refill()
+
+    def onGameStartRequest(self, event):
+        if self.state == Game.STATE_PREPARING:
+            self.Start()
+
+    def onGameOver(self, event):
+        del self.players[:]
+        del self.computers[:]
+        self.state = Game.STATE_PREPARING
+        ev = MenuDisplayRequest()
+        self.evManager.post(ev)
+
+    def onAddPlayerRequest(self, event):
+        if self.state == Game.STATE_PREPARING:
+            self.addPlayer()
+
+    def onAddComputerRequest(self, event):
+        if self.state == Game.STATE_PREPARING:
+            self.addComputer()
+
 
 class Player():
-    def __init__(self, evManager):
+    def __init__(self, evManager, number=0):
         self.evManager = evManager
         self.game = None
         self.name = ""
-        self.evManager.registerListener(self)
 
-        self.snake = [Snake(evManager)]
-
-    def notify(self, event):
-        return
+        self.snake = [Snake(evManager, number)]
 
 class Computer():
-    def __init__(self, evManager):
+    def __init__(self, evManager, mode=None, replans=None):
         self.evManager = evManager
         self.game = None
         self.name = ""
-        self.evManager.registerListener(self)
-
-        self.snake = [AutoSnake(evManager)]
 
-    def notify(self, event):
-        return
+        self.snake = [AutoSnake(evManager, mode, replans)]
 
-class SnakeSprite(pygame.sprite.Sprite):
-    def __init__(self, group=None):
-        pygame.sprite.Sprite.__init__(self, group)
+class ReplanBudget:
+    """how many A* plans the computer snakes of a game have left this tick.
+    when many snakes lose their apple at once, e.g. at the start, the plans
+    are spread over the next ticks instead of all landing on one
+    """
+    def __init__(self, perTick=REPLANS_PER_TICK):
+        self.perTick = perTick
+        self.left = perTick
+
+    def refill(self):
+        self.left = self.perTick
+
+    # True if a plan may be made now, counting it
+    def take(self):
+        if self.left <= 0:
+            return False
+        self.left -= 1
+        return True
+
+class TextCache:
+    """fonts are loaded once per size, since SysFont has to search the
+    system fonts, and rendered text is kept in a least recently used cache
+    keyed by (text, size, colour)
+    """
+    def __init__(self, fontName="Arial", maxSurfaces=128):
+        self.fontName = fontName
+        self.maxSurfaces = maxSurfaces
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.SysFont(self.fontName, size)
+            self.fonts[size] = font
+        return font
+
+    def render(self, text, size, colour):
+        key = (text, size, colour)
+        surface = self.surfaces.pop(key, None)
+        if surface is None:
+            surface = self.font(size).render(text, 1, colour)
+            if len(self.surfaces) >= self.maxSurfaces:
+                self.surfaces.popitem(last=False)
+        self.surfaces[key] = surface
+        return surface
+
+
+class Hud:
+    """one line of text in its own strip of the window, only redrawn when
+    the text changes
+    """
+    def __init__(self, window, textCache, rect, size=18, colour=(200,200,200)):
+        self.window = window
+        self.textCache = textCache
+        self.rect = rect
+        self.size = size
+        self.colour = colour
+        self.text = None
+
+    # force a redraw on the next draw(), e.g. after the window was wiped
+    def invalidate(self):
+        self.text = None
+
+    # returns the rect drawn, None if nothing changed
+    def draw(self, text):
+        if text == self.text:
+            return None
+        self.text = text
+        self.window.fill((0,0,0), self.rect)
+        textImg = self.textCache.render(text, self.size, self.colour)
+        self.window.blit(textImg, (self.rect.x + 4, self.rect.y + (self.rect.height - textImg.get_height()) / 2))
+        return self.rect
 
-        snakeSurface = pygame.Surface((TILE_WIDTH,TILE_HEIGHT))
-        snakeSurface = snakeSurface.convert_alpha()
-        snakeSurface.fill((255,255,255))
-        pygame.draw.rect(snakeSurface, (0,0,0), snakeSurface.get_rect(), 1)
 
-        self.image = snakeSurface
-        self.rect = snakeSurface.get_rect()
+class Camera:
+    """the tiles in view, cols x rows of them from (x, y), always inside a
+    board of boardCols x boardRows. smaller boards are shown whole
+    """
+    def __init__(self, cols, rows, boardCols, boardRows, margin=CAMERA_MARGIN):
+        self.cols = min(cols, boardCols)
+        self.rows = min(rows, boardRows)
+        self.boardCols = boardCols
+        self.boardRows = boardRows
+        self.margin = margin
+        self.x = 0
+        self.y = 0
+
+    def visible(self, tile):
+        return self.x <= tile[0] < self.x + self.cols and self.y <= tile[1] < self.y + self.rows
+
+    def tiles(self):
+        for y in range(self.y, self.y + self.rows):
+            for x in range(self.x, self.x + self.cols):
+                yield (x, y)
+
+    # put tile in the middle, as far as the board edges allow. True if the
+    # view moved
+    def centre(self, tile):
+        x = max(0, min(tile[0] - self.cols / 2, self.boardCols - self.cols))
+        y = max(0, min(tile[1] - self.rows / 2, self.boardRows - self.rows))
+        moved = (x, y) != (self.x, self.y)
+        self.x, self.y = x, y
+        return moved
+
+    # jump to centre tile once it is within margin of an edge of the view,
+    # not every move, so the whole view is redrawn only now and then
+    def follow(self, tile):
+        marginX = min(self.margin, (self.cols - 1) / 2)
+        marginY = min(self.margin, (self.rows - 1) / 2)
+        if self.x + marginX <= tile[0] < self.x + self.cols - marginX and self.y + marginY <= tile[1] < self.y + self.rows - marginY:
+            return False
+        return self.centre(tile)
+
+
+class Minimap:
+    """the whole board shrunk into rect, a pixel per tile or less, with a
+    frame around the part the camera shows. redrawn from the snake and
+    apple tiles only, so its cost grows with the snakes, not the board
+    """
+    def __init__(self, window, rect, cols, rows):
+        self.window = window
+        self.rect = rect
+        self.scale = min(float(rect.width) / cols, float(rect.height) / rows)
+        self.dot = max(1, int(self.scale))
+        self.area = pygame.Rect(rect.x, rect.y, int(cols * self.scale) or 1, int(rows * self.scale) or 1)
+        # when it was last drawn
+        self.drawn = 0
+
+    def point(self, tile):
+        return (self.area.x + int(tile[0] * self.scale), self.area.y + int(tile[1] * self.scale))
+
+    # returns the rect drawn
+    def draw(self, game, camera, now=0):
+        self.drawn = now
+        self.window.fill((0,0,0), self.rect)
+        self.window.fill((40,40,40), self.area)
+        size = (self.dot, self.dot)
+        for tile in game.board:
+            self.window.fill((255,255,255), (self.point(tile), size))
+        for apple in game.apples:
+            if apple.state == Apple.STATE_ACTIVE:
+                self.window.fill((255,0,0), (self.point((apple.x, apple.y)), size))
+        x, y = self.point((camera.x, camera.y))
+        view = pygame.Rect(x, y, max(2, int(camera.cols * self.scale)), max(2, int(camera.rows * self.scale)))
+        pygame.draw.rect(self.window, (0,200,0), view, 1)
+        return self.rect
+
+
+# tiles are converted to the pixel format of the surface they go on, so
+# blits need no conversion. convert(window) works offscreen too, convert()
+# needs a display
+def snakeTile(window):
+    snakeSurface = pygame.Surface((TILE_WIDTH,TILE_HEIGHT))
+    snakeSurface = snakeSurface.convert(window)
+    snakeSurface.fill((255,255,255))
+    pygame.draw.rect(snakeSurface, (0,0,0), snakeSurface.get_rect(), 1)
+    return snakeSurface
 
 class Snake:
     STATE_ACTIVE = 1
     STATE_INACTIVE = 0
 
-    def __init__(self, evManager):
+    def __init__(self, evManager, player=0):
         self.evManager = evManager
-        self.evManager.registerListener(self)
+        self.evManager.subscribe(TickEvent, self.onTick)
+        self.evManager.subscribe(MoveRequest, self.onMoveRequest)
+        self.evManager.subscribe(GameOverEvent, self.onGameOver)
 
         self.state = Snake.STATE_INACTIVE
-        self.snakeList = []
+        # which keys steer this snake, see PLAYER_KEYS
+        self.player = player
+        # body tiles head first, with a set of the same tiles for collisions
+        self.snakeList = deque()
+        self.occupied = set()
+        # the Game's board of all snake tiles, None when playing alone
+        self.board = None
+        # hit something, waiting for the Game to take it off the board
+        self.dead = False
+        # moves left that grow the snake instead of moving its tail
+        self.growth = 0
+        # moves made, and what killed it: wall, body, snake or trapped
+        self.steps = 0
+        self.cause = None
+        self.direction = UP
+        # the tile the tail left on the last move, where extend() grows into
+        self.lastTail = None
+        # posted on every move, made on the first one
+        self.moveEvent = None
         self.score = len(self.snakeList)
 
+        # percent of a move made per tick
         self.speed = 20
         self.counter = 0
-
-        #to prevent multiple keypresses at once
-        self.moved = True
-
-    def changeBodyDirection(self, direction):
+        # ticks since the snake was placed and the tick of its last move.
+        # the snakes of a game are placed together, so these line up
+        # between them
+        self.ticks = 0
+        self.movedAt = None
+
+        # turns not made yet, (direction, time the key was seen or None),
+        # one is taken per move so quick turns in a row all happen
+        self.turns = deque()
+        # seconds from a key to the move that made its turn
+        self.latency = timing.Histogram()
+
+    # queue a turn after the ones already queued. turning back on itself or
+    # the way it is already going is dropped, and so is anything past
+    # TURN_BUFFER turns ahead
+    def changeHeadDirection(self, direction, pressed=None):
         if self.state == Snake.STATE_INACTIVE:
             return
-        elif direction == opposite(self.snakeList[0].direction):
+        last = self.turns[-1][0] if self.turns else self.direction
+        if direction == last or direction == opposite(last):
             return
-
-        self.snakeList[0].prevDirection = self.snakeList[0].direction
-        self.snakeList[0].direction = direction
-        for i in range(1, len(self.snakeList)):
-            self.snakeList[i].prevDirection = self.snakeList[i].direction
-            self.snakeList[i].direction = self.snakeList[i - 1].prevDirection
-
-    def changeHeadDirection(self, direction):
-        if self.state == Snake.STATE_INACTIVE:
-            return
-        elif direction == opposite(self.snakeList[0].direction):
-            return
-        elif self.moved == False:
+        if len(self.turns) >= TURN_BUFFER:
             return
+        self.turns.append((direction, pressed))
 
-        self.snakeList[0].prevDirection = self.snakeList[0].direction
-        self.snakeList[0].direction = direction
-        self.moved = False
-
+    # take the next queued turn, if any
+    def turn(self):
+        if not self.turns:
+            return
+        self.direction, pressed = self.turns.popleft()
+        if pressed is not None:
+            lag = timing.monotonic() - pressed
+            self.latency.add(lag)
+            profiler = self.evManager.profiler
+            if profiler is not None:
+                profiler.add("input latency", lag)
+
+    # advance the move counter, True when a move is due this tick
+    def due(self):
+        self.ticks += 1
+        self.counter += self.speed
+        if self.counter >= 100:
+            self.counter -= 100
+            return True
+        return False
+
+    # tiles the autopilot has to steer around
+    def blocked(self):
+        if self.board is None:
+            return self.occupied
+        return self.board
+
+    # the tiles of the other snakes, for the planner checks that move this
+    # snake's body about
+    def others(self):
+        if self.board is None:
+            return planner.NOTHING
+        return planner.Others(self.board, self)
+
+    # one move by the rules of sim.Simulation, see the top of sim.py for
+    # how many snakes on a board differ
     def move(self):
-        if self.state == Snake.STATE_ACTIVE:
-            for snake in self.snakeList:
-                snake.move()
-
-            # deprecated speed control method
-            # self.counter += self.speed
-            # if self.counter >= 100:
-            #     self.counter = 0
-            #     self.moved = True
-            #     ev = MoveEvent(self)
-            #     self.evManager.post(ev)
-            #     self.changeBodyDirection(self.snakeList[0].direction)
-
-            self.moved = True
-            ev = MoveEvent(self)
-            self.evManager.post(ev)
-            self.changeBodyDirection(self.snakeList[0].direction)
+        if self.state == Snake.STATE_ACTIVE and not self.dead:
+            self.turn()
+            board = self.board
+            head = nextTile(self.snakeList[0], self.direction)
+            if self.growth:
+                self.growth -= 1
+                self.lastTail = None
+            else:
+                # the tail moves out of the way before the head moves in
+                self.lastTail = self.snakeList.pop()
+                self.occupied.discard(self.lastTail)
+                if board is not None and board.get(self.lastTail) is self:
+                    del board[self.lastTail]
 
             #collision check
-            headrect = self.snakeList[0].rect
-            if headrect.x < 0 or headrect.y < 0 or headrect.x > SCREEN_WIDTH - TILE_WIDTH or headrect.y > SCREEN_HEIGHT - TILE_HEIGHT:
-                ev = GameOverEvent()
-                self.evManager.post(ev)
+            other = board.get(head) if board is not None else None
+            cause = None
+            if outOfRange(head):
+                cause = "wall"
+            elif head in self.occupied:
+                cause = "body"
+            elif other is not None:
+                cause = "snake"
+            if other is not None and other.movedAt == self.ticks and other.snakeList[0] == head:
+                # head on: both heads came onto the tile this tick, both go.
+                # a head that was there before is only in the way, as in
+                # sim.Arena where all snakes move at once
+                other.die("snake")
+            self.snakeList.appendleft(head)
+            self.occupied.add(head)
+            if board is not None and cause is None:
+                board[head] = self
+            self.steps += 1
+            self.movedAt = self.ticks
+
+            ev = self.moveEvent
+            if ev is None:
+                ev = self.moveEvent = MoveEvent(self)
+            self.evManager.post(ev)
 
-            for i in range(1, len(self.snakeList)):
-                if headrect.colliderect(self.snakeList[i].rect):
-                    ev = GameOverEvent()
-                    self.evManager.post(ev)
-                    return
+            if cause is not None:
+                self.die(cause)
 
+    def die(self, cause=None):
+        if self.dead:
+            return
+        self.dead = True
+        self.cause = cause
+        if self.board is None:
+            # nobody else to play on
+            self.evManager.post(GameOverEvent())
+        else:
+            self.evManager.post(SnakeDiedEvent(self))
 
-    def placeRandom(self, length):
+    # put the snake down on body, head first, facing up
+    def place(self, body, board=None):
         if self.state == Snake.STATE_INACTIVE:
-            x = random.randint(0, SCREEN_WIDTH - TILE_WIDTH)
-            y = random.randint(0, SCREEN_HEIGHT - TILE_HEIGHT)
-            x = x - x%TILE_WIDTH
-            y = y - y%TILE_HEIGHT
-
-            for i in range(length):
-                self.snakeList.append(SnakePiece(x, y + TILE_HEIGHT * i, UP, self.speed, self.counter))
+            self.snakeList.extend(body)
+            self.occupied.update(body)
+            self.board = board
+            if board is not None:
+                for tile in body:
+                    board[tile] = self
+            self.direction = UP
+            self.turns.clear()
+            self.latency = timing.Histogram()
+            self.lastTail = None
+            self.dead = False
+            self.growth = 0
+            self.steps = 0
+            self.ticks = 0
+            self.movedAt = None
+            self.cause = None
             self.state = Snake.STATE_ACTIVE
             ev = SnakePlaceEvent(self)
             self.evManager.post(ev)
 
+    def placeRandom(self, length):
+        x = random.randint(0, COLUMNS - 1)
+        y = random.randint(0, ROWS - length)
+        self.place([(x, y + i) for i in range(length)])
+
     def extend(self):
-        def calculateExtend(x, y, direction):
-            if direction == UP:
-                return (x, y + TILE_HEIGHT)
-            elif direction == DOWN:
-                return (x, y - TILE_HEIGHT)
-            elif direction == LEFT:
-                return (x + TILE_WIDTH, y)
-            elif direction == RIGHT:
-                return (x - TILE_WIDTH, y)
-        
-        lastSnake = self.snakeList[-1]
-        coords = calculateExtend(lastSnake.rect.x, lastSnake.rect.y, lastSnake.direction)
-        snakePiece = SnakePiece(coords[0], coords[1], lastSnake.direction, self.speed, self.counter)
-        self.snakeList.append(snakePiece)
+        tail = self.lastTail
+        if tail is None or (self.board is not None and tail in self.board):
+            # no tail left behind on this move, or another snake moved in
+            # behind: keep the tail on the next move instead, as
+            # sim.Simulation does
+            self.growth += 1
+        else:
+            self.snakeList.append(tail)
+            self.occupied.add(tail)
+            if self.board is not None:
+                self.board[tail] = self
+        self.lastTail = None
         self.score += 1
 
         ev = ExtendEvent(self)
         self.evManager.post(ev)
 
     def gameOver(self):
-        del self.snakeList[:]
+        if self.latency.count:
+            log.info("player %d input latency: mean %.1f ms, p99 %.1f ms, max %.1f ms over %d turns", self.player,
+                     1000 * self.latency.mean(), 1000 * self.latency.percentile(0.99), 1000 * self.latency.max, self.latency.count)
+        self.snakeList.clear()
+        self.occupied.clear()
+        self.turns.clear()
         self.counter = 0
+        self.board = None
+        # the event refers back to the snake, let it go with the game
+        self.moveEvent = None
         self.state = Snake.STATE_INACTIVE
 
-    def notify(self,event):
-        if isinstance(event, TickEvent):
+    def onTick(self, event):
+        if self.state == Snake.STATE_ACTIVE and self.due():
             self.move()
-        elif isinstance(event, GameStartedEvent):
-            self.placeRandom(3)
-        elif isinstance(event, MoveRequest):
-            self.changeHeadDirection(event.direction)
-        elif isinstance(event, AppleEatenEvent):
-            self.extend()
-        elif isinstance(event, GameOverEvent):
-            self.gameOver()
+
+    def onMoveRequest(self, event):
+        if event.player == self.player:
+            self.changeHeadDirection(event.direction, event.time)
+
+    def onGameOver(self, event):
+        self.gameOver()
 
 
 class AutoSnake(Snake):
-    def __init__(self, evManager):
+    # path: follow the A* path to the apple
+    # space: only take a path that leaves room to move on after eating,
+    #        otherwise chase the tail and try again every few moves
+    # cycle: follow a hamiltonian cycle of the board, with shortcuts
+    # dstar: keep a shortest path to the apple, repaired after every move
+    # async: plan like space in a background process between moves, a due
+    #        move waits at most anytime.PLAN_BUDGET for it
+    MODE_PATH = "path"
+    MODE_SPACE = "space"
+    MODE_CYCLE = "cycle"
+    MODE_DSTAR = "dstar"
+    MODE_ASYNC = "async"
+
+    # replans is the Game's ReplanBudget, None to plan whenever needed
+    def __init__(self, evManager, mode=None, replans=None):
         Snake.__init__(self, evManager)
+        self.evManager.subscribe(ApplePlaceEvent, self.onApplePlace)
+        self.evManager.subscribe(AppleEatenEvent, self.onAppleEaten)
         self.speed = 25
+        self.mode = mode or AUTOPILOT
+        self.replans = replans
+        # every apple on the board and its tile, and the one gone for: the
+        # nearest when it was picked. only losing it or a nearer apple
+        # turning up makes a new plan
+        self.apples = {}
         self.appleLocation = ()
         self.path = []
+        self.retry = 0
+        self.cycle = None
+        self.dstar = None
+        if self.mode == AutoSnake.MODE_CYCLE:
+            self.cycle = hamilton.loadCycle(COLUMNS, ROWS)
+        self.worker = None
+        # the worker has not been asked about the current position yet
+        self.stale = True
+        if self.mode == AutoSnake.MODE_ASYNC:
+            self.worker = anytime.PlannerProcess()
 
     # return list of tiles adjacent to snake head
     def getAdjacent(self):
-        x = self.snakeList[0].rect.x
-        y = self.snakeList[0].rect.y
-
-        up = (x, y - TILE_HEIGHT)
-        down = (x, y + TILE_HEIGHT)
-        left = (x - TILE_WIDTH, y)
-        right = (x + TILE_HEIGHT, y)
-
-        return [up, down, left, right]
+        head = self.snakeList[0]
+        return [nextTile(head, direction) for direction in (UP, DOWN, LEFT, RIGHT)]
 
 
     def closestNeighbor(self, dest):
-        distDict = {}
-        adjList = self.getAdjacent()
-        for adj in adjList:
-            distDict[adj] = dist(adj, dest)
-
-        for snake in self.snakeList:
-            distDict.pop((snake.rect.x, snake.rect.y), False)
-        for coords in distDict.keys():
-            if outOfRange(coords):
-                del distDict[coords]
-
-        try:
-            result = min(distDict, key = distDict.get)
-            return result
-        except:
-            print "Dead end!"
-            self.evManager.post(GameOverEvent())
+        result = planner.closestNeighbor(self.snakeList[0], dest, self.blocked(), COLUMNS, ROWS)
+        if result is None:
+            log.info("dead end")
+            self.die("trapped")
+        return result
 
     # returns direction toward tile
     def getDirection(self, dest): 
         if self.state == Snake.STATE_ACTIVE:       
-            x = self.snakeList[0].rect.x
-            y = self.snakeList[0].rect.y
+            x, y = self.snakeList[0]
 
             if dest[0] > x:
                 return RIGHT
@@ -499,166 +1244,268 @@ class AutoSnake(Snake):
 
     def greedy(self, dest):
         closest = self.closestNeighbor(dest)
+        if closest is None:
+            return
         newDir = self.getDirection(closest)
         self.changeHeadDirection(newDir)
 
-    # return list of steps from dest --> source
+    # return list of steps from source --> dest
     def dijkstra(self, dest):
         if self.state == Snake.STATE_INACTIVE:
             return None
 
-        graph = {} # (x, y) : distance
-
-        # initialize graph
-        from sys import maxint
-        for y in range(0, SCREEN_HEIGHT, TILE_HEIGHT):
-            for x in range(0, SCREEN_WIDTH, TILE_WIDTH):
-                graph[(x, y)] = maxint
-        # remove tiles blocked by itself
-        for snake in self.snakeList[1:]:
-            graph.pop((snake.rect.x, snake.rect.y), None)
-
-        prevList = dict.fromkeys(graph.keys())
-
-        source = (self.snakeList[0].rect.x, self.snakeList[0].rect.y)
-        graph[source] = 0
-
-        while graph:
-            u = min(graph, key = graph .get)
-            if u == dest:
-                break
-            if graph[u] == None:
-                print "Nowhere to go"
-                break
-
-            adj = adjacent(u)
-            for neighbor in adj:
-                if neighbor in graph:
-                    alt = graph[u] + dist(u, neighbor)
-                    if alt < graph[neighbor]:
-                        graph[neighbor] = alt
-                        prevList[neighbor] = u
-
-            del graph[u]
-
-        S = []
-        u = dest
-        try:
-            while prevList[u] != None:
-                S.append(u)
-                u = prevList[u]
-        except:
-            return None
-        
-        return S[::-1]
+        # the head is the search source, so the whole body can be passed as blocked
+        S = planner.astar(self.snakeList[0], dest, self.blocked(), COLUMNS, ROWS)
+        if S is None:
+            log.debug("nowhere to go")
+        return S
+
+    # the nearest apple to the head, () if there are none
+    def nearestApple(self):
+        if not self.apples or not self.snakeList:
+            return ()
+        head = self.snakeList[0]
+        return min(self.apples.values(), key=lambda tile: planner.manhattan(head, tile))
+
+    # go for tile from the next move on, planning for it then
+    def setTarget(self, tile):
+        if tile == self.appleLocation:
+            return
+        self.appleLocation = tile
+        self.stale = True
+        self.dstar = None
+        self.path = []
+        self.retry = 0
+
+    # one of the game's plans for this tick, if any are left
+    def mayPlan(self):
+        return self.replans is None or self.replans.take()
+
+    def planPath(self):
+        if not self.mayPlan():
+            # try again on the next move
+            self.path = []
+            self.retry = 0
+            return
+        self.path = self.dijkstra(self.appleLocation)
+        self.retry = planner.RETRY_MOVES
+        if self.mode in (AutoSnake.MODE_SPACE, AutoSnake.MODE_DSTAR) and self.path:
+            if not planner.hasRoom(planner.advance(self.snakeList, self.path), COLUMNS, ROWS, others=self.others()):
+                self.path = None
+
+    def chaseTail(self):
+        step = planner.chaseTail(self.snakeList, COLUMNS, ROWS, others=self.others())
+        if step is None:
+            log.info("dead end")
+            self.die("trapped")
+            return
+        self.changeHeadDirection(self.getDirection(step))
 
     def autopilot(self, dest):
+        if self.mode == AutoSnake.MODE_CYCLE:
+            tile = self.cycle.nextTile(self.snakeList, dest, self.blocked())
+            if tile is not None:
+                self.changeHeadDirection(self.getDirection(tile))
+            return
+
+        if self.mode == AutoSnake.MODE_ASYNC:
+            if self.stale:
+                self.requestPlan()
+            path = self.worker.result()
+            head = self.snakeList[0]
+            step = path[0] if path else None
+            if step in planner.neighbors(head, COLUMNS, ROWS) and (step not in self.blocked() or step == self.snakeList[-1]):
+                self.changeHeadDirection(self.getDirection(step))
+            else:
+                # the worker missed the deadline, take the cheap move
+                self.greedy(dest or head)
+            return
+
+        if self.mode == AutoSnake.MODE_DSTAR and not self.alone():
+            # D* Lite only hears about this snake's moves, the tiles other
+            # snakes take and free would leave its tree stale. plan like
+            # space mode while they are about
+            self.dstar = None
+            if not self.path and not self.spacePath():
+                return
+        elif self.mode == AutoSnake.MODE_DSTAR:
+            head = self.snakeList[0]
+            if self.dstar is None and self.appleLocation and self.mayPlan():
+                self.dstar = planner.DStarLite(head, self.appleLocation, self.blocked(), COLUMNS, ROWS)
+            elif self.dstar and self.dstar.start != head:
+                # the head moved in and the last tail moved out
+                self.dstar.move(head, [head, self.lastTail])
+            if self.dstar and self.dstar.reachable():
+                self.changeHeadDirection(self.getDirection(self.dstar.nextTile()))
+            else:
+                self.chaseTail()
+            return
+
+        if self.mode == AutoSnake.MODE_SPACE and not self.path and not self.spacePath():
+            return
+        if self.mode == AutoSnake.MODE_PATH and not self.path:
+            self.retry -= 1
+            if self.retry <= 0 and self.appleLocation:
+                self.planPath()
+
+        if self.path and self.path[0] == self.snakeList[0]:
+            self.path.pop(0)
         if not self.path:
             self.greedy(dest)
         else:
-            curLocation = (self.snakeList[0].rect.x, self.snakeList[0].rect.y)            
-            if self.path[0] == curLocation:
-                self.path.pop(0)
             self.greedy(self.path[0])
 
-    def notify(self, event):
-        if isinstance(event, TickEvent):
-            if self.state == Snake.STATE_ACTIVE:
+    # with no path to follow, try for the apple every few moves and chase
+    # the tail meanwhile. False when the move is made already
+    def spacePath(self):
+        self.retry -= 1
+        if self.retry <= 0 and self.appleLocation:
+            self.planPath()
+        if not self.path:
+            self.chaseTail()
+            return False
+        return True
+
+    # no other snake on the board
+    def alone(self):
+        return self.board is None or len(self.board) == len(self.snakeList)
+
+    def requestPlan(self):
+        self.worker.request(self.snakeList, self.appleLocation or None, COLUMNS, ROWS, self.others())
+        self.stale = False
+
+    def gameOver(self):
+        Snake.gameOver(self)
+        self.apples.clear()
+        self.appleLocation = ()
+        if self.worker:
+            self.worker.stop()
+            self.worker = None
+
+    def onTick(self, event):
+        if self.state != Snake.STATE_ACTIVE:
+            return
+        profiler = self.evManager.profiler
+        if self.due():
+            if not self.appleLocation and self.apples:
+                # placed after the apples were
+                self.setTarget(self.nearestApple())
+            if profiler is None:
+                self.autopilot(self.appleLocation)
+            else:
+                start = timing.monotonic()
                 self.autopilot(self.appleLocation)
-                self.move()
-        elif isinstance(event, ApplePlaceEvent):
-            self.appleLocation = (event.apple.rect.x, event.apple.rect.y)
-            self.path = self.dijkstra(self.appleLocation)
-        elif isinstance(event, GameStartedEvent):
-            Snake.placeRandom(self, 3)
-        elif isinstance(event, AppleEatenEvent):
-            self.extend()
-        elif isinstance(event, GameOverEvent):
-            self.gameOver()
-
-
-class SnakePiece:
-    def __init__(self, x, y, direction, speed, counter):
-        self.rect = pygame.Rect(x, y, TILE_WIDTH, TILE_HEIGHT)
-        self.direction = direction
-        self.prevDirection = None
-        self.speed = speed
-        self.counter = counter
+                profiler.add("planner " + self.mode, timing.monotonic() - start)
+            self.move()
+            self.stale = True
+        elif self.worker and self.stale:
+            # the last move has played out, plan the next one meanwhile
+            self.requestPlan()
+
+    # apples are kept by Apple, not tile: with a deferred EventManager the
+    # eaten apple has been placed again by the time its event comes
+    def onApplePlace(self, event):
+        tile = (event.apple.x, event.apple.y)
+        self.apples[event.apple] = tile
+        if self.state != Snake.STATE_ACTIVE:
+            return
+        head = self.snakeList[0]
+        if not self.appleLocation or planner.manhattan(head, tile) < planner.manhattan(head, self.appleLocation):
+            self.setTarget(tile)
 
-    def move(self):
-        # deprecated speed control method
-        # self.counter += self.speed
-
-        # if self.counter >= 100:
-        #     if self.direction == DOWN:
-        #         self.rect.y += TILE_HEIGHT
-        #     elif self.direction == UP:
-        #         self.rect.y -= TILE_HEIGHT
-        #     elif self.direction == LEFT:
-        #         self.rect.x -= TILE_WIDTH
-        #     elif self.direction == RIGHT:
-        #         self.rect.x += TILE_WIDTH
-        #     self.counter = 0
-
-        if self.direction == DOWN:
-                self.rect.y += TILE_HEIGHT
-        elif self.direction == UP:
-            self.rect.y -= TILE_HEIGHT
-        elif self.direction == LEFT:
-            self.rect.x -= TILE_WIDTH
-        elif self.direction == RIGHT:
-            self.rect.x += TILE_WIDTH
-
-class AppleSprite(pygame.sprite.Sprite):
-    def __init__(self, group = None):
-        pygame.sprite.Sprite.__init__(self,group)
-
-        appleSurface = pygame.Surface((TILE_WIDTH,TILE_HEIGHT))
-        appleSurface = appleSurface.convert_alpha()
-        appleSurface.fill((0,0,0))
-        pygame.draw.circle(appleSurface, (255,0,0), (TILE_WIDTH/2, TILE_HEIGHT/2), TILE_WIDTH/2)
-
-        self.image = appleSurface
-        self.rect = appleSurface.get_rect()
+    def onAppleEaten(self, event):
+        tile = self.apples.pop(event.apple, None)
+        if tile is not None and tile == self.appleLocation and self.state == Snake.STATE_ACTIVE:
+            self.setTarget(self.nearestApple())
+
+    def onMoveRequest(self, event):
+        # steered by autopilot, not the keyboard
+        return
+
+
+def appleTile(window):
+    appleSurface = pygame.Surface((TILE_WIDTH,TILE_HEIGHT))
+    appleSurface = appleSurface.convert(window)
+    appleSurface.fill((0,0,0))
+    pygame.draw.circle(appleSurface, (255,0,0), (TILE_WIDTH/2, TILE_HEIGHT/2), TILE_WIDTH/2)
+    return appleSurface
 
 
 class Apple:
     STATE_ACTIVE = 1
     STATE_INACTIVE = 0
 
-    def __init__(self, evManager):
+    def __init__(self, evManager, free):
         self.evManager = evManager
-        self.evManager.registerListener(self)
+        self.evManager.subscribe(GameOverEvent, self.onGameOver)
         self.state = self.STATE_INACTIVE
+        self.free = free
 
+    # placed by the Game on an empty tile, left inactive if the board is full
     def placeRandom(self):
-        x = random.randint(0, SCREEN_WIDTH - TILE_WIDTH)
-        y = random.randint(0, SCREEN_HEIGHT - TILE_HEIGHT)
-        x = x - x%TILE_WIDTH
-        y = y - y%TILE_HEIGHT
-        self.rect = pygame.Rect(x, y, TILE_WIDTH, TILE_HEIGHT)
-        self.state = Snake.STATE_ACTIVE
+        tile = self.free.sample(random)
+        if tile is None:
+            self.state = self.STATE_INACTIVE
+            return
+        self.free.take(tile)
+        self.x, self.y = tile
+        self.state = self.STATE_ACTIVE
         ev = ApplePlaceEvent(self)
         self.evManager.post(ev)
 
-    def notify(self, event):
-        if isinstance(event, GameStartedEvent) or isinstance(event, AppleEatenEvent):
-            self.placeRandom()
-        elif isinstance(event, GameOverEvent):
-            self.state = self.STATE_INACTIVE
-        # elif isinstance(event, RestartEvent) and self.state == self.STATE_INACTIVE:
-        #     self.placeRandom()
+    def onGameOver(self, event):
+        self.state = self.STATE_INACTIVE
 
 
-def main():
-    evManager = EventManager()
+def main(argv=None):
+    global COLUMNS, ROWS, MINIMAP_SIZE
+    import argparse
+    parser = argparse.ArgumentParser(description="snake")
+    parser.add_argument("--size", default="%dx%d" % (COLUMNS, ROWS), help="board size in tiles, COLSxROWS (default %(default)s)")
+    parser.add_argument("--apples", type=int, default=APPLES, help="apples on the board at once (default %(default)s)")
+    parser.add_argument("--minimap", type=int, nargs="?", const=150, default=MINIMAP_SIZE, metavar="PIXELS", help="show the whole board next to the view")
+    parser.add_argument("--log", default="warning", choices=["debug", "info", "warning", "error"], help="log level (default %(default)s), debug logs every event")
+    parser.add_argument("--profile", metavar="PATH", help="time handlers, planners and drawing, written to PATH as JSON at exit and on F12")
+    parser.add_argument("--scores", default=scores.DB_PATH, metavar="PATH", help="record every snake's result here (default %(default)s)")
+    parser.add_argument("--no-scores", action="store_true", help="do not record results")
+    parser.add_argument("--seed", type=int, help="seed the random placement of snakes and apples")
+    parser.add_argument("--record", metavar="PATH", help="record the first snake of every game to PATH, see replay.py")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log.upper()), format="%(levelname)s %(message)s")
+    try:
+        COLUMNS, ROWS = [int(n) for n in args.size.lower().split("x")]
+    except ValueError:
+        parser.error("--size takes COLSxROWS, e.g. 2000x2000")
+    MINIMAP_SIZE = args.minimap
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    store = None
+    if not args.no_scores:
+        store = scores.ScoreStore(args.scores)
+
+    evManager = EventManager(deferred=True)
+    if args.profile:
+        import instrument
+        instrument.Profiler(evManager, args.profile)
+
+    recorder = None
+    if args.record:
+        import replay
+        recorder = replay.EventRecorder(evManager, args.record, COLUMNS, ROWS, args.seed)
 
     keybd = KeyBoardController(evManager)
     spinner = CPUSpinnerController(evManager)
     view = View(evManager)
-    game = Game(evManager)
-
-    spinner.run()
+    game = Game(evManager, args.apples, store, args.seed)
+
+    try:
+        spinner.run()
+    finally:
+        if store:
+            store.close()
+        if recorder:
+            recorder.close()
 
 
 if __name__ == "__main__":
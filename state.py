@@ -0,0 +1,240 @@
+"""a single snake game packed into flat buffers for lookahead search.
+GameState can be cloned, stepped with apply() and stepped back with
+undo() in a few microseconds, and carries a zobrist hash for
+transposition tables. it follows the rules of sim.Simulation, but apples
+come from its own random number generator state, so a clone replays the
+same future.
+
+cells are flat indices, y * cols + x
+"""
+import random
+from array import array
+
+from sim import UP, opposite, Simulation
+
+DX = (0, 0, 0, -1, 1)
+DY = (0, 1, -1, 0, 0)
+
+MASK64 = (1 << 64) - 1
+
+# zobrist keys per board size: body, head and tail per cell, the apple per
+# cell plus one for no apple
+_zobrist = {}
+
+def zobristKeys(cells):
+    keys = _zobrist.get(cells)
+    if keys is None:
+        rng = random.Random(cells)
+        table = lambda n: [rng.getrandbits(64) for i in range(n)]
+        keys = (table(cells), table(cells), table(cells), table(cells + 1))
+        _zobrist[cells] = keys
+    return keys
+
+
+def xorshift(x):
+    x ^= (x << 13) & MASK64
+    x ^= x >> 7
+    x ^= (x << 17) & MASK64
+    return x
+
+
+class GameState(object):
+    """grid is a bytearray with 1 on snake cells. the body is a ring buffer
+    of cells, head at body[head] and tail at body[tail]. free lists the
+    cells off the snake in no particular order and position is the index
+    of each in it, -1 for snake cells, so apples are placed in O(1) as in
+    sim.FreeCells. undo() puts free back in the exact order it was, so a
+    state replays the same apples after apply and undo
+    """
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.cells = cols * rows
+        self.grid = bytearray(self.cells)
+        self.body = array("i", [0]) * self.cells
+        self.free = array("i", range(self.cells))
+        self.position = array("i", range(self.cells))
+        self.head = 0
+        self.tail = 0
+        self.length = 0
+        self.direction = UP
+        self.apple = -1
+        self.score = 0
+        self.alive = True
+        self.rng = 1
+        self.hash = 0
+        self.history = []
+        self.keys = zobristKeys(self.cells)
+
+    @classmethod
+    def fromBody(cls, cols, rows, body, direction, apple=None, score=0, seed=1):
+        """body is a list of (x, y) tiles, head first"""
+        state = cls(cols, rows)
+        cells = [y * cols + x for (x, y) in body]
+        for i, cell in enumerate(reversed(cells)):
+            state.body[i] = cell
+            state.grid[cell] = 1
+            state.takeCell(cell)
+        state.length = len(cells)
+        state.tail = 0
+        state.head = state.length - 1
+        state.direction = direction
+        state.apple = apple[1] * cols + apple[0] if apple else -1
+        state.score = score
+        state.rng = (seed & MASK64) or 1
+        state.rehash()
+        return state
+
+    @classmethod
+    def fromSimulation(cls, game, seed=None):
+        if seed is None:
+            seed = game.random.getrandbits(64)
+        return cls.fromBody(game.cols, game.rows, list(game.body), game.direction, game.apple, game.score, seed)
+
+    def rehash(self):
+        bodyKeys, headKeys, tailKeys, appleKeys = self.keys
+        h = headKeys[self.body[self.head]] ^ tailKeys[self.body[self.tail]] ^ appleKeys[self.apple]
+        for i in range(self.length):
+            h ^= bodyKeys[self.body[(self.tail + i) % self.cells]]
+        self.hash = h
+
+    def clone(self):
+        state = GameState.__new__(GameState)
+        state.__dict__.update(self.__dict__)
+        state.grid = bytearray(self.grid)
+        state.body = self.body[:]
+        state.free = self.free[:]
+        state.position = self.position[:]
+        state.history = []
+        return state
+
+    def tile(self, cell):
+        return (cell % self.cols, cell // self.cols)
+
+    def headTile(self):
+        return self.tile(self.body[self.head])
+
+    def bodyTiles(self):
+        return [self.tile(self.body[(self.head - i) % self.cells]) for i in range(self.length)]
+
+    # swap cell out of free with the last one, returns where it was
+    def takeCell(self, cell):
+        free = self.free
+        position = self.position
+        i = position[cell]
+        last = free.pop()
+        if last != cell:
+            free[i] = last
+            position[last] = i
+        position[cell] = -1
+        return i
+
+    def placeApple(self):
+        if not self.free:
+            self.apple = -1
+            return
+        self.rng = xorshift(self.rng)
+        self.apple = self.free[self.rng % len(self.free)]
+
+    # make one move, returns a Simulation result: MOVED, ATE or DIED
+    def apply(self, direction=None):
+        if not self.alive:
+            return Simulation.DIED
+        bodyKeys, headKeys, tailKeys, appleKeys = self.keys
+        # direction, freed tail, apple, rng, score, hash, died, index of the
+        # head cell in free
+        record = [self.direction, -1, self.apple, self.rng, self.score, self.hash, False, -1]
+        self.history.append(record)
+        if direction and direction != opposite(self.direction):
+            self.direction = direction
+
+        cols = self.cols
+        headCell = self.body[self.head]
+        x = headCell % cols + DX[self.direction]
+        y = headCell // cols + DY[self.direction]
+        if x < 0 or x >= cols or y < 0 or y >= self.rows:
+            self.alive = False
+            record[6] = True
+            return Simulation.DIED
+
+        cell = y * cols + x
+        eating = cell == self.apple
+        free = self.free
+        position = self.position
+        tailCell = self.body[self.tail]
+        if self.grid[cell] and (eating or cell != tailCell):
+            self.alive = False
+            record[6] = True
+            return Simulation.DIED
+
+        h = self.hash ^ headKeys[headCell]
+        if not eating:
+            # the tail moves out of the way before the head moves in
+            self.grid[tailCell] = 0
+            # the free index is kept up to date inline here and in undo
+            # (takeCell and its inverse), this is the hot path of a search
+            position[tailCell] = len(free)
+            free.append(tailCell)
+            self.tail = (self.tail + 1) % self.cells
+            self.length -= 1
+            record[1] = tailCell
+            h ^= bodyKeys[tailCell] ^ tailKeys[tailCell] ^ tailKeys[self.body[self.tail]]
+
+        self.head = (self.head + 1) % self.cells
+        self.body[self.head] = cell
+        self.grid[cell] = 1
+        i = position[cell]
+        last = free.pop()
+        if last != cell:
+            free[i] = last
+            position[last] = i
+        position[cell] = -1
+        record[7] = i
+        self.length += 1
+        h ^= bodyKeys[cell] ^ headKeys[cell]
+
+        if eating:
+            self.score += 1
+            h ^= appleKeys[self.apple]
+            self.placeApple()
+            h ^= appleKeys[self.apple]
+            self.hash = h
+            return Simulation.ATE
+        self.hash = h
+        return Simulation.MOVED
+
+    # take back the last apply()
+    def undo(self):
+        direction, tailCell, apple, rng, score, h, died, index = self.history.pop()
+        self.direction = direction
+        self.apple = apple
+        self.rng = rng
+        self.score = score
+        self.hash = h
+        if died:
+            self.alive = True
+            return
+
+        # the head goes back into free, then the tail comes out of it:
+        # apply() in reverse, so free is left in the order it was
+        free = self.free
+        position = self.position
+        headCell = self.body[self.head]
+        self.grid[headCell] = 0
+        if index == len(free):
+            free.append(headCell)
+        else:
+            last = free[index]
+            position[last] = len(free)
+            free.append(last)
+            free[index] = headCell
+        position[headCell] = index
+        self.head = (self.head - 1) % self.cells
+        self.length -= 1
+        if tailCell >= 0:
+            free.pop()
+            position[tailCell] = -1
+            self.tail = (self.tail - 1) % self.cells
+            self.body[self.tail] = tailCell
+            self.grid[tailCell] = 1
+            self.length += 1
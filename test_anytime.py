@@ -0,0 +1,69 @@
+import anytime
+import planner
+import timing
+
+
+def checkWalk(body, path, blocked, cols, rows):
+    tile = body[0]
+    for step in path:
+        assert step in planner.neighbors(tile, cols, rows)
+        assert step not in blocked or step == body[-1]
+        tile = step
+
+
+def testPlanGetsBetter():
+    # a hook: the A* path into the pocket would shut the snake in
+    cols, rows = 8, 8
+    body = [(3, 3), (3, 4), (4, 4), (5, 4), (5, 3), (5, 2), (4, 2), (3, 2), (2, 2)]
+    apple = (4, 3)
+    paths = list(anytime.plan(body, apple, cols, rows))
+    # the quick answer goes for it, the better one stalls instead
+    assert paths[0] == [apple]
+    assert not planner.hasRoom(planner.advance(body, paths[0]), cols, rows)
+    assert paths[1:] == [[planner.chaseTail(body, cols, rows)]]
+    for path in paths:
+        checkWalk(body, path, set(body), cols, rows)
+
+
+def testPlanAvoidsOthers():
+    body = [(0, 2), (0, 3), (0, 4)]
+    others = set([(1, y) for y in range(6)])
+    for path in anytime.plan(body, (5, 5), 6, 6, others):
+        checkWalk(body, path, set(body) | others, 6, 6)
+    # no apple, just chase the tail
+    assert list(anytime.plan(body, None, 6, 6)) == [[planner.chaseTail(body, 6, 6)]]
+
+
+def testWorkerAnswersTheLastRequest():
+    worker = anytime.PlannerProcess()
+    try:
+        first = [(5, 5), (5, 6), (5, 7)]
+        second = [(9, 9), (9, 10), (9, 11)]
+        worker.request(first, (0, 0), 20, 20)
+        worker.request(second, (19, 0), 20, 20)
+        path = worker.result(10.0)
+        assert worker.done
+        assert path == list(anytime.plan(second, (19, 0), 20, 20))[-1]
+        assert worker.misses == 0
+    finally:
+        worker.stop()
+    assert not worker.process.is_alive()
+    worker.stop()
+
+
+def testResultKeepsToBudget():
+    worker = anytime.PlannerProcess()
+    try:
+        # a long snake on a big board takes the worker a while
+        body = [(x, 100) for x in range(150, 0, -1)]
+        for i in range(3):
+            worker.request(body, (150, 101), 200, 200)
+            start = timing.monotonic()
+            path = worker.result(0.001)
+            assert timing.monotonic() - start < 0.05
+            assert path is None or path[0] in planner.neighbors(body[0], 200, 200)
+        assert worker.misses >= 1
+        assert worker.result(30.0) is not None
+        assert worker.done
+    finally:
+        worker.stop()
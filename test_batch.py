@@ -0,0 +1,66 @@
+from collections import deque
+
+import numpy
+
+from batch import BatchSimulation
+from sim import FreeCells, Simulation
+
+
+def bodyOf(batch, game):
+    cols = batch.cols
+    cells = [batch.body[game, (batch.headIndex[game] - i) % batch.cells] for i in range(batch.lengths()[game])]
+    return [(cell % cols, cell // cols) for cell in cells]
+
+
+def appleOf(batch, game):
+    return (batch.apple[game] % batch.cols, batch.apple[game] // batch.cols)
+
+
+# a Simulation put in the state of one game of the batch
+def mirror(batch, game):
+    sim = Simulation(batch.cols, batch.rows, 0)
+    sim.body = deque(bodyOf(batch, game))
+    sim.occupied = set(sim.body)
+    sim.free = FreeCells(batch.cols, batch.rows)
+    sim.free.takeAll(sim.body)
+    sim.direction = batch.direction[game]
+    sim.score = batch.score[game]
+    sim.apple = appleOf(batch, game)
+    sim.free.take(sim.apple)
+    return sim
+
+
+def testSameRulesAsSimulation():
+    rng = numpy.random.RandomState(1)
+    batch = BatchSimulation(32, 6, 5, seed=1)
+    results = {Simulation.MOVED: 0, Simulation.ATE: 1, Simulation.DIED: -1}
+    seen = set()
+    for step in range(200):
+        sims = [mirror(batch, game) for game in range(batch.n)]
+        actions = rng.randint(0, 5, batch.n)
+        rewards, dones = batch.step(actions)
+        for game, sim in enumerate(sims):
+            result = sim.step(actions[game] or None)
+            seen.add(result)
+            assert rewards[game] == results[result]
+            assert dones[game] == (result == Simulation.DIED)
+            if not dones[game]:
+                assert bodyOf(batch, game) == list(sim.body)
+                assert batch.score[game] == sim.score
+    assert seen == set(results)
+
+
+def testResetAfterDeath():
+    batch = BatchSimulation(8, 5, 5, seed=2)
+    # straight up hits the top wall within five moves
+    for step in range(5):
+        batch.score[:] = 3
+        rewards, dones = batch.step(numpy.zeros(batch.n, dtype=numpy.int8))
+        if dones.any():
+            break
+    assert dones.any()
+    assert (batch.finalScore[dones] == 3).all()
+    assert (batch.score[dones] == 0).all()
+    assert (batch.lengths()[dones] == batch.length).all()
+    assert (batch.occupied.sum(axis=1) == batch.lengths()).all()
+    assert not batch.occupied[batch.allGames, batch.apple].any()
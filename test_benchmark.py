@@ -0,0 +1,43 @@
+import benchmark
+
+
+def testResultsKeepTheBest():
+    results = benchmark.Results()
+    results.section("times")
+    results.add("tick", 5.0, "ms")
+    results.add("tick", 4.0, "ms")
+    results.add("tick", 6.0, "ms")
+    results.add("rate", 100.0, "moves/s")
+    results.add("rate", 120.0, "moves/s")
+    results.add("rate", 90.0, "moves/s")
+    results.section("times")
+    assert results.values["tick"]["value"] == 4.0
+    assert results.values["rate"]["value"] == 120.0
+    assert results.lines == ["times", "tick", "rate"]
+
+
+def testRegressions():
+    baseline = {"tick": {"value": 10.0, "unit": "ms"}, "rate": {"value": 100.0, "unit": "moves/s"},
+                "gone": {"value": 1.0, "unit": "ms"}, "zero": {"value": 0.0, "unit": "ms"}}
+    # within tolerance either way, or better
+    results = {"tick": {"value": 11.9, "unit": "ms"}, "rate": {"value": 81.0, "unit": "moves/s"},
+               "new": {"value": 50.0, "unit": "ms"}, "zero": {"value": 3.0, "unit": "ms"}}
+    assert benchmark.regressions(results, baseline, 0.2) == []
+    results["tick"]["value"] = 12.5
+    results["rate"]["value"] = 70.0
+    worse = sorted(benchmark.regressions(results, baseline, 0.2))
+    assert [(name, old, new) for name, old, new, change in worse] == [("rate", 100.0, 70.0), ("tick", 10.0, 12.5)]
+    assert abs(worse[0][3] - 0.3) < 1e-9
+    assert abs(worse[1][3] - 0.25) < 1e-9
+    # a looser tolerance lets them through
+    assert benchmark.regressions(results, baseline, 0.5) == []
+
+
+def testSaveAndLoad(tmpdir):
+    path = str(tmpdir.join("base.json"))
+    results = benchmark.Results()
+    results.add("tick", 4.0, "ms")
+    results.save(path)
+    baseline = benchmark.loadResults(path)
+    assert baseline == {"tick": {"value": 4.0, "unit": "ms"}}
+    assert benchmark.regressions(results.values, baseline) == []
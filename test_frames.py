@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pytest.importorskip("pygame")
+
+import frames
+import snake
+
+
+def testObserve():
+    evManager = snake.EventManager()
+    game = snake.Game(evManager)
+    first = snake.Snake(evManager)
+    second = snake.Snake(evManager, 1)
+    first.place([(1, 1), (1, 2), (1, 3)], game.board)
+    second.place([(4, 4), (5, 4)], game.board)
+    game.apples[0].x, game.apples[0].y = 7, 2
+    game.apples[0].state = snake.Apple.STATE_ACTIVE
+    game.players = [snake.Player(evManager), snake.Player(evManager)]
+    game.players[0].snake = [first]
+    game.players[1].snake = [second]
+
+    out = frames.observe(game, first)
+    assert out.shape == (snake.ROWS, snake.COLUMNS, 3)
+    assert [out[y, x, frames.BODY] for x, y in first.snakeList] == [frames.OWN] * 3
+    assert [out[y, x, frames.BODY] for x, y in second.snakeList] == [frames.OTHER] * 2
+    assert out[:, :, frames.BODY].astype(bool).sum() == 5
+    assert sorted(zip(*reversed(out[:, :, frames.HEAD].nonzero()))) == [(1, 1), (4, 4)]
+    assert zip(*reversed(out[:, :, frames.APPLE].nonzero())) == [(7, 2)]
+    # the array is reused and cleared, a dead snake has no head
+    second.dead = True
+    again = frames.observe(game, None, out)
+    assert again is out
+    assert out[:, :, frames.BODY].max() == frames.OWN
+    assert zip(*reversed(out[:, :, frames.HEAD].nonzero())) == [(1, 1)]
+
+
+def testPlayFollowsTheGame():
+    seen = 0
+    for game, observation, direction, frame in frames.play(2, 8, 8, seed=1, mode="path", pixels=True, maxSteps=50):
+        heads = zip(*reversed(observation[:, :, frames.HEAD].nonzero()))
+        assert len(heads) == 1
+        assert observation[:, :, frames.APPLE].sum() == 255
+        # the drawn board shows the same tiles as the observation
+        tiles = frames.tilePixels(frame, snake.TILE_WIDTH, snake.TILE_HEIGHT)
+        assert tiles.shape == observation.shape
+        assert (tiles.any(axis=2) == observation.any(axis=2)).all()
+        seen += 1
+    assert seen > 50
+
+
+def testPlayMakesOneSnakePerGame(monkeypatch, tmpdir):
+    monkeypatch.setattr(snake.hamilton, "CACHE_DIR", str(tmpdir))
+    loads = []
+    load = snake.hamilton.loadCycle
+
+    def loadCycle(cols, rows):
+        loads.append((cols, rows))
+        return load(cols, rows)
+    monkeypatch.setattr(snake.hamilton, "loadCycle", loadCycle)
+    moves = list(frames.play(2, 6, 6, mode="cycle", maxSteps=10))
+    assert len(moves) == 20
+    assert loads == [(6, 6), (6, 6)]
+
+
+def testFrameFileRoundTrip(tmpdir):
+    path = str(tmpdir.join("frames.npy"))
+    frameFile = frames.FrameFile(path)
+    written = [numpy.random.RandomState(i).randint(0, 256, (4, 5, 3)).astype(numpy.uint8) for i in range(3)]
+    for frame in written:
+        # views with gaps too
+        frameFile.write(numpy.repeat(frame, 2, axis=1)[:, ::2])
+    frameFile.close()
+    loaded = numpy.load(path)
+    assert loaded.shape == (3, 4, 5, 3)
+    assert loaded.dtype == numpy.uint8
+    assert (loaded == numpy.array(written)).all()
+    assert os.listdir(str(tmpdir)) == ["frames.npy"]
+
+
+def testMainWritesTileFrames(tmpdir):
+    path = str(tmpdir.join("games.npz"))
+    frames.main([path, "--size", "6x6", "--pixels", "--mode", "path"])
+    arrays = numpy.load(path)
+    pixels = numpy.load(str(tmpdir.join("games-frames.npy")))
+    assert pixels.shape == arrays["observations"].shape
+    assert len(arrays["directions"]) == len(pixels) > 0
@@ -0,0 +1,43 @@
+from array import array
+
+import hamilton
+
+
+def testHamiltonianCycle():
+    for cols, rows in [(2, 2), (4, 3), (3, 4), (6, 6), (5, 5), (7, 3), (25, 25)]:
+        order = hamilton.hamiltonianCycle(cols, rows)
+        tiles = set((x, y) for x in range(cols) for y in range(rows))
+        # both odd: no cycle covers every tile, the corner is left out
+        if cols % 2 and rows % 2:
+            tiles.discard((cols - 1, rows - 1))
+        assert len(order) == len(tiles)
+        assert set(order) == tiles
+        for a, b in zip(order, order[1:] + order[:1]):
+            assert abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1
+        cycle = hamilton.Cycle(cols, rows, order)
+        if cycle.spare is not None:
+            assert cycle.spare not in order
+            assert cycle.index[cycle.spare] == cycle.index[cycle.twin]
+        assert cycle.distance(order[0], order[-1]) == len(order) - 1
+    assert hamilton.hamiltonianCycle(1, 5) is None
+
+
+def writeCells(cols, rows, cells):
+    with open(hamilton.cachePath(cols, rows), "wb") as f:
+        f.write(array("i", cells).tostring())
+
+
+def testStaleCacheIsRebuilt(tmpdir, monkeypatch):
+    monkeypatch.setattr(hamilton, "CACHE_DIR", str(tmpdir))
+    monkeypatch.setattr(hamilton, "_cycles", {})
+    cols, rows = 5, 5
+    order = hamilton.hamiltonianCycle(cols, rows)
+    hamilton.writeCycle(cols, rows, order)
+    assert hamilton.readCycle(cols, rows) == order
+    cells = [y * cols + x for (x, y) in order]
+    # right length, but out of order, a repeat, the spare, off the board
+    for bad in (cells[1:2] + cells[:1] + cells[2:], cells[:-1] + cells[:1], cells[:-1] + [24], cells[:-1] + [25]):
+        writeCells(cols, rows, bad)
+        assert hamilton.readCycle(cols, rows) is None
+    assert hamilton.loadCycle(cols, rows).order == order
+    assert hamilton.readCycle(cols, rows) == order
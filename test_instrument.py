@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pytest.importorskip("pygame")
+
+import instrument
+import snake
+from events import TickEvent, QuitEvent
+
+
+class Counter:
+    def __init__(self, evManager):
+        self.ticks = 0
+        evManager.subscribe(TickEvent, self.onTick)
+
+    def onTick(self, event):
+        self.ticks += 1
+
+
+def testOffUntilAttached():
+    evManager = snake.EventManager()
+    counter = Counter(evManager)
+    seen = []
+    evManager.subscribe(TickEvent, lambda event: seen.append(event))
+    evManager.post(TickEvent())
+    assert evManager.profiler is None
+
+    profiler = instrument.Profiler(evManager)
+    assert evManager.profiler is profiler
+    for i in range(3):
+        evManager.post(TickEvent())
+    assert counter.ticks == len(seen) == 4
+    # only the ticks posted with the profiler on are timed
+    assert profiler.histograms["handler TickEvent Counter.onTick"].count == 3
+    assert profiler.histograms["handler TickEvent <lambda>"].count == 3
+
+    evManager.profiler = None
+    evManager.post(TickEvent())
+    assert counter.ticks == 5
+    assert profiler.histograms["handler TickEvent Counter.onTick"].count == 3
+
+
+def testPlannerTimed():
+    evManager = snake.EventManager()
+    profiler = instrument.Profiler(evManager)
+    auto = snake.AutoSnake(evManager, snake.AutoSnake.MODE_SPACE)
+    auto.place([(12, 12), (12, 13), (12, 14)], {})
+    for i in range(8):
+        evManager.post(TickEvent())
+    # speed 25 moves every 4th tick
+    assert profiler.histograms["planner space"].count == 2
+    assert "planner space" in profiler.report()
+
+
+def testDumpOnQuit(tmpdir):
+    path = str(tmpdir.join("profile.json"))
+    evManager = snake.EventManager()
+    profiler = instrument.Profiler(evManager, path)
+    profiler.add("tick", 0.002)
+    profiler.add("tick", 0.004)
+    evManager.post(QuitEvent())
+    with open(path) as f:
+        stats = json.load(f)
+    assert stats["seconds"] >= 0
+    assert stats["timers"]["tick"]["count"] == 2
+    assert instrument.Profiler().dump() is None
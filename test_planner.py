@@ -0,0 +1,145 @@
+import random
+from collections import deque
+
+import planner
+from sim import Simulation
+
+
+# shortest path lengths by breadth first search, to check the planners by
+def distances(dest, blocked, cols, rows):
+    dist = {dest: 0}
+    queue = deque([dest])
+    while queue:
+        tile = queue.popleft()
+        for neighbor in planner.neighbors(tile, cols, rows):
+            if neighbor not in dist and neighbor not in blocked:
+                dist[neighbor] = dist[tile] + 1
+                queue.append(neighbor)
+    return dist
+
+
+def walls(rng, cols, rows, count):
+    return set((rng.randrange(cols), rng.randrange(rows)) for i in range(count))
+
+
+def checkPath(path, source, dest, blocked, cols, rows):
+    tile = source
+    for step in path:
+        assert step in planner.neighbors(tile, cols, rows)
+        assert step not in blocked
+        tile = step
+    assert tile == dest
+
+
+def testAstarShortest():
+    rng = random.Random(1)
+    cols, rows = 15, 12
+    for i in range(200):
+        blocked = walls(rng, cols, rows, 50)
+        source = (rng.randrange(cols), rng.randrange(rows))
+        dest = (rng.randrange(cols), rng.randrange(rows))
+        blocked.discard(dest)
+        path = planner.astar(source, dest, blocked, cols, rows)
+        dist = distances(dest, blocked, cols, rows)
+        # the source may be blocked, it is where the search starts
+        reachable = source == dest or any(n in dist for n in planner.neighbors(source, cols, rows))
+        if not reachable:
+            assert path is None
+            continue
+        checkPath(path, source, dest, blocked, cols, rows)
+        if source not in blocked:
+            assert len(path) == dist[source]
+
+
+def testAstarWalledOff():
+    blocked = set((2, y) for y in range(5))
+    assert planner.astar((0, 0), (4, 4), blocked, 5, 5) is None
+    assert planner.astar((0, 0), (2, 2), blocked, 5, 5) is None
+    assert planner.astar((1, 1), (1, 1), blocked, 5, 5) == []
+
+
+def testHasRoom():
+    # the head is shut in a one tile pocket, far from the tail
+    body = [(0, 0), (0, 1), (1, 1), (2, 1), (2, 0), (3, 0), (4, 0), (4, 1), (4, 2)]
+    assert not planner.hasRoom([(1, 0)] + body[:-1], 5, 5)
+    assert planner.hasRoom([(0, 2), (0, 3), (0, 4)], 5, 5)
+    assert planner.safePath(body, (1, 0), set(body), 5, 5) is None
+    line = [(5, 5), (5, 6), (5, 7)]
+    assert len(planner.safePath(line, (0, 0), set(line), 10, 10)) == 10
+
+
+def testChaseTailKeepsMoving():
+    for seed in range(10):
+        game = Simulation(10, 10, seed)
+        for i in range(500):
+            step = planner.chaseTail(list(game.body), game.cols, game.rows)
+            assert step is not None
+            assert game.step(planner.direction(game.head(), step)) != Simulation.DIED
+
+
+def testSpaceAwareOnlyDiesBoxedIn():
+    for seed in range(3):
+        game = Simulation(12, 12, seed)
+        strategy = planner.SpaceAware()
+        while game.state == Simulation.STATE_RUNNING and game.apple is not None and game.steps < 5000:
+            head, tail = game.head(), game.body[-1]
+            moves = [n for n in planner.neighbors(head, game.cols, game.rows) if n not in game.occupied or n == tail]
+            if game.step(strategy(game)) == Simulation.DIED:
+                assert not moves
+        assert game.score > 20
+
+
+def testDStarLiteFollowsChanges():
+    rng = random.Random(2)
+    cols, rows = 12, 12
+    for i in range(30):
+        blocked = walls(rng, cols, rows, 25)
+        start, goal = (0, 0), (cols - 1, rows - 1)
+        blocked -= set([start, goal])
+        dstar = planner.DStarLite(start, goal, blocked, cols, rows)
+        for move in range(20):
+            dist = distances(goal, blocked, cols, rows)
+            assert dstar.reachable() == (start in dist)
+            if start not in dist or start == goal:
+                break
+            path = dstar.path()
+            checkPath(path, start, goal, blocked, cols, rows)
+            assert len(path) == dist[start]
+            # walk one step while a wall comes and another goes
+            start = path[0]
+            added = (rng.randrange(cols), rng.randrange(rows))
+            if added in (start, goal):
+                added = None
+            else:
+                blocked.add(added)
+            removed = rng.choice(list(blocked)) if blocked else None
+            if removed == added:
+                removed = None
+            blocked.discard(removed)
+            dstar.move(start, [added, removed])
+
+
+def testOthersOfSharedBoard():
+    board = {(0, 0): "a", (1, 0): "a", (2, 0): "b"}
+    others = planner.Others(board, "a")
+    assert (2, 0) in others
+    assert (0, 0) not in others
+    assert (5, 5) not in others
+    assert list(others) == [(2, 0)]
+
+
+def testSurvivalChecksSeeOthers():
+    # the only way out of the top left corner is through another snake
+    cols, rows = 6, 6
+    body = [(0, 0), (0, 1), (0, 2)]
+    wall = set([(1, 0), (1, 1), (1, 2), (0, 3), (1, 3)])
+    assert planner.hasRoom(body, cols, rows)
+    assert planner.chaseTail(body, cols, rows) is not None
+    assert not planner.hasRoom(body, cols, rows, others=wall)
+    assert planner.chaseTail(body, cols, rows, others=wall) is None
+
+
+def testTailInReach():
+    body = [(1, 1), (1, 0), (0, 0), (0, 1), (0, 2)]
+    assert planner.tailInReach(body, 5, 5)
+    assert not planner.tailInReach(body, 5, 5, others=set([(1, 2), (2, 1)]))
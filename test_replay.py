@@ -0,0 +1,81 @@
+import random
+
+import planner
+import replay
+from sim import DIRECTIONS, DOWN, LEFT, RIGHT, UP, Simulation
+
+
+# a recorded game of a few hundred moves, and the state after every move
+def record(path, seed=1, keyframeInterval=50, close=True):
+    game = Simulation(10, 10, seed)
+    rng = random.Random(seed)
+    recorder = replay.Recorder(path, game.cols, game.rows, seed, keyframeInterval)
+    replay.recordStart(recorder, game)
+    states = [(list(game.body), game.apple, game.score)]
+    while game.state == Simulation.STATE_RUNNING and game.steps < 400:
+        body = list(game.body)
+        path = planner.safePath(body, game.apple, set(body), game.cols, game.rows)
+        step = path[0] if path else planner.chaseTail(body, game.cols, game.rows)
+        if step is None:
+            direction = rng.choice(DIRECTIONS)
+        else:
+            x, y = game.body[0]
+            direction = {(x, y + 1): DOWN, (x, y - 1): UP, (x - 1, y): LEFT, (x + 1, y): RIGHT}[step]
+        result = game.step(direction)
+        replay.recordStep(recorder, game, result)
+        states.append((list(game.body), game.apple, game.score))
+    if close:
+        recorder.close()
+    else:
+        recorder.file.flush()
+    return recorder, states
+
+
+def check(player, states):
+    for tick in range(len(states) - 1):
+        state = player.seek(tick)
+        body, apple, score = states[tick]
+        assert state.tick == tick
+        assert list(state.body) == body
+        assert state.apple == apple
+        assert state.score == score
+
+
+def testSeekMatchesGame(tmpdir):
+    path = str(tmpdir.join("game.snk"))
+    recorder, states = record(path)
+    player = replay.Replay(path)
+    try:
+        assert len(player.keyframes) > 2
+        assert player.lastTick == len(states) - 1
+        check(player, states)
+        # and backwards, across keyframes
+        for tick in reversed(range(0, len(states) - 1, 13)):
+            assert list(player.seek(tick).body) == states[tick][0]
+    finally:
+        player.close()
+
+
+def testPlayMatchesSeek(tmpdir):
+    path = str(tmpdir.join("game.snk"))
+    recorder, states = record(path, seed=2)
+    player = replay.Replay(path)
+    try:
+        played = [list(state.body) for state in player.play()]
+        assert played[:len(states) - 2] == [body for body, apple, score in states[1:len(states) - 1]]
+    finally:
+        player.close()
+
+
+def testUnclosedFileIsScanned(tmpdir):
+    path = str(tmpdir.join("game.snk"))
+    recorder, states = record(path, seed=3, close=False)
+    try:
+        player = replay.Replay(path)
+        try:
+            assert player.keyframeTicks == [tick for tick, offset in recorder.keyframes]
+            check(player, states)
+        finally:
+            player.close()
+    finally:
+        recorder.close()
@@ -0,0 +1,50 @@
+import pytest
+
+import scores
+
+
+@pytest.fixture
+def store(tmpdir):
+    store = scores.ScoreStore(str(tmpdir.join("scores.db")), batchSize=7, flushInterval=0.01)
+    yield store
+    store.close()
+
+
+def testRecordAndQuery(store):
+    for i in range(100):
+        store.record(i, i + 3, "space" if i % 2 else "player", steps=10 * i, seed=i, cols=25, rows=25)
+    assert store.flush()
+    assert store.written == 100
+    assert store.count() == 100
+    assert store.count("player") == 50
+    best = store.leaderboard(3)
+    assert [result["score"] for result in best] == [99, 98, 97]
+    assert best[0]["controller"] == "space" and best[0]["steps"] == 990
+    assert [result["score"] for result in store.leaderboard(2, "player")] == [98, 96]
+    assert store.percentile(0.0) == 0
+    assert store.percentile(0.5) == 50
+    assert store.percentile(1.0) == 99
+    assert store.percentile(0.5, "nobody") is None
+    summary = store.summary()
+    assert summary["player"] == {"games": 50, "mean": 49.0, "max": 98}
+
+
+def testFlushAfterClose(store):
+    store.record(1, 4, "player")
+    store.close()
+    assert store.count() == 1
+    # nobody left to answer, it must not hang
+    assert not store.flush()
+
+
+def testCloseCommits(tmpdir):
+    path = str(tmpdir.join("scores.db"))
+    store = scores.ScoreStore(path, flushInterval=10.0)
+    for i in range(5):
+        store.record(i, 3, "cycle")
+    store.close()
+    store = scores.ScoreStore(path)
+    try:
+        assert store.count("cycle") == 5
+    finally:
+        store.close()
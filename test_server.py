@@ -0,0 +1,157 @@
+import socket
+import struct
+
+import pytest
+
+import server
+from sim import Arena
+
+
+def testChangesRoundTrip():
+    changes = [
+        (Arena.SPAWN, 1, [(3, 4), (3, 5), (3, 6)]),
+        (Arena.HEAD, 1, (3, 3)),
+        (Arena.TAIL, 1, (3, 6)),
+        (Arena.ATE, 2, (0, 24)),
+        (Arena.APPLE, (7, 8)),
+        (Arena.DIED, 65535),
+        (Arena.SPAWN, 3, []),
+    ]
+    assert server.unpackChanges(server.packChanges(changes)) == changes
+    assert server.unpackChanges("") == []
+    with pytest.raises(ValueError):
+        server.unpackChanges(chr(0x7f))
+
+
+def testReadFrames():
+    data = server.frame("ab") + server.frame("") + server.frame("cde")
+    assert server.readFrames(data) == (["ab", "", "cde"], "")
+    # a frame cut short waits for the rest
+    assert server.readFrames(data[:-1]) == (["ab", ""], data[10:-1])
+    assert server.readFrames(data[:3]) == ([], data[:3])
+    assert server.readFrames(data, 3) == (["ab", "", "cde"], "")
+    with pytest.raises(ValueError):
+        server.readFrames(data, 2)
+    # the length alone is enough to turn a frame down
+    with pytest.raises(ValueError):
+        server.readFrames(struct.pack("<I", 1 << 30), server.MAX_MESSAGE)
+
+
+def serve(srv, client, rounds=10):
+    for i in range(rounds):
+        srv.run(0.01)
+        try:
+            client.receive(0.01)
+        except IOError:
+            return False
+    return True
+
+
+@pytest.fixture
+def srv():
+    srv = server.Server("127.0.0.1", 0, size=10, tick=0.005, seed=1)
+    yield srv
+    srv.close()
+
+
+def connect(srv):
+    return server.Client("127.0.0.1", srv.address[1])
+
+
+def testJoinAndPlay(srv):
+    client = connect(srv)
+    try:
+        client.join(4)
+        assert serve(srv, client, 1)
+        assert client.room == 4
+        assert client.alive()
+        assert (client.cols, client.rows) == (10, 10)
+        # the client mirrors the room, whatever became of the snake
+        assert serve(srv, client)
+        assert client.tick > 0
+        assert client.snakes == dict((snake.id, snake.body) for snake in srv.rooms[4].arena.snakes.values())
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize("message", [
+    server.frame(""),
+    server.frame(chr(server.LEAVE) + "x"),
+    server.frame(chr(0x7f)),
+    struct.pack("<I", server.MAX_MESSAGE + 1),
+])
+def testBadMessageDrops(srv, message):
+    client = connect(srv)
+    try:
+        client.join(1)
+        assert serve(srv, client)
+        client.sock.sendall(message)
+        assert not serve(srv, client)
+        assert not srv.connections
+        assert not srv.rooms
+    finally:
+        client.close()
+
+
+def testRoomLimit(srv, monkeypatch):
+    monkeypatch.setattr(server, "MAX_ROOMS", 1)
+    first = connect(srv)
+    second = connect(srv)
+    try:
+        first.join(1)
+        assert serve(srv, first)
+        second.join(2)
+        assert not serve(srv, second)
+        # an existing room is still open
+        third = connect(srv)
+        try:
+            third.join(1)
+            assert serve(srv, third)
+            assert third.room == 1
+        finally:
+            third.close()
+        assert srv.rooms.keys() == [1]
+    finally:
+        first.close()
+        second.close()
+
+
+def testLargeSnakeIds(srv):
+    changes = [(Arena.SPAWN, 70000, [(1, 2)]), (Arena.HEAD, 1 << 31, (1, 1)), (Arena.DIED, 65536)]
+    assert server.unpackChanges(server.packChanges(changes)) == changes
+    # a room open long enough to have seen 65535 joins
+    client = connect(srv)
+    other = connect(srv)
+    try:
+        other.join(1)
+        assert serve(srv, other, 1)
+        srv.rooms[1].arena.nextId = 65536
+        client.join(1)
+        assert serve(srv, client)
+        assert client.id == 65536
+        assert client.snakes == dict((snake.id, snake.body) for snake in srv.rooms[1].arena.snakes.values())
+    finally:
+        client.close()
+        other.close()
+
+
+def testBrokenRoomIsClosedAlone(srv):
+    broken = connect(srv)
+    fine = connect(srv)
+    try:
+        broken.join(1)
+        fine.join(2)
+        assert serve(srv, broken, 1)
+        assert serve(srv, fine, 1)
+
+        def fail():
+            raise RuntimeError("broken")
+        srv.rooms[1].arena.step = fail
+        assert not serve(srv, broken)
+        tick = fine.tick
+        assert serve(srv, fine)
+        assert fine.tick > tick
+        assert srv.rooms.keys() == [2]
+    finally:
+        broken.close()
+        fine.close()
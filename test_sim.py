@@ -0,0 +1,62 @@
+import random
+
+from sim import FreeCells, Simulation, DIRECTIONS
+
+
+def checkFree(free, taken):
+    cols, rows = free.cols, free.rows
+    assert len(free) == cols * rows - len(taken)
+    for y in range(rows):
+        for x in range(cols):
+            assert ((x, y) in free) == ((x, y) not in taken)
+    if free.cells is not None:
+        assert sorted(free.cells) == sorted(free.position)
+        for i, cell in enumerate(free.cells):
+            assert free.position[cell] == i
+
+
+def testFreeCells():
+    rng = random.Random(1)
+    cols, rows = 9, 7
+    free = FreeCells(cols, rows)
+    taken = set()
+    for i in range(2000):
+        cell = (rng.randrange(-1, cols + 1), rng.randrange(-1, rows + 1))
+        if rng.random() < 0.6:
+            expected = 0 <= cell[0] < cols and 0 <= cell[1] < rows and cell not in taken
+            assert free.take(cell) == expected
+            if expected:
+                taken.add(cell)
+        else:
+            free.free(cell)
+            taken.discard(cell)
+        if i % 50 == 0:
+            checkFree(free, taken)
+        sample = free.sample(rng)
+        if free.full():
+            assert sample is None
+        else:
+            assert sample in free
+    # it went dense on the way
+    assert free.cells is not None
+    checkFree(free, taken)
+
+
+def testFullBoard():
+    free = FreeCells(3, 2)
+    free.takeAll([(x, y) for x in range(3) for y in range(2)])
+    assert free.full()
+    assert free.sample() is None
+    free.free((1, 1))
+    assert free.sample() == (1, 1)
+
+
+def testSimulationKeepsFreeCells():
+    for seed in range(10):
+        game = Simulation(6, 6, seed)
+        rng = random.Random(seed)
+        while game.step(rng.choice(DIRECTIONS)) != Simulation.DIED:
+            taken = set(game.body)
+            if game.apple:
+                taken.add(game.apple)
+            checkFree(game.free, taken)
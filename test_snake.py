@@ -0,0 +1,247 @@
+import gc
+import os
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pytest.importorskip("pygame")
+
+import snake
+from events import Event, TickEvent, QuitEvent, MoveRequest, ApplePlaceEvent, AppleEatenEvent
+from sim import DOWN
+
+
+class Listener:
+    def __init__(self, evManager, log, name):
+        self.log = log
+        self.name = name
+        evManager.subscribe(TickEvent, self.onTick)
+
+    def onTick(self, event):
+        self.log.append(self.name)
+
+
+def testDispatchByClass():
+    evManager = snake.EventManager()
+    seen = []
+    evManager.subscribe(Event, lambda event: seen.append(("any", type(event))))
+    evManager.subscribe(TickEvent, lambda event: seen.append(("tick", type(event))))
+    evManager.post(TickEvent())
+    evManager.post(QuitEvent())
+    # subscription order, whichever class was asked for
+    assert seen == [("any", TickEvent), ("tick", TickEvent), ("any", QuitEvent)]
+
+
+def testDeadListenersArePruned():
+    evManager = snake.EventManager()
+    log = []
+    keep = Listener(evManager, log, "keep")
+    gone = Listener(evManager, log, "gone")
+    evManager.post(TickEvent())
+    del gone
+    gc.collect()
+    evManager.post(TickEvent())
+    assert log == ["keep", "gone", "keep"]
+    assert len(evManager.handlers[TickEvent]) == 1
+    evManager.unsubscribe(TickEvent, keep.onTick)
+    evManager.post(TickEvent())
+    assert log == ["keep", "gone", "keep"]
+
+
+@pytest.mark.parametrize("deferred", [False, True])
+def testDeferredDispatch(deferred):
+    evManager = snake.EventManager(deferred)
+    seen = []
+
+    def onTick(event):
+        seen.append("tick start")
+        evManager.post(QuitEvent())
+        evManager.post(MoveRequest(snake.UP))
+        seen.append("tick end")
+
+    evManager.subscribe(TickEvent, onTick)
+    evManager.subscribe(QuitEvent, lambda event: seen.append("quit"))
+    evManager.subscribe(MoveRequest, lambda event: seen.append("move"))
+    evManager.post(TickEvent())
+    if deferred:
+        assert seen == ["tick start", "tick end", "quit", "move"]
+    else:
+        assert seen == ["tick start", "quit", "move", "tick end"]
+    assert not evManager.queue
+
+
+def testTextCacheEvictsLeastRecentlyUsed():
+    snake.pygame.font.init()
+    cache = snake.TextCache(maxSurfaces=2)
+    white = (255, 255, 255)
+    a = cache.render("a", 12, white)
+    b = cache.render("b", 12, white)
+    assert cache.render("a", 12, white) is a
+    # b is the least recently used now, c pushes it out
+    cache.render("c", 12, white)
+    assert list(cache.surfaces) == [("a", 12, white), ("c", 12, white)]
+    assert cache.render("b", 12, white) is not b
+    assert cache.render("c", 12, white) is not None
+    assert ("a", 12, white) not in cache.surfaces
+    # one font per size however many texts
+    assert list(cache.fonts) == [12]
+
+
+def testTurnQueue():
+    evManager = snake.EventManager()
+    s = snake.Snake(evManager)
+    s.place([(5, 5), (5, 6), (5, 7)], {})
+    # going up: down is back on itself and up is no turn, both dropped
+    s.changeHeadDirection(snake.DOWN)
+    s.changeHeadDirection(snake.UP)
+    assert not s.turns
+    # turns are checked against the last one queued, not the way it goes
+    s.changeHeadDirection(snake.LEFT, 1.0)
+    s.changeHeadDirection(snake.RIGHT)
+    s.changeHeadDirection(snake.DOWN)
+    s.changeHeadDirection(snake.RIGHT)
+    assert [turn for turn, pressed in s.turns] == [snake.LEFT, snake.DOWN, snake.RIGHT]
+    assert len(s.turns) == snake.TURN_BUFFER
+    # full, dropped
+    s.changeHeadDirection(snake.UP)
+    assert len(s.turns) == snake.TURN_BUFFER
+    # one turn a move
+    s.move()
+    assert s.snakeList[0] == (4, 5)
+    s.move()
+    assert s.snakeList[0] == (4, 6)
+    s.move()
+    assert s.snakeList[0] == (5, 6)
+    assert not s.dead
+    assert not s.turns
+
+
+def testDStarSeesOtherSnakes():
+    # the apple is walled in by another snake when the search starts, and
+    # let out when that snake goes
+    evManager = snake.EventManager()
+    board = {}
+    auto = snake.AutoSnake(evManager, snake.AutoSnake.MODE_DSTAR)
+    auto.place([(12, 20), (12, 21), (12, 22)], board)
+    other = snake.Snake(evManager, 1)
+    other.place([(11, 4), (12, 4), (13, 4), (13, 5), (13, 6), (12, 6), (11, 6), (11, 5)], board)
+    apple = auto.appleLocation = (12, 5)
+    for i in range(3):
+        auto.autopilot(apple)
+        auto.move()
+        assert not auto.dead
+    for tile in other.snakeList:
+        del board[tile]
+    other.gameOver()
+    for i in range(100):
+        auto.autopilot(apple)
+        auto.move()
+        assert not auto.dead
+        if auto.snakeList[0] == apple:
+            break
+    assert auto.snakeList[0] == apple
+
+
+def pair():
+    evManager = snake.EventManager()
+    board = {}
+    a = snake.Snake(evManager)
+    b = snake.Snake(evManager, 1)
+    a.place([(5, 5), (5, 6), (5, 7)], board)
+    b.place([(5, 3), (5, 2), (5, 1)], board)
+    b.direction = DOWN
+    return a, b
+
+
+def testHeadOnKillsBoth():
+    a, b = pair()
+    a.ticks = b.ticks = 1
+    b.move()
+    a.move()
+    assert a.dead and a.cause == "snake"
+    assert b.dead and b.cause == "snake"
+
+
+def testStaleHeadOnlyInTheWay():
+    # b came onto the tile a tick before a did, a ran into it
+    a, b = pair()
+    a.ticks = b.ticks = 1
+    b.move()
+    a.ticks = b.ticks = 2
+    a.move()
+    assert a.dead and a.cause == "snake"
+    assert not b.dead
+
+
+def testBodyOnlyInTheWay():
+    a, b = pair()
+    b.direction = snake.UP
+    a.ticks = b.ticks = 1
+    a.move()
+    a.move()
+    assert a.dead
+    assert not b.dead
+
+
+def testExtendBeforeMoving():
+    evManager = snake.EventManager()
+    s = snake.Snake(evManager)
+    s.place([(5, 5), (5, 6), (5, 7)], {})
+    s.direction = snake.LEFT
+    s.extend()
+    # nothing left behind to grow into yet, the next move keeps the tail
+    assert list(s.snakeList) == [(5, 5), (5, 6), (5, 7)]
+    s.move()
+    assert list(s.snakeList) == [(4, 5), (5, 5), (5, 6), (5, 7)]
+    assert s.score == 1 and not s.dead
+    s.move()
+    s.extend()
+    assert list(s.snakeList) == [(3, 5), (4, 5), (5, 5), (5, 6), (5, 7)]
+
+
+def placeApple(evManager, tile):
+    apple = snake.Apple(evManager, None)
+    apple.x, apple.y = tile
+    evManager.post(ApplePlaceEvent(apple))
+    return apple
+
+
+def testTargetsNearestApple():
+    evManager = snake.EventManager()
+    auto = snake.AutoSnake(evManager, snake.AutoSnake.MODE_PATH)
+    auto.place([(12, 12), (12, 13), (12, 14)], {})
+    placeApple(evManager, (2, 2))
+    assert auto.appleLocation == (2, 2)
+    near = placeApple(evManager, (12, 8))
+    assert auto.appleLocation == (12, 8)
+    # farther apples, and eating one that is not the target, change nothing
+    placeApple(evManager, (24, 24))
+    other = placeApple(evManager, (20, 12))
+    auto.path = [(12, 11)]
+    evManager.post(AppleEatenEvent(other))
+    assert auto.appleLocation == (12, 8)
+    assert auto.path == [(12, 11)]
+    # the next nearest once its apple goes
+    evManager.post(AppleEatenEvent(near))
+    assert auto.appleLocation == (2, 2)
+    assert auto.path == []
+
+
+def testReplansPerTick():
+    evManager = snake.EventManager()
+    budget = snake.ReplanBudget(1)
+    first = snake.AutoSnake(evManager, snake.AutoSnake.MODE_PATH, budget)
+    second = snake.AutoSnake(evManager, snake.AutoSnake.MODE_PATH, budget)
+    board = {}
+    first.place([(5, 5), (5, 6), (5, 7)], board)
+    second.place([(15, 5), (15, 6), (15, 7)], board)
+    placeApple(evManager, (10, 0))
+    first.autopilot(first.appleLocation)
+    second.autopilot(second.appleLocation)
+    assert first.path
+    # out of plans, the cheap move this time and a plan on the next
+    assert second.path == [] and second.turns
+    budget.refill()
+    second.turns.clear()
+    second.autopilot(second.appleLocation)
+    assert second.path
@@ -0,0 +1,109 @@
+import random
+
+from sim import DIRECTIONS, Simulation
+from state import GameState
+
+
+def snapshot(state):
+    return (bytes(state.grid), state.bodyTiles(), list(state.free), list(state.position), state.direction,
+            state.apple, state.rng, state.score, state.length, state.alive, state.hash)
+
+
+def checkFree(state):
+    free = [cell for cell in range(state.cells) if not state.grid[cell]]
+    assert sorted(state.free) == free
+    for i, cell in enumerate(state.free):
+        assert state.position[cell] == i
+    for cell in range(state.cells):
+        if state.grid[cell]:
+            assert state.position[cell] == -1
+
+
+def walk(seed, cols=8, rows=7, moves=300):
+    rng = random.Random(seed)
+    state = GameState.fromSimulation(Simulation(cols, rows, seed), seed)
+    states = [snapshot(state)]
+    for i in range(moves):
+        if state.apply(rng.choice(DIRECTIONS)) == Simulation.DIED:
+            break
+        states.append(snapshot(state))
+    return state, states
+
+
+def testUndoRestoresEverything():
+    for seed in range(20):
+        state, states = walk(seed)
+        # the move that died is taken back too
+        while len(state.history) >= len(states):
+            state.undo()
+            assert snapshot(state) == states[-1]
+        while state.history:
+            states.pop()
+            state.undo()
+            assert snapshot(state) == states[-1]
+
+
+def testReplayPlacesTheSameApples():
+    state = GameState.fromSimulation(Simulation(6, 6, 3), 3)
+    rng = random.Random(3)
+    moves = []
+    while state.alive:
+        moves.append(rng.choice(DIRECTIONS))
+        state.apply(moves[-1])
+    end = snapshot(state)
+    while state.history:
+        state.undo()
+    for direction in moves:
+        state.apply(direction)
+    assert snapshot(state) == end
+
+
+def testHashMatchesRehash():
+    for seed in range(20):
+        state = GameState.fromSimulation(Simulation(6, 6, seed), seed)
+        rng = random.Random(seed)
+        while state.alive:
+            state.apply(rng.choice(DIRECTIONS))
+            h = state.hash
+            state.rehash()
+            assert state.hash == h
+
+
+def testFreeIndex():
+    for seed in range(10):
+        state = GameState.fromSimulation(Simulation(7, 5, seed), seed)
+        rng = random.Random(seed)
+        checkFree(state)
+        while state.apply(rng.choice(DIRECTIONS)) != Simulation.DIED:
+            checkFree(state)
+            assert state.apple == -1 or not state.grid[state.apple]
+        while state.history:
+            state.undo()
+            checkFree(state)
+
+
+def testCloneIsIndependent():
+    state = GameState.fromSimulation(Simulation(10, 10, 1), 1)
+    before = snapshot(state)
+    clone = state.clone()
+    for direction in (state.direction, 3, 3):
+        clone.apply(direction)
+    assert snapshot(state) == before
+    assert clone.history and not state.history
+
+
+def testSameRulesAsSimulation():
+    # the apples come from different generators, so the state is handed
+    # the simulation's apple before every move
+    for seed in range(20):
+        game = Simulation(8, 8, seed)
+        state = GameState.fromSimulation(game, seed)
+        rng = random.Random(seed)
+        while game.state == Simulation.STATE_RUNNING:
+            state.apple = game.apple[1] * game.cols + game.apple[0] if game.apple else -1
+            state.rehash()
+            direction = rng.choice(DIRECTIONS)
+            assert state.apply(direction) == game.step(direction)
+            if game.state == Simulation.STATE_RUNNING:
+                assert state.bodyTiles() == list(game.body)
+                assert state.score == game.score
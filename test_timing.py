@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pytest.importorskip("pygame")
+
+import snake
+import timing
+from events import TickEvent, QuitEvent
+
+# powers of two, so the deadlines add up exactly
+PERIOD = 1.0 / 64
+
+
+class Clock:
+    """a clock that only moves when slept on or told to"""
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleepUntil(self, deadline, spin=0.0):
+        self.now = max(self.now, deadline)
+
+
+# run the loop for count ticks, stalling for stalls[i] periods in tick i.
+# returns the loop and the time every tick started at
+def run(monkeypatch, count, stalls={}):
+    clock = Clock()
+    monkeypatch.setattr(timing, "monotonic", clock.monotonic)
+    monkeypatch.setattr(timing, "sleepUntil", clock.sleepUntil)
+    evManager = snake.EventManager()
+    spinner = snake.CPUSpinnerController(evManager, 64, 32, 128)
+    times = []
+
+    def onTick(event):
+        times.append(clock.now)
+        clock.now += stalls.get(len(times) - 1, 0) * PERIOD
+        if len(times) == count:
+            evManager.post(QuitEvent())
+
+    evManager.subscribe(TickEvent, onTick)
+    spinner.run()
+    return spinner, times
+
+
+def testSleepUntil():
+    for spin in (0.0, timing.SPIN):
+        deadline = timing.monotonic() + 0.005
+        timing.sleepUntil(deadline, spin)
+        assert timing.monotonic() >= deadline
+
+
+def testSteady(monkeypatch):
+    spinner, times = run(monkeypatch, 64)
+    assert times == [i * PERIOD for i in range(64)]
+    assert spinner.jitter.max == 0
+    assert spinner.overruns == spinner.dropped == 0
+    # a frame every other tick
+    assert spinner.frames == 32
+
+
+def testCatchUp(monkeypatch):
+    spinner, times = run(monkeypatch, 20, {10: 3.5})
+    stalled = 13.5 * PERIOD
+    assert times[:11] == [i * PERIOD for i in range(11)]
+    # the three ticks missed run back to back, then the old pace goes on
+    assert times[11:14] == [stalled] * 3
+    assert times[14:] == [i * PERIOD for i in range(14, 20)]
+    assert spinner.overruns == 2
+    assert spinner.dropped == 0
+
+
+def testDropsPastMaxCatchup(monkeypatch):
+    spinner, times = run(monkeypatch, 20, {10: 10.5})
+    stalled = 20.5 * PERIOD
+    # MAX_CATCHUP ticks in a row, counting the slow one
+    caught = snake.MAX_CATCHUP - 1
+    assert times[11:11 + caught] == [stalled] * caught
+    # the rest are dropped and the deadlines stay on the old grid
+    assert spinner.dropped == 10 - caught
+    assert times[11 + caught] == 21 * PERIOD
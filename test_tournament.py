@@ -0,0 +1,56 @@
+import replay
+import sim
+import tournament
+
+
+# round and round a 2x2 square, never eating unless an apple lands on it
+def circle(game):
+    return (sim.RIGHT, sim.DOWN, sim.LEFT, sim.UP)[game.steps % 4]
+
+
+def testPlayGameIsSeeded():
+    first = tournament.playGame(("space", 3, 10, 10, None))
+    second = tournament.playGame(("space", 3, 10, 10, None))
+    for key in ("score", "length", "steps", "appleSteps", "cause"):
+        assert first[key] == second[key]
+    assert first["length"] == first["score"] + 3
+    assert sum(first["appleSteps"]) <= first["steps"]
+
+
+def testStarved():
+    result = tournament.playGame(("test_tournament:circle", 1, 10, 10, None))
+    assert result["score"] == 0
+    assert result["cause"] == "starved"
+    assert result["steps"] == tournament.STARVE_FACTOR * 100
+
+
+def testRunMatchesPlayGame(tmpdir):
+    record = str(tmpdir.join("games"))
+    standings = tournament.run(["greedy", "astar"], 4, 8, 8, seed=10, jobs=2, record=record)
+    summary = standings.summary()
+    assert sorted(summary) == ["astar", "greedy"]
+    for name, results in standings.results.items():
+        assert sorted(r["seed"] for r in results) == [10, 11, 12, 13]
+        assert summary[name]["games"] == 4
+        assert sum(summary[name]["causes"].values()) == 4
+        for result in results:
+            alone = tournament.playGame((name, result["seed"], 8, 8, None))
+            assert (alone["score"], alone["steps"], alone["cause"]) == (result["score"], result["steps"], result["cause"])
+            player = replay.Replay(result["recording"])
+            try:
+                assert player.lastTick == result["steps"]
+            finally:
+                player.close()
+
+
+def testStandings():
+    standings = tournament.Standings()
+    for score in range(10):
+        standings.add({"strategy": "x", "score": score, "length": score + 3, "appleSteps": [score] * score,
+                       "cause": "wall" if score % 2 else "body"})
+    s = standings.summary()["x"]
+    assert s["score"]["mean"] == 4.5
+    assert (s["score"]["p10"], s["score"]["p50"], s["score"]["p90"], s["score"]["max"]) == (1, 5, 9, 9)
+    assert s["causes"] == {"wall": 5, "body": 5}
+    assert s["length"] == 7.5
+    assert "x" in standings.report()
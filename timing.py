@@ -0,0 +1,111 @@
+"""clock helpers for the game loop. times are in seconds"""
+import time
+
+
+def _monotonicClock():
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+    try:
+        # python 2 has no time.monotonic, ask the C library directly
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+        librt = ctypes.CDLL(ctypes.util.find_library("rt") or ctypes.util.find_library("c"), use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        CLOCK_MONOTONIC = 1
+        t = timespec()
+
+        def monotonic():
+            clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t))
+            return t.tv_sec + t.tv_nsec * 1e-9
+
+        monotonic()
+        return monotonic
+    except (OSError, AttributeError, TypeError):
+        return time.time
+
+monotonic = _monotonicClock()
+
+
+# seconds of a wait worth spinning through when a deadline has to be met
+# closely, the OS sleep can overshoot about this much
+SPIN = 0.0005
+
+
+# sleep until a monotonic() deadline. with spin set the last spin seconds
+# are waited out in a loop, which is exact but burns the CPU meanwhile
+def sleepUntil(deadline, spin=0.0):
+    remaining = deadline - monotonic()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while monotonic() < deadline:
+        pass
+
+
+class RunningStats:
+    """count, mean and max of a stream of samples"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, sample):
+        self.count += 1
+        self.total += sample
+        if sample > self.max:
+            self.max = sample
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+
+class Histogram(RunningStats):
+    """RunningStats plus a count of samples per power of two bucket of
+    microseconds: bucket b holds samples from 2**(b-1) up to 2**b us, bucket
+    0 those under 1 us. enough for rough percentiles at the cost of a list
+    increment per sample
+    """
+    BUCKETS = 32
+
+    def __init__(self):
+        RunningStats.__init__(self)
+        self.buckets = [0] * Histogram.BUCKETS
+
+    def add(self, sample):
+        self.count += 1
+        self.total += sample
+        if sample > self.max:
+            self.max = sample
+        b = int(sample * 1e6).bit_length()
+        self.buckets[b if b < Histogram.BUCKETS else Histogram.BUCKETS - 1] += 1
+
+    # upper bound of the bucket holding the q-th fraction of the samples,
+    # never more than the largest sample
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        seen = 0
+        for b, n in enumerate(self.buckets):
+            seen += n
+            if seen >= q * self.count:
+                return min((1 << b) * 1e-6, self.max)
+        return self.max
+
+    # times in ms, buckets by their upper bound in us
+    def toDict(self):
+        return {
+            "count": self.count,
+            "totalMs": 1000 * self.total,
+            "meanMs": 1000 * self.mean(),
+            "maxMs": 1000 * self.max,
+            "p50Ms": 1000 * self.percentile(0.5),
+            "p90Ms": 1000 * self.percentile(0.9),
+            "p99Ms": 1000 * self.percentile(0.99),
+            "buckets": dict((str(1 << b), n) for b, n in enumerate(self.buckets) if n),
+        }
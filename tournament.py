@@ -0,0 +1,230 @@
+"""seeded self play tournaments between snake strategies, spread over all
+cores. every strategy plays the same seeds so the results can be compared.
+
+    python tournament.py -s greedy -s astar -n 1000
+    python tournament.py -s mymodule:myStrategy --size 50
+    python tournament.py -n 10000 --scores    # also keep every result
+    python tournament.py -s cycle --record games   # and a recording of each game
+
+a strategy is a function taking a sim.Simulation and returning the next
+direction (see planner.greedy), or a class with __call__ that gets one
+instance per game (see planner.PathFollower)
+"""
+import argparse
+import importlib
+import inspect
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import hamilton
+import planner
+import replay
+import scores
+import sim
+
+STRATEGIES = {
+    "greedy": planner.greedy,
+    "astar": planner.PathFollower,
+    "space": planner.SpaceAware,
+    "dstar": planner.Incremental,
+    "cycle": hamilton.CycleFollower,
+}
+
+# games end once a snake goes this many moves per board tile without eating
+STARVE_FACTOR = 2
+
+
+def loadStrategy(name):
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    moduleName, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError("unknown strategy %s, use one of %s or module:function" % (name, ", ".join(sorted(STRATEGIES))))
+    return getattr(importlib.import_module(moduleName), attr)
+
+
+# play one game headless and return its result as a dict
+def playGame(task):
+    name, seed, cols, rows, record = task
+    strategy = loadStrategy(name)
+    if inspect.isclass(strategy):
+        strategy = strategy()
+
+    start = time.time()
+    game = sim.Simulation(cols, rows, seed)
+    recorder = None
+    if record:
+        recorder = replay.Recorder(recordingPath(record, name, seed), cols, rows, seed)
+        replay.recordStart(recorder, game)
+    starve = STARVE_FACTOR * cols * rows
+    appleSteps = []
+    lastApple = 0
+    while True:
+        result = game.step(strategy(game))
+        if recorder:
+            replay.recordStep(recorder, game, result)
+        if result == sim.Simulation.DIED:
+            cause = game.cause
+            break
+        elif result == sim.Simulation.ATE:
+            appleSteps.append(game.steps - lastApple)
+            lastApple = game.steps
+            if game.apple is None:
+                cause = "won"
+                break
+        elif game.steps - lastApple >= starve:
+            cause = "starved"
+            break
+    if recorder:
+        if result != sim.Simulation.DIED:
+            recorder.end()
+        recorder.close()
+
+    return {
+        "strategy": name,
+        "seed": seed,
+        "score": game.score,
+        "length": len(game.body),
+        "steps": game.steps,
+        "appleSteps": appleSteps,
+        "cause": cause,
+        "cols": cols,
+        "rows": rows,
+        "seconds": time.time() - start,
+        "recording": recorder and recorder.file.name,
+    }
+
+
+# where the game of strategy with seed is recorded in directory
+def recordingPath(directory, name, seed):
+    return os.path.join(directory, "%s-%d.snk" % (name.replace(":", "."), seed))
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+class Standings:
+    """running totals per strategy, fed one game result at a time"""
+    def __init__(self):
+        self.results = {}
+
+    def add(self, result):
+        self.results.setdefault(result["strategy"], []).append(result)
+
+    def summary(self):
+        summary = {}
+        for name, results in self.results.items():
+            scores = [r["score"] for r in results]
+            appleSteps = [s for r in results for s in r["appleSteps"]]
+            causes = {}
+            for r in results:
+                causes[r["cause"]] = causes.get(r["cause"], 0) + 1
+            summary[name] = {
+                "games": len(results),
+                "score": {
+                    "mean": float(sum(scores)) / len(scores),
+                    "p10": percentile(scores, 10),
+                    "p50": percentile(scores, 50),
+                    "p90": percentile(scores, 90),
+                    "max": max(scores),
+                },
+                "length": float(sum(r["length"] for r in results)) / len(results),
+                "stepsToApple": {
+                    "mean": float(sum(appleSteps)) / len(appleSteps) if appleSteps else 0,
+                    "p50": percentile(appleSteps, 50),
+                    "p90": percentile(appleSteps, 90),
+                },
+                "causes": causes,
+            }
+        return summary
+
+    def report(self):
+        lines = ["%-20s %6s %8s %5s %5s %5s %8s %10s  %s" % ("strategy", "games", "score", "p10", "p50", "p90", "length", "to apple", "deaths")]
+        for name, s in sorted(self.summary().items()):
+            causes = ", ".join("%s %d" % item for item in sorted(s["causes"].items()))
+            lines.append("%-20s %6d %8.2f %5d %5d %5d %8.2f %10.2f  %s" % (name, s["games"], s["score"]["mean"],
+                s["score"]["p10"], s["score"]["p50"], s["score"]["p90"], s["length"], s["stepsToApple"]["mean"], causes))
+        return "\n".join(lines)
+
+
+# store is a scores.ScoreStore to record every result in
+# record is a directory every game is recorded to, see recordingPath
+def run(strategies, games, cols, rows, seed=0, jobs=None, out=None, progress=None, store=None, record=None):
+    for name in strategies:
+        loadStrategy(name)
+    if record and not os.path.isdir(record):
+        os.makedirs(record)
+    tasks = [(name, seed + i, cols, rows, record) for i in range(games) for name in strategies]
+
+    standings = Standings()
+    pool = multiprocessing.Pool(jobs)
+    try:
+        chunksize = max(1, len(tasks) // (8 * (jobs or multiprocessing.cpu_count())))
+        for i, result in enumerate(pool.imap_unordered(playGame, tasks, chunksize)):
+            standings.add(result)
+            if out:
+                out.write(json.dumps(result) + "\n")
+            if store:
+                store.record(result["score"], result["length"], result["strategy"], result["steps"], result["seconds"],
+                             result["seed"], result["cols"], result["rows"], result["cause"])
+            if progress:
+                progress(i + 1, len(tasks))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return standings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run seeded self play tournaments between snake strategies")
+    parser.add_argument("-s", "--strategy", action="append", dest="strategies",
+                        help="strategy to enter: %s or module:function (repeatable)" % ", ".join(sorted(STRATEGIES)))
+    parser.add_argument("-n", "--games", type=int, default=100, help="games per strategy")
+    parser.add_argument("--size", type=int, default=25, help="board width and height in tiles")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes, defaults to all cores")
+    parser.add_argument("-o", "--out", help="write every game result to this file as JSON lines")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--scores", nargs="?", const=scores.DB_PATH, metavar="PATH",
+                        help="record every result in the scores database (default %s)" % scores.DB_PATH)
+    parser.add_argument("--record", metavar="DIR", help="record every game to DIR/STRATEGY-SEED.snk, see replay.py")
+    args = parser.parse_args(argv)
+
+    strategies = args.strategies or sorted(STRATEGIES)
+    out = open(args.out, "w") if args.out else None
+    store = scores.ScoreStore(args.scores) if args.scores else None
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            sys.stderr.write("\r%d/%d games" % (done, total))
+            if done == total:
+                sys.stderr.write("\n")
+
+    start = time.time()
+    try:
+        standings = run(strategies, args.games, args.size, args.size, args.seed, args.jobs, out, progress, store, args.record)
+    finally:
+        if out:
+            out.close()
+        if store:
+            store.close()
+
+    if args.json:
+        print json.dumps(standings.summary(), indent=2, sort_keys=True)
+    else:
+        print standings.report()
+        print "%.1f seconds" % (time.time() - start)
+
+
+if __name__ == "__main__":
+    main()